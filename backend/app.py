@@ -1,18 +1,52 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, File, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
 import os
 import asyncio
+import itertools
+from contextlib import asynccontextmanager
 
-from db.models import get_db, Passenger, Invoice
-from services.downloader import InvoiceDownloader
-from services.parser import InvoiceParser
+import config
+from db import migrations
+from db.models import get_db, engine, async_engine, AsyncSessionLocal, Passenger, Invoice
+from services.jobs import JobManager
+from services import events, executor, metrics, pipeline, rules, search, storage, summary, task_queue
+from services.bulk import upsert_invoices, insert_new_passengers
+from services.csv_import import CsvImportError, import_passengers
+from services.export import FORMATS as EXPORT_FORMATS, ExportError, export_invoices
+from services.archive import zip_invoices
+from services.pipeline import PipelineError, downloader, parser, review_invoice, emit_invoice
+from services.purge import PurgeError, PurgeManager, PurgeScope
+from services.serializers import InvoiceResponse, to_invoice_response, to_pdf_url_path
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
-app = FastAPI(title="Airline Invoice Workflow API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	# Bring older databases up to the current schema before serving requests
+	migrations.upgrade(engine)
+	# Consume the durable download/parse queue; tasks left running by a previous
+	# process are picked up again once their leases expire
+	queue_worker.start()
+	yield
+	await queue_worker.stop()
+	# Fail renders still waiting on a batch before their worker processes go away
+	await downloader.renderer.close()
+	# Stop the CPU worker processes used for PDF rendering/extraction
+	executor.shutdown()
+	# Close pooled connections (aiosqlite runs a thread per connection)
+	await async_engine.dispose()
+
+app = FastAPI(title="Airline Invoice Workflow API", version="1.0.0", lifespan=lifespan)
+
+# Per-route latency, status and DB query counts for /metrics
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -21,30 +55,75 @@ app.add_middleware(
 	allow_credentials=True,
 	allow_methods=["*"],
 	allow_headers=["*"],
+	expose_headers=["X-Next-Cursor"],
 )
 
-# Mount static files for PDF access
-invoices_dir = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "invoices"))
+# PDF storage directory; the /invoices static mount is registered at the end of
+# this module so it does not shadow the /invoices/... API routes
+invoices_dir = config.INVOICES_DIR
 os.makedirs(invoices_dir, exist_ok=True)
-app.mount("/invoices", StaticFiles(directory=invoices_dir), name="invoices")
 
-# Helper to expose URL path for a stored PDF file
-def to_pdf_url_path(pdf_fs_path: Optional[str]) -> Optional[str]:
-	if not pdf_fs_path:
-		return None
-	filename = os.path.basename(pdf_fs_path)
-	return f"/invoices/{filename}"
+# Listing pagination
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
 
 @app.get("/debug/invoices-dir")
-async def debug_invoices_dir():
+async def debug_invoices_dir(cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+	"""Page through stored PDF paths in order; pass `next_cursor` back as `cursor` for the next page"""
+	def page():
+		return list(itertools.islice(storage.iter_files(invoices_dir, cursor), limit + 1))
 	try:
-		files = []
-		if os.path.isdir(invoices_dir):
-			files = sorted(os.listdir(invoices_dir))
-		return {"invoices_dir": invoices_dir, "files": files}
+		files = await asyncio.to_thread(page)
+		next_cursor = files[limit - 1] if len(files) > limit else None
+		return {"invoices_dir": invoices_dir, "files": files[:limit], "next_cursor": next_cursor}
 	except Exception as e:
 		return {"invoices_dir": invoices_dir, "error": str(e)}
 
+@app.get("/events")
+async def stream_events():
+	"""Server-sent events with per-PNR status deltas, invoice changes and summary updates for dashboards"""
+	async def stream():
+		subscription = events.broadcaster.subscribe()
+		try:
+			yield "retry: 3000\n\n"
+			while True:
+				message = await subscription.next(timeout=config.EVENTS_HEARTBEAT_SECONDS)
+				# A comment line keeps idle connections (and proxies) open
+				yield ": keep-alive\n\n" if message is None else events.format_sse(message)
+		finally:
+			events.broadcaster.unsubscribe(subscription)
+	return StreamingResponse(stream(), media_type="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/metrics")
+async def get_metrics(db: AsyncSession = Depends(get_db)):
+	"""Prometheus metrics for this process; queue depths are read at scrape time"""
+	counts = await db.run_sync(task_queue.stats)
+	metrics.QUEUE_TASKS.replace({(kind, state): n for kind, states in counts.items() for state, n in states.items()})
+	active = [job for job in jobs.jobs.values() if job.status != "Completed"]
+	metrics.JOBS_ACTIVE.set(len(active))
+	metrics.JOB_PNRS_PENDING.set(sum(len(job.pnrs) - job.completed for job in active))
+	cache = parser.cache.stats()
+	metrics.PARSE_CACHE.replace({("hit",): cache["hits"], ("miss",): cache["misses"]})
+	metrics.EVENT_SUBSCRIBERS.set(events.broadcaster.subscribers)
+	return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/profiler")
+async def get_profiler():
+	return metrics.profiler.status()
+
+@app.post("/debug/profiler")
+async def set_profiler(sample_rate: float = Query(..., ge=0, le=1)):
+	"""Profile this fraction of requests (0 turns profiling off); dumps go to PROFILE_DIR"""
+	metrics.profiler.sample_rate = sample_rate
+	return metrics.profiler.status()
+
+@app.post("/storage/gc")
+async def collect_storage_garbage(grace_seconds: int = Query(config.STORAGE_GC_GRACE_SECONDS, ge=0)):
+	"""Delete stored PDFs that no invoice references and are older than `grace_seconds`"""
+	return await asyncio.to_thread(storage.collect_garbage, invoices_dir, grace_seconds)
+
 # Pydantic models
 class PassengerData(BaseModel):
 	name: str
@@ -59,17 +138,9 @@ class SeedInvoiceItem(BaseModel):
 	GSTIN: Optional[str] = None
 	Name: Optional[str] = None
 
-class InvoiceResponse(BaseModel):
-	id: int
-	pnr: str
-	invoice_number: Optional[str]
-	invoice_date: Optional[str]
-	airline: Optional[str]
-	amount: Optional[float]
-	gstin: Optional[str]
-	pdf_path: Optional[str]
-	flag_for_review: bool
-	created_at: str
+class InvoiceSearchResult(InvoiceResponse):
+	score: float
+	snippet: Optional[str] = None
 
 class PassengerResponse(BaseModel):
 	id: int
@@ -83,25 +154,55 @@ class SummaryResponse(BaseModel):
 	airline: str
 	total_amount: float
 	invoice_count: int
+	min_amount: Optional[float] = None
+	max_amount: Optional[float] = None
+	flagged_count: int = 0
+
+class BatchJobRequest(BaseModel):
+	pnrs: List[str]
+	download: bool = True
+	parse: bool = True
+	concurrency: Optional[int] = None
+
+class QueueRequest(BaseModel):
+	pnrs: List[str]
+	download: bool = True
+	parse: bool = True
+
+class ArchiveRequest(BaseModel):
+	pnrs: Optional[List[str]] = None
+	airline: Optional[str] = None
+	date_from: Optional[date] = None
+	date_to: Optional[date] = None
+	flag_for_review: Optional[bool] = None
+
+class PurgeRequest(BaseModel):
+	everything: bool = False
+	airline: Optional[str] = None
+	date_from: Optional[date] = None
+	date_to: Optional[date] = None
+	pnrs: Optional[List[str]] = None
 
 # Initialize services
-downloader = InvoiceDownloader()
-parser = InvoiceParser()
+jobs = JobManager()
+purges = PurgeManager(downloader.metadata, invoices_dir)
+rescorer = rules.Rescorer()
 
 @app.get("/")
 async def root():
 	return {"message": "Airline Invoice Workflow API"}
 
 @app.post("/invoices/seed")
-async def seed_invoices(items: List[SeedInvoiceItem], db: Session = Depends(get_db)):
+async def seed_invoices(items: List[SeedInvoiceItem], db: AsyncSession = Depends(get_db)):
 	"""Upsert invoice metadata exactly as provided, keyed by invoice number (PNR)."""
-	upserted = 0
+	rows = {}
+	metadata = {}
 	for item in items:
 		pnr = (item.Invoice_Number or item.invoice_number)
 		if not pnr:
 			continue
-		# cache for downloader to use when generating PDFs
-		downloader.metadata_store[pnr] = {
+		# stored for the downloader to use when generating PDFs
+		metadata[pnr] = {
 			"Invoice Number": item.Invoice_Number or item.invoice_number,
 			"Date": item.Date,
 			"Airline": item.Airline,
@@ -109,222 +210,381 @@ async def seed_invoices(items: List[SeedInvoiceItem], db: Session = Depends(get_
 			"GSTIN": item.GSTIN,
 			"Name": item.Name,
 		}
-		inv = db.query(Invoice).filter(Invoice.pnr == pnr).first()
-		if not inv:
-			inv = Invoice(pnr=pnr)
-			db.add(inv)
-		# Set fields exactly if present
+		# Set fields exactly if present; later items for the same PNR win
+		fields = rows.setdefault(pnr, {})
 		if item.Invoice_Number or item.invoice_number:
-			inv.invoice_number = item.Invoice_Number or item.invoice_number
+			fields["invoice_number"] = item.Invoice_Number or item.invoice_number
 		if item.Date:
 			try:
-				inv.invoice_date = datetime.strptime(item.Date, "%Y-%m-%d")
-			except:
+				fields["invoice_date"] = datetime.strptime(item.Date, "%Y-%m-%d")
+			except ValueError:
 				pass
 		if item.Airline:
-			inv.airline = item.Airline
+			fields["airline"] = item.Airline
 		if item.Amount is not None:
-			inv.amount = float(item.Amount)
+			fields["amount"] = float(item.Amount)
 		if item.GSTIN:
-			inv.gstin = item.GSTIN
-		upserted += 1
+			fields["gstin"] = item.GSTIN
+		if item.Name:
+			fields["passenger_name"] = item.Name
 	
-	db.commit()
-	return {"message": f"Seeded {upserted} invoices"}
+	# One chunked IN lookup plus executemany inserts/updates in a single transaction
+	await db.run_sync(upsert_invoices, rows)
+	await db.run_sync(rules.evaluate_pnrs, list(rows))
+	await db.run_sync(downloader.metadata.put_many, metadata)
+	events.emit(db, "resync", {"lists": ["invoices"]})
+	await db.commit()
+	downloader.metadata.forget(metadata)
+	return {"message": f"Seeded {len(rows)} invoices"}
 
 # Backwards-compatible alias
 @app.post("/seed")
-async def seed_alias(items: List[SeedInvoiceItem], db: Session = Depends(get_db)):
+async def seed_alias(items: List[SeedInvoiceItem], db: AsyncSession = Depends(get_db)):
 	return await seed_invoices(items, db)
 
+def to_passenger_response(p: Passenger) -> PassengerResponse:
+	return PassengerResponse(
+		id=p.id,
+		name=p.name,
+		pnr=p.pnr,
+		download_status=p.download_status,
+		parse_status=p.parse_status,
+		created_at=p.created_at.isoformat()
+	)
+
+def filter_invoices(query, airline: Optional[str] = None, date_from: Optional[date] = None, date_to: Optional[date] = None,
+		flag_for_review: Optional[bool] = None, status: Optional[str] = None, review_reason: Optional[str] = None):
+	"""Apply the listing filters; `status` matches the passenger's parse status, `review_reason` a
+	review rule name the invoice matched, and date_to is inclusive"""
+	if airline:
+		query = query.where(Invoice.airline == airline)
+	if date_from:
+		query = query.where(Invoice.invoice_date >= datetime.combine(date_from, datetime.min.time()))
+	if date_to:
+		query = query.where(Invoice.invoice_date < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+	if flag_for_review is not None:
+		query = query.where(Invoice.flag_for_review == flag_for_review)
+	if review_reason:
+		sep = rules.SEPARATOR
+		# The IS NOT NULL term lets the partial ix_invoices_review_reasons index serve this
+		query = query.where(Invoice.review_reasons.isnot(None),
+			(sep + Invoice.review_reasons + sep).contains(sep + review_reason + sep))
+	if status:
+		query = query.join(Passenger, Passenger.pnr == Invoice.pnr).where(Passenger.parse_status == status)
+	return query
+
+def filter_passengers(query, download_status: Optional[str] = None, parse_status: Optional[str] = None,
+		date_from: Optional[date] = None, date_to: Optional[date] = None):
+	"""Apply the listing filters; the date range is on created_at and date_to is inclusive"""
+	if download_status:
+		query = query.where(Passenger.download_status == download_status)
+	if parse_status:
+		query = query.where(Passenger.parse_status == parse_status)
+	if date_from:
+		query = query.where(Passenger.created_at >= datetime.combine(date_from, datetime.min.time()))
+	if date_to:
+		query = query.where(Passenger.created_at < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+	return query
+
+def keyset_query(query, model, cursor: Optional[int], limit: int):
+	"""Up to `limit` + 1 rows ordered by id after `cursor`; the extra row tells whether more follow"""
+	if cursor is not None:
+		query = query.where(model.id > cursor)
+	return query.order_by(model.id).limit(limit + 1)
+
+async def keyset_page(db: AsyncSession, query, model, response: Response, cursor: Optional[int], limit: int):
+	"""Return one page ordered by id after `cursor`; sets X-Next-Cursor when more rows follow"""
+	rows = (await db.scalars(keyset_query(query, model, cursor, limit))).all()
+	if len(rows) > limit:
+		rows = rows[:limit]
+		response.headers["X-Next-Cursor"] = str(rows[-1].id)
+	return rows
+
+async def ndjson_stream(query, serialize):
+	"""Yield one JSON line per row, fetching from a server-side cursor in batches"""
+	async with AsyncSessionLocal() as session:
+		rows = await session.stream_scalars(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+		async for row in rows:
+			yield serialize(row).model_dump_json() + "\n"
+
 @app.get("/invoices", response_model=List[InvoiceResponse])
-async def get_invoices(db: Session = Depends(get_db)):
-	"""Get all invoices with their statuses"""
-	invoices = db.query(Invoice).all()
+async def get_invoices(
+	response: Response,
+	cursor: Optional[int] = None,
+	limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+	airline: Optional[str] = None,
+	date_from: Optional[date] = None,
+	date_to: Optional[date] = None,
+	flag_for_review: Optional[bool] = None,
+	status: Optional[str] = None,
+	review_reason: Optional[str] = None,
+	db: AsyncSession = Depends(get_db)
+):
+	"""Get a page of invoices with their statuses; pass X-Next-Cursor back as `cursor` for the next page"""
+	query = filter_invoices(select(Invoice), airline, date_from, date_to, flag_for_review, status, review_reason)
+	invoices = await keyset_page(db, query, Invoice, response, cursor, limit)
+	return [to_invoice_response(inv) for inv in invoices]
+
+@app.get("/invoices/search", response_model=List[InvoiceSearchResult])
+async def search_invoices(
+	response: Response,
+	q: str = Query(..., min_length=1, max_length=500),
+	sort: str = Query("rank", description="rank (best match first) or recent (newest first)"),
+	cursor: Optional[int] = Query(None, ge=0),
+	limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+	airline: Optional[str] = None,
+	date_from: Optional[date] = None,
+	date_to: Optional[date] = None,
+	flag_for_review: Optional[bool] = None,
+	db: AsyncSession = Depends(get_db)
+):
+	"""Full-text search over PNR, invoice number, airline, GSTIN and PDF text; every word must match as a prefix.
+
+	Here the cursor is an offset into the ranked results; pass X-Next-Cursor back for the next page.
+	"""
+	if not search.supported(async_engine):
+		raise HTTPException(status_code=501, detail="Invoice search requires SQLite (FTS5)")
+	try:
+		query = filter_invoices(search.search_query(q, sort), airline, date_from, date_to, flag_for_review)
+	except search.SearchError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	offset = cursor or 0
+	page = (await db.execute(query.offset(offset).limit(limit + 1))).all()
+	if len(page) > limit:
+		page = page[:limit]
+		response.headers["X-Next-Cursor"] = str(offset + limit)
+	hits = await db.run_sync(search.load_hits, q, page)
+	# bm25 scores are negative; report them so that higher is better
 	return [
-		InvoiceResponse(
-			id=inv.id,
-			pnr=inv.pnr,
-			invoice_number=inv.invoice_number,
-			invoice_date=inv.invoice_date.isoformat() if inv.invoice_date else None,
-			airline=inv.airline,
-			amount=inv.amount,
-			gstin=inv.gstin,
-			pdf_path=to_pdf_url_path(inv.pdf_path),
-			flag_for_review=inv.flag_for_review,
-			created_at=inv.created_at.isoformat()
-		)
-		for inv in invoices
+		InvoiceSearchResult(**to_invoice_response(inv).model_dump(), score=-score, snippet=snippet)
+		for inv, score, snippet in hits
 	]
 
+@app.get("/invoices/stream")
+async def stream_invoices(
+	airline: Optional[str] = None,
+	date_from: Optional[date] = None,
+	date_to: Optional[date] = None,
+	flag_for_review: Optional[bool] = None,
+	status: Optional[str] = None
+):
+	"""Stream all matching invoices as NDJSON without materializing the result"""
+	query = filter_invoices(select(Invoice), airline, date_from, date_to, flag_for_review, status)
+	return StreamingResponse(ndjson_stream(query.order_by(Invoice.id), to_invoice_response), media_type="application/x-ndjson")
+
+@app.get("/export/invoices")
+async def export_invoices_file(
+	format: str = "csv",
+	airline: Optional[str] = None,
+	date_from: Optional[date] = None,
+	date_to: Optional[date] = None,
+	flag_for_review: Optional[bool] = None,
+	status: Optional[str] = None,
+	include_raw_text: bool = False,
+	batch_size: int = Query(config.EXPORT_BATCH_SIZE, ge=100, le=100000)
+):
+	"""Download matching invoices as CSV or Parquet, streamed from the database in chunks"""
+	query = filter_invoices(select(Invoice), airline, date_from, date_to, flag_for_review, status)
+	try:
+		chunks = export_invoices(query, format, include_raw_text, batch_size)
+	except ExportError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	media_type, extension = EXPORT_FORMATS[format]
+	filename = f"invoices-{datetime.utcnow():%Y%m%d-%H%M%S}.{extension}"
+	return StreamingResponse(chunks, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+def invoice_archive_response(request: ArchiveRequest):
+	query = filter_invoices(select(Invoice), request.airline, request.date_from, request.date_to, request.flag_for_review)
+	filename = f"invoices-{datetime.utcnow():%Y%m%d-%H%M%S}.zip"
+	return StreamingResponse(zip_invoices(query, request.pnrs), media_type="application/zip",
+		headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/invoices/archive")
+async def download_invoice_archive(
+	pnr: Optional[List[str]] = Query(None),
+	airline: Optional[str] = None,
+	date_from: Optional[date] = None,
+	date_to: Optional[date] = None,
+	flag_for_review: Optional[bool] = None
+):
+	"""ZIP of the matching invoice PDFs (repeat `pnr` to pick PNRs), built while it streams"""
+	return invoice_archive_response(ArchiveRequest(pnrs=pnr, airline=airline, date_from=date_from, date_to=date_to, flag_for_review=flag_for_review))
+
+@app.post("/invoices/archive")
+async def download_invoice_archive_for(request: ArchiveRequest):
+	"""Same as GET /invoices/archive, for PNR lists too long for a URL"""
+	return invoice_archive_response(request)
+
 @app.get("/passengers", response_model=List[PassengerResponse])
-async def get_passengers(db: Session = Depends(get_db)):
-	"""Get all passengers with their statuses"""
-	passengers = db.query(Passenger).all()
-	return [
-		PassengerResponse(
-			id=p.id,
-			name=p.name,
-			pnr=p.pnr,
-			download_status=p.download_status,
-			parse_status=p.parse_status,
-			created_at=p.created_at.isoformat()
-		)
-		for p in passengers
-	]
+async def get_passengers(
+	response: Response,
+	cursor: Optional[int] = None,
+	limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+	download_status: Optional[str] = None,
+	parse_status: Optional[str] = None,
+	date_from: Optional[date] = None,
+	date_to: Optional[date] = None,
+	db: AsyncSession = Depends(get_db)
+):
+	"""Get a page of passengers with their statuses; pass X-Next-Cursor back as `cursor` for the next page"""
+	query = filter_passengers(select(Passenger), download_status, parse_status, date_from, date_to)
+	passengers = await keyset_page(db, query, Passenger, response, cursor, limit)
+	return [to_passenger_response(p) for p in passengers]
+
+@app.get("/passengers/stream")
+async def stream_passengers(
+	download_status: Optional[str] = None,
+	parse_status: Optional[str] = None,
+	date_from: Optional[date] = None,
+	date_to: Optional[date] = None
+):
+	"""Stream all matching passengers as NDJSON without materializing the result"""
+	query = filter_passengers(select(Passenger), download_status, parse_status, date_from, date_to)
+	return StreamingResponse(ndjson_stream(query.order_by(Passenger.id), to_passenger_response), media_type="application/x-ndjson")
 
 @app.get("/summary", response_model=List[SummaryResponse])
-async def get_summary(db: Session = Depends(get_db)):
-	"""Get airline-wise summary"""
-	from sqlalchemy import func
-	
-	summary = db.query(
-		Invoice.airline,
-		func.sum(Invoice.amount).label('total_amount'),
-		func.count(Invoice.id).label('invoice_count')
-	).filter(
-		Invoice.airline.isnot(None),
-		Invoice.amount.isnot(None)
-	).group_by(Invoice.airline).all()
-	
+async def get_summary(db: AsyncSession = Depends(get_db)):
+	"""Get airline-wise summary from the incrementally maintained airline_summary table"""
+	rows = (await db.scalars(summary.listing_query())).all()
 	return [
 		SummaryResponse(
 			airline=row.airline,
 			total_amount=float(row.total_amount),
-			invoice_count=row.invoice_count
+			invoice_count=row.invoice_count,
+			min_amount=row.min_amount,
+			max_amount=row.max_amount,
+			flagged_count=row.flagged_count
 		)
-		for row in summary
+		for row in rows
 	]
 
+@app.post("/summary/rebuild")
+async def rebuild_summary(db: AsyncSession = Depends(get_db)):
+	"""Recompute the airline summary from the invoices table, e.g. after drift"""
+	count = await db.run_sync(summary.rebuild)
+	await db.commit()
+	return {"message": f"Rebuilt summary for {count} airlines"}
+
+async def run_download(pnr: str, db: AsyncSession) -> dict:
+	"""Download the invoice for a PNR and record the result; shared by the API and batch jobs"""
+	try:
+		result = await pipeline.run_download(pnr, db)
+	except PipelineError as e:
+		raise HTTPException(status_code=e.status_code, detail=str(e))
+	result["pdf_path"] = to_pdf_url_path(result["pdf_path"])
+	return result
+
+async def run_parse(pnr: str, db: AsyncSession) -> dict:
+	"""Parse the downloaded invoice for a PNR and store the fields; shared by the API and batch jobs"""
+	try:
+		return await pipeline.run_parse(pnr, db)
+	except PipelineError as e:
+		raise HTTPException(status_code=e.status_code, detail=str(e))
+
 @app.post("/download/{pnr}")
-async def download_invoice(pnr: str, db: Session = Depends(get_db)):
+async def download_invoice(pnr: str, db: AsyncSession = Depends(get_db)):
 	"""Trigger invoice download for a specific PNR"""
-	# Find passenger
-	passenger = db.query(Passenger).filter(Passenger.pnr == pnr).first()
-	if not passenger:
-		raise HTTPException(status_code=404, detail=f"Passenger with PNR {pnr} not found")
-	
-	# Update status to pending
-	passenger.download_status = "Pending"
-	db.commit()
-	
-	# Download invoice
-	result = await downloader.download_invoice(pnr, passenger.name)
-	
-	# Update passenger status
-	passenger.download_status = result["status"]
-	db.commit()
-	
-	# If download successful, create invoice record
-	url_path = None
-	if result["status"] == "Success" and result["pdf_path"]:
-		# Check if invoice already exists
-		existing_invoice = db.query(Invoice).filter(Invoice.pnr == pnr).first()
-		if not existing_invoice:
-			invoice = Invoice(
-				pnr=pnr,
-				pdf_path=result["pdf_path"]
-			)
-			db.add(invoice)
-			db.commit()
-			url_path = to_pdf_url_path(result["pdf_path"])
-		else:
-			# Update existing invoice path to latest generated PDF
-			existing_invoice.pdf_path = result["pdf_path"]
-			db.commit()
-			url_path = to_pdf_url_path(existing_invoice.pdf_path)
-	
-	return {
-		"pnr": pnr,
-		"status": result["status"],
-		"message": result["message"],
-		"pdf_path": url_path
-	}
+	return await run_download(pnr, db)
 
 @app.post("/parse/{pnr}")
-async def parse_invoice(pnr: str, db: Session = Depends(get_db)):
+async def parse_invoice(pnr: str, db: AsyncSession = Depends(get_db)):
 	"""Parse invoice for a specific PNR"""
-	passenger = db.query(Passenger).filter(Passenger.pnr == pnr).first()
-	if not passenger:
-		raise HTTPException(status_code=404, detail=f"Passenger with PNR {pnr} not found")
-	if passenger.download_status != "Success":
-		raise HTTPException(status_code=400, detail="Invoice must be downloaded successfully before parsing")
-	invoice = db.query(Invoice).filter(Invoice.pnr == pnr).first()
-	if not invoice or not invoice.pdf_path:
-		raise HTTPException(status_code=404, detail=f"Invoice PDF not found for PNR {pnr}")
-	
-	# If DB already has seeded metadata (airline/amount/invoice_number/date), prefer it
-	if invoice.invoice_number or invoice.airline or invoice.amount or invoice.invoice_date:
-		passenger.parse_status = "Success"
-		db.commit()
-		return {"pnr": pnr, "status": "Success", "message": "Used seeded invoice metadata", "data": {
-			"invoice_number": invoice.invoice_number,
-			"invoice_date": invoice.invoice_date,
-			"airline": invoice.airline,
-			"amount": invoice.amount,
-			"gstin": invoice.gstin
-		}}
-	
-	# Otherwise parse the PDF
-	passenger.parse_status = "Pending"
-	db.commit()
-	result = await parser.parse_invoice(pnr, invoice.pdf_path)
-	passenger.parse_status = result["status"]
-	db.commit()
-	if result["status"] == "Success" and result["data"]:
-		data = result["data"]
-		invoice.invoice_number = data["invoice_number"]
-		invoice.invoice_date = data["invoice_date"]
-		invoice.airline = data["airline"]
-		invoice.amount = data["amount"]
-		invoice.gstin = data["gstin"]
-		invoice.raw_text = result["raw_text"]
-		db.commit()
-	return {"pnr": pnr, "status": result["status"], "message": result["message"], "data": result["data"]}
+	return await run_parse(pnr, db)
+
+async def _process_pnr(pnr: str, download: bool, parse: bool) -> dict:
+	"""Run download and/or parse for one PNR of a batch job in its own session"""
+	async with AsyncSessionLocal() as db:
+		try:
+			result = {"pnr": pnr, "status": "Success"}
+			if download:
+				dl = await run_download(pnr, db)
+				result["download"] = dl
+				if dl["status"] != "Success":
+					result["status"] = dl["status"]
+					return result
+			if parse:
+				ps = await run_parse(pnr, db)
+				result["parse"] = ps
+				result["status"] = ps["status"]
+			return result
+		except HTTPException as e:
+			return {"pnr": pnr, "status": "Error", "message": e.detail}
+
+@app.post("/jobs/batch", status_code=202)
+async def create_batch_job(request: BatchJobRequest):
+	"""Start a background job that downloads and parses many PNRs through a bounded worker pool"""
+	if not request.pnrs:
+		raise HTTPException(status_code=400, detail="pnrs must be a non-empty list")
+	job = jobs.submit(
+		request.pnrs,
+		lambda pnr: _process_pnr(pnr, request.download, request.parse),
+		concurrency=request.concurrency,
+	)
+	return job.to_dict(include_results=False)
+
+@app.get("/jobs/{job_id}")
+async def get_batch_job(job_id: str, include_results: bool = True):
+	"""Poll progress and per-PNR results of a batch job"""
+	job = jobs.get(job_id)
+	if not job:
+		raise HTTPException(status_code=404, detail="Job not found")
+	return job.to_dict(include_results=include_results)
+
+queue_worker = task_queue.TaskWorker(pipeline.queue_handlers)
+
+@app.post("/queue/tasks", status_code=202)
+async def enqueue_tasks(request: QueueRequest, db: AsyncSession = Depends(get_db)):
+	"""Queue durable download and/or parse tasks; passenger statuses follow the queue"""
+	if not request.pnrs or not (request.download or request.parse):
+		raise HTTPException(status_code=400, detail="pnrs must be non-empty and download or parse requested")
+	if request.download:
+		counts = await db.run_sync(task_queue.enqueue, "download", request.pnrs, "parse" if request.parse else None)
+	else:
+		counts = await db.run_sync(task_queue.enqueue, "parse", request.pnrs)
+	await db.commit()
+	queue_worker.wake()
+	return counts
+
+@app.get("/queue/stats")
+async def get_queue_stats(db: AsyncSession = Depends(get_db)):
+	"""Task counts per kind and state"""
+	return await db.run_sync(task_queue.stats)
+
+@app.get("/queue/dead")
+async def get_dead_letters(limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+	"""Most recently dead-lettered tasks with their last error"""
+	return await db.run_sync(task_queue.dead_letters, limit)
+
+@app.post("/queue/dead/retry")
+async def retry_dead_letters(kind: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+	"""Requeue dead-lettered tasks (optionally only one kind) with fresh attempts"""
+	count = await db.run_sync(task_queue.requeue_dead, kind)
+	await db.commit()
+	queue_worker.wake()
+	return {"message": f"Requeued {count} tasks", "requeued": count}
+
+def high_value_query(amount: float):
+	return select(Invoice).where(Invoice.amount >= amount, Invoice.amount.isnot(None))
 
 @app.get("/invoices/high-value")
-async def get_high_value_invoices(amount: float = 10000, db: Session = Depends(get_db)):
+async def get_high_value_invoices(amount: float = 10000, db: AsyncSession = Depends(get_db)):
 	"""Get invoices above a certain amount threshold"""
-	invoices = db.query(Invoice).filter(
-		Invoice.amount >= amount,
-		Invoice.amount.isnot(None)
-	).all()
+	invoices = (await db.scalars(high_value_query(amount))).all()
 	
-	return [
-		InvoiceResponse(
-			id=inv.id,
-			pnr=inv.pnr,
-			invoice_number=inv.invoice_number,
-			invoice_date=inv.invoice_date.isoformat() if inv.invoice_date else None,
-			airline=inv.airline,
-			amount=inv.amount,
-			gstin=inv.gstin,
-			pdf_path=to_pdf_url_path(inv.pdf_path),
-			flag_for_review=inv.flag_for_review,
-			created_at=inv.created_at.isoformat()
-		)
-		for inv in invoices
-	]
+	return [to_invoice_response(inv) for inv in invoices]
 
 @app.post("/passengers/bulk")
-async def create_passengers(passengers: List[PassengerData], db: Session = Depends(get_db)):
+async def create_passengers(passengers: List[PassengerData], db: AsyncSession = Depends(get_db)):
 	"""Create multiple passengers from JSON data"""
-	created_passengers = []
-	
+	# First occurrence of a PNR in the payload wins
+	rows = {}
 	for passenger_data in passengers:
-		# Check if passenger already exists
-		existing = db.query(Passenger).filter(Passenger.pnr == passenger_data.pnr).first()
-		if existing:
-			continue
-		
-		passenger = Passenger(
-			name=passenger_data.name,
-			pnr=passenger_data.pnr
-		)
-		db.add(passenger)
-		created_passengers.append(passenger)
+		rows.setdefault(passenger_data.pnr, passenger_data.name)
 	
-	db.commit()
+	created_passengers = await db.run_sync(insert_new_passengers, rows)
+	if created_passengers:
+		events.emit(db, "passengers_created", {"count": len(created_passengers)})
+	await db.commit()
 	
 	return {
 		"message": f"Created {len(created_passengers)} new passengers",
@@ -340,30 +600,84 @@ async def create_passengers(passengers: List[PassengerData], db: Session = Depen
 		]
 	}
 
+@app.post("/passengers/import-csv")
+async def import_passengers_csv(
+	file: UploadFile = File(...),
+	batch_size: int = Query(config.CSV_IMPORT_BATCH_SIZE, ge=1, le=10000),
+	db: AsyncSession = Depends(get_db),
+):
+	"""Create passengers from a CSV upload ("Ticket Number,First Name,Last Name"), streamed and committed in batches"""
+	try:
+		report = await import_passengers(db, file, batch_size)
+	except CsvImportError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	return report.to_dict()
+
 @app.put("/invoices/{invoice_id}/flag")
-async def flag_invoice_for_review(invoice_id: int, flag: bool, db: Session = Depends(get_db)):
-	"""Flag an invoice for review"""
-	invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+async def flag_invoice_for_review(invoice_id: int, flag: bool, db: AsyncSession = Depends(get_db)):
+	"""Flag an invoice for review by hand; review rules no longer change its flag"""
+	invoice = await db.get(Invoice, invoice_id)
 	if not invoice:
 		raise HTTPException(status_code=404, detail="Invoice not found")
 	
+	before = summary.invoice_contribution(invoice)
 	invoice.flag_for_review = flag
-	db.commit()
+	invoice.flag_source = rules.MANUAL
+	await db.run_sync(summary.apply_changes, [(before, summary.invoice_contribution(invoice))])
+	emit_invoice(db, invoice)
+	await db.commit()
 	
 	return {"message": f"Invoice {invoice_id} {'flagged' if flag else 'unflagged'} for review"}
 
+@app.delete("/invoices/{invoice_id}/flag")
+async def release_invoice_flag(invoice_id: int, db: AsyncSession = Depends(get_db)):
+	"""Drop a manual flag and let the review rules decide it again"""
+	invoice = await db.get(Invoice, invoice_id)
+	if not invoice:
+		raise HTTPException(status_code=404, detail="Invoice not found")
+	invoice.flag_source = None
+	await review_invoice(db, invoice)
+	emit_invoice(db, invoice)
+	await db.commit()
+	return to_invoice_response(invoice)
+
+@app.get("/rules")
+async def get_review_rules():
+	"""The review rules applied to invoices after parse and seed"""
+	return {"rules": [rule.to_dict() for rule in rules.active_rules()], "types": sorted(rules.RULE_TYPES)}
+
+@app.put("/rules", status_code=202)
+async def set_review_rules(specs: List[Dict]):
+	"""Replace the review rules and re-score every invoice with them in the background"""
+	try:
+		active = await asyncio.to_thread(rules.save_rules, specs)
+	except rules.RuleError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	return {"rules": [rule.to_dict() for rule in active], "rescore": rescorer.submit().to_dict()}
+
+@app.post("/rules/rescore", status_code=202)
+async def start_rescore():
+	"""Re-score every invoice with the current review rules in the background"""
+	return rescorer.submit().to_dict()
+
+@app.get("/rules/rescore/{job_id}")
+async def get_rescore(job_id: str):
+	"""Poll the progress of a rescore"""
+	job = rescorer.get(job_id)
+	if not job:
+		raise HTTPException(status_code=404, detail="Rescore not found")
+	return job.to_dict()
+
 @app.get("/debug/invoice/{pnr}")
-async def debug_invoice(pnr: str, db: Session = Depends(get_db)):
-	invoice = db.query(Invoice).filter(Invoice.pnr == pnr).first()
+async def debug_invoice(pnr: str, db: AsyncSession = Depends(get_db)):
+	invoice = await db.scalar(pipeline.invoice_query(pnr))
 	if not invoice:
 		raise HTTPException(status_code=404, detail="Invoice not found")
-	from services.parser import InvoiceParser
-	parser_dbg = InvoiceParser()
 	norm_text = None
 	try:
 		if invoice.pdf_path and os.path.exists(invoice.pdf_path):
-			raw = parser_dbg._extract_text_from_pdf(invoice.pdf_path)
-			norm_text = parser_dbg._normalize_text(raw)
+			raw = await parser.get_raw_text(invoice.pdf_path)
+			norm_text = parser._normalize_text(raw)
 	except Exception as e:
 		norm_text = f"error: {e}"
 	return {
@@ -374,21 +688,45 @@ async def debug_invoice(pnr: str, db: Session = Depends(get_db)):
 		"normalized_preview": (norm_text or "")[0:500]
 	}
 
-@app.post("/reset")
-async def reset_system(db: Session = Depends(get_db)):
-	# Delete all DB rows
-	for model in [Invoice, Passenger]:
-		db.query(model).delete()
-	db.commit()
-	# Delete PDFs inside invoices_dir
+@app.get("/parse-cache")
+async def get_parse_cache_stats():
+	"""Parse cache hit/miss counters and in-memory usage"""
+	return parser.cache.stats()
+
+@app.post("/parse-cache/invalidate")
+async def invalidate_parse_cache(rules_version: Optional[int] = None):
+	"""Drop cached parse results for a rules version (default: all but the current one); extracted text is kept"""
+	count = await parser.cache.invalidate(rules_version)
+	return {"message": f"Invalidated {count} cached parse results", "invalidated": count}
+
+@app.post("/purge", status_code=202)
+async def start_purge(request: PurgeRequest):
+	"""Delete invoices by airline, invoice date range and/or PNR list (or everything) in the background"""
 	try:
-		for fname in os.listdir(invoices_dir):
-			fpath = os.path.join(invoices_dir, fname)
-			if os.path.isfile(fpath):
-				os.remove(fpath)
-	except Exception as _:
-		pass
-	return {"message": "System reset: database cleared and invoices deleted"}
+		scope = PurgeScope(request.everything, request.airline, request.date_from, request.date_to, request.pnrs)
+	except PurgeError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	return purges.submit(scope).to_dict()
+
+@app.get("/purge/{job_id}")
+async def get_purge(job_id: str):
+	"""Poll the progress of a purge"""
+	job = purges.get(job_id)
+	if not job:
+		raise HTTPException(status_code=404, detail="Purge not found")
+	return job.to_dict()
+
+@app.post("/reset")
+async def reset_system():
+	"""Clear the database, then delete the stored PDFs in the background (poll /purge/{job_id})"""
+	job = purges.submit(PurgeScope(everything=True))
+	await job.rows_purged.wait()
+	if job.status == "Failed":
+		raise HTTPException(status_code=500, detail=f"Reset failed: {job.error}")
+	return {"message": "System reset: database cleared, invoices are being deleted", "purge": job.to_dict()}
+
+# Mount static files for PDF access
+app.mount("/invoices", StaticFiles(directory=invoices_dir), name="invoices")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,86 @@
+"""PDF text extraction throughput over the sample invoices in invoices/.
+
+Times the previous extractor (PyPDF2 over a regular file, every page, `text +=`)
+against each installed backend of services.pdf_text, with and without the early
+stop, in this process and through a worker pool, and checks every backend's text
+parses to the same fields as the previous extractor's.
+
+Run from backend/:  python -m benchmarks.bench_extract [--iterations N] [--workers N]
+"""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import PyPDF2
+
+from services import extraction, pdf_text
+
+SAMPLES_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "invoices"))
+
+
+def legacy_extract(pdf_path: str) -> str:
+    """The extractor this benchmark is measured against."""
+    text = ""
+    with open(pdf_path, "rb") as file:
+        for page in PyPDF2.PdfReader(file).pages:
+            text += page.extract_text() or ""
+    return text
+
+
+def fields(text: str) -> dict:
+    return extraction.registry.extract(extraction.normalize_text(text))
+
+
+def _time(fn, paths, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for path in paths:
+            fn(path)
+    return time.perf_counter() - start
+
+
+def _time_pooled(fn, paths, iterations: int, workers: int) -> float:
+    with ProcessPoolExecutor(workers) as pool:
+        # Warm the workers (imports) outside the measurement
+        list(pool.map(fn, paths[:1] * workers))
+        start = time.perf_counter()
+        list(pool.map(fn, paths * iterations, chunksize=max(1, len(paths) * iterations // (workers * 4))))
+        return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iterations", type=int, default=50, help="passes over the sample PDFs")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes for the pooled run")
+    ap.add_argument("--samples", default=SAMPLES_DIR, help="directory of PDFs to extract")
+    args = ap.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.samples, "*.pdf")))
+    if not paths:
+        raise SystemExit(f"no PDFs in {args.samples}")
+    count = len(paths) * args.iterations
+    expected = {path: fields(legacy_extract(path)) for path in paths}
+    print(f"{len(paths)} PDFs x {args.iterations} iterations, {args.workers} workers; "
+          f"backends installed: {', '.join(pdf_text.available())}")
+
+    candidates = [("legacy pypdf2", legacy_extract)]
+    for backend in pdf_text.available():
+        candidates.append((f"{backend} all pages", partial(pdf_text.extract_text, backend=backend, early_stop=False)))
+        candidates.append((f"{backend} early stop", partial(pdf_text.extract_text, backend=backend)))
+
+    for label, fn in candidates:
+        mismatches = [path for path in paths if fields(fn(path)) != expected[path]]
+        single = _time(fn, paths, args.iterations)
+        pooled = _time_pooled(fn, paths, args.iterations, args.workers)
+        print(f"{label:22} {single / count * 1000:7.3f} ms/PDF   {count / single:8,.0f} PDFs/s   "
+              f"pooled: {count / pooled:8,.0f} PDFs/s   "
+              f"{'fields match' if not mismatches else f'{len(mismatches)} MISMATCHED'}")
+        for path in mismatches:
+            print(f"  {os.path.basename(path)}: {fields(fn(path))} != {expected[path]}")
+
+
+if __name__ == "__main__":
+    main()
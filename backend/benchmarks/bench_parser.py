@@ -0,0 +1,98 @@
+"""Microbenchmark for invoice field extraction.
+
+Extracts the text of every sample PDF in invoices/ once, then times how many
+invoices per second InvoiceParser can normalize and parse. `--compare` also times
+the previous one-re.search-per-pattern implementation and checks both agree.
+
+Run from backend/:  python -m benchmarks.bench_parser [--iterations N] [--compare]
+"""
+import argparse
+import glob
+import os
+import re
+import time
+from datetime import datetime
+
+from services.parser import InvoiceParser, extract_text_from_pdf
+
+SAMPLES_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "invoices"))
+
+
+def legacy_parse(text: str) -> dict:
+	"""The sequential per-pattern parser this benchmark is measured against."""
+	data = {"invoice_number": None, "invoice_date": None, "airline": None, "amount": None, "gstin": None}
+	for pattern in [r'Invoice\s*Number[:#]?\s*([0-9]{6,})', r'(INV-[A-Z0-9]+-\d{3,})']:
+		m = re.search(pattern, text, re.IGNORECASE)
+		if m:
+			data["invoice_number"] = m.group(1)
+			break
+	for pattern in [r'Date[:]?!?\s*(\d{4}-\d{2}-\d{2})', r'Date[:]?!?\s*(\d{2}/\d{2}/\d{4})', r'(\d{2}-\d{2}-\d{4})']:
+		m = re.search(pattern, text)
+		if m:
+			for fmt in ('%Y-%m-%d', '%m/%d/%Y', '%d-%m-%Y'):
+				try:
+					data["invoice_date"] = datetime.strptime(m.group(1), fmt)
+					break
+				except ValueError:
+					continue
+			break
+	for pattern in [r'Airline[:]?!?\s*(Thai Airways|Air India|IndiGo|SpiceJet|Vistara|AirAsia)',
+					r'\b(Thai Airways|Air India|IndiGo|SpiceJet|Vistara|AirAsia)\b']:
+		m = re.search(pattern, text, re.IGNORECASE)
+		if m:
+			data["airline"] = m.group(1).strip()
+			break
+	for pattern in [r'Amount[:]?\s*[^0-9\-]*([\d,]+\.?\d*)', r'Total[:]?\s*[^0-9\-]*([\d,]+\.?\d*)',
+					r'[₹\$\€\£₹£€¥\s]*([\d,]+\.?\d*)']:
+		m = re.search(pattern, text)
+		if m:
+			try:
+				data["amount"] = float(m.group(1).replace(',', ''))
+			except ValueError:
+				pass
+			break
+	m = re.search(r'([0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}Z[0-9A-Z]{1})', text)
+	if m:
+		data["gstin"] = m.group(1)
+	return data
+
+
+def _time(fn, texts, iterations):
+	start = time.perf_counter()
+	for _ in range(iterations):
+		for text in texts:
+			fn(text)
+	elapsed = time.perf_counter() - start
+	return (iterations * len(texts)) / elapsed if elapsed else float("inf")
+
+
+def main():
+	ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	ap.add_argument("--iterations", type=int, default=2000, help="passes over the sample set")
+	ap.add_argument("--samples", default=SAMPLES_DIR, help="directory of sample invoice PDFs")
+	ap.add_argument("--compare", action="store_true", help="also time the legacy parser and check outputs match")
+	args = ap.parse_args()
+
+	paths = sorted(glob.glob(os.path.join(args.samples, "**", "*.pdf"), recursive=True))
+	if not paths:
+		raise SystemExit(f"No sample PDFs found in {args.samples}")
+	parser = InvoiceParser()
+	raw_texts = [extract_text_from_pdf(p) for p in paths]
+
+	def parse(raw):
+		return parser._parse_invoice_data(parser._normalize_text(raw), "")
+
+	print(f"{len(paths)} sample invoices, {args.iterations} iterations")
+	rate = _time(parse, raw_texts, args.iterations)
+	print(f"engine : {rate:,.0f} invoices/sec")
+	if args.compare:
+		mismatches = [p for p, raw in zip(paths, raw_texts) if parse(raw) != legacy_parse(parser._normalize_text(raw))]
+		legacy_rate = _time(lambda raw: legacy_parse(parser._normalize_text(raw)), raw_texts, args.iterations)
+		print(f"legacy : {legacy_rate:,.0f} invoices/sec ({rate / legacy_rate:.2f}x speedup)")
+		if mismatches:
+			raise SystemExit(f"Output differs from legacy parser for: {', '.join(mismatches)}")
+		print("outputs match legacy parser")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,88 @@
+"""Mock invoice PDF rendering throughput.
+
+Renders --count synthetic invoices with each renderer (platypus and the fast template)
+in this process, then again through the CPU worker pool in batches of --batch-size,
+and reports PDFs per minute. `--check` also extracts both renderers' output and checks
+the parser reads the same fields from them.
+
+Run from backend/:  python -m benchmarks.bench_render [--count N] [--batch-size N] [--check]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from services.downloader import RENDERERS, render_invoice_batch
+from services.parser import InvoiceParser, extract_text_from_pdf
+
+AIRLINES = ["Air India", "IndiGo", "SpiceJet", "Vistara", "AirAsia", "Thai Airways"]
+
+
+def synthetic_fields(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "invoice_number": f"INV-6E-{10000 + i}",
+            "invoice_date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "passenger_name": f"Passenger {i}",
+            "pnr": f"PNR{i:06d}",
+            "airline": rng.choice(AIRLINES),
+            "amount": round(rng.uniform(1000, 50000), 2),
+            "gstin": "27ABCDE1234F1Z5" if i % 2 else None,
+        }
+
+
+def per_minute(count: int, seconds: float) -> float:
+    return count / seconds * 60 if seconds else float("inf")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--count", type=int, default=2000, help="invoices rendered per measurement")
+    ap.add_argument("--batch-size", type=int, default=64, help="invoices per worker call in the pooled run")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes for the pooled run")
+    ap.add_argument("--check", action="store_true", help="check both renderers parse to the same fields")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="invoice-render-")
+    try:
+        jobs = [(os.path.join(workdir, f"{f['pnr']}.pdf"), f) for f in synthetic_fields(args.count)]
+        print(f"{args.count} invoices, {args.workers} workers, batches of {args.batch_size}")
+        for mode, render in RENDERERS.items():
+            start = time.perf_counter()
+            for pdf_path, fields in jobs:
+                render(pdf_path, fields)
+            single = time.perf_counter() - start
+
+            batches = [jobs[i:i + args.batch_size] for i in range(0, len(jobs), args.batch_size)]
+            with ProcessPoolExecutor(args.workers) as pool:
+                # Warm the workers (imports, template build) outside the measurement
+                list(pool.map(render_invoice_batch, [jobs[:1]] * args.workers, [mode] * args.workers))
+                start = time.perf_counter()
+                list(pool.map(render_invoice_batch, batches, [mode] * len(batches)))
+                pooled = time.perf_counter() - start
+            print(f"{mode:9} single process: {per_minute(args.count, single):>10,.0f} PDFs/min "
+                  f"({single / args.count * 1000:.3f} ms each)   pooled: {per_minute(args.count, pooled):>10,.0f} PDFs/min")
+
+        if args.check:
+            parser = InvoiceParser()
+            mismatches = 0
+            for pdf_path, fields in jobs[:200]:
+                parsed = {}
+                for mode, render in RENDERERS.items():
+                    path = f"{pdf_path}.{mode}.pdf"
+                    render(path, fields)
+                    parsed[mode] = parser._parse_invoice_data(parser._normalize_text(extract_text_from_pdf(path)), fields["pnr"])
+                if parsed["fast"] != parsed["platypus"]:
+                    mismatches += 1
+                    print(f"MISMATCH {fields['pnr']}: {parsed}")
+            print(f"check: {min(len(jobs), 200) - mismatches}/{min(len(jobs), 200)} invoices parse identically")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
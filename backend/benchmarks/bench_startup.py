@@ -0,0 +1,111 @@
+"""Cold-start time of the API process.
+
+Each measurement runs a fresh interpreter, as a new container would, against a
+scratch database and invoices directory:
+
+  interpreter   python -c pass, the floor every start pays
+  import        import app (module imports and module-level setup)
+  startup       import app, then run the lifespan startup (schema creation and
+                migrations, queue worker start) and shut down again; first run
+                against an empty database, then against one already migrated
+
+Reports the median and minimum over --runs starts. `--modules N` also lists the N
+slowest imports (cumulative, from python -X importtime) so regressions can be traced.
+
+Run from backend/:  python -m benchmarks.bench_startup [--runs N] [--modules N]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+
+_STARTUP = """
+import asyncio
+from app import app
+
+async def main():
+    async with app.router.lifespan_context(app):
+        pass
+
+asyncio.run(main())
+"""
+
+
+def _env(workdir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        "INVOICES_DIR": os.path.join(workdir, "invoices"),
+        "QUEUE_WORKERS": "0",
+        "CPU_WORKERS": "0",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    env.pop("ASYNC_DATABASE_URL", None)
+    return env
+
+
+def _run(args, env) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=BACKEND_DIR, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def _measure(label: str, args, env, runs: int, reset_db: Optional[str] = None):
+    times = []
+    for _ in range(runs):
+        if reset_db:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(reset_db + suffix):
+                    os.remove(reset_db + suffix)
+        times.append(_run(args, env))
+    print(f"{label:22} median {statistics.median(times) * 1000:8.1f} ms   min {min(times) * 1000:8.1f} ms")
+
+
+def slowest_imports(env, count: int):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=BACKEND_DIR, env=env,
+                         check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.rstrip()))
+    # Top-level packages only (indentation of one level), slowest first
+    top = [(us, name.strip()) for us, name in rows if len(name) - len(name.lstrip()) <= 3]
+    print("\nslowest top-level imports of app (cumulative):")
+    for us, name in sorted(top, reverse=True)[:count]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5, help="process starts per measurement")
+    ap.add_argument("--modules", type=int, default=0, help="list the N slowest imports")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="invoice-startup-")
+    try:
+        env = _env(workdir)
+        db_path = os.path.join(workdir, "startup.db")
+        print(f"{args.runs} runs each, python {sys.version.split()[0]}")
+        _measure("interpreter", ["-c", "pass"], env, args.runs)
+        _measure("import", ["-c", "import app"], env, args.runs)
+        _measure("startup (empty db)", ["-c", _STARTUP], env, args.runs, reset_db=db_path)
+        _measure("startup (migrated db)", ["-c", _STARTUP], env, args.runs)
+        if args.modules:
+            slowest_imports(env, args.modules)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""End-to-end load test for the invoice API.
+
+Generates synthetic passengers and seeded invoices at the requested scale, then drives
+the API in-process through an httpx ASGI client against a scratch database and invoices
+directory (the mock downloader keeps it fully offline):
+
+  seed            POST /invoices/seed in batches
+  passengers      POST /passengers/bulk in batches
+  download/parse  POST /download/{pnr} and /parse/{pnr} for --sample unseeded PNRs,
+                  so parsing renders and extracts real PDFs
+  invoices_page   GET /invoices walking the keyset cursor, plus an airline-filtered page
+  summary         GET /summary
+  high_value      GET /invoices/high-value
+
+Each phase reports request count, p50/p95/p99 latency, requests/sec and rows/sec;
+the JSON report also records peak RSS and the environment so runs can be diffed
+between releases.
+
+Run from backend/:  python -m benchmarks.load_test --scale 10000 --output load_test.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Dict, Iterator, List
+
+AIRLINES = ["Air India", "IndiGo", "SpiceJet", "Vistara", "AirAsia", "Thai Airways"]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Phase:
+    """Latency samples and row counts for one benchmark phase."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.rows = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def report(self) -> Dict:
+        lat = sorted(self.latencies)
+        return {
+            "requests": len(lat),
+            "errors": self.errors,
+            "rows": self.rows,
+            "elapsed_s": round(self.elapsed, 3),
+            "requests_per_s": round(len(lat) / self.elapsed, 2) if self.elapsed else None,
+            "rows_per_s": round(self.rows / self.elapsed, 1) if self.elapsed and self.rows else None,
+            "p50_ms": round(percentile(lat, 50) * 1000, 2),
+            "p95_ms": round(percentile(lat, 95) * 1000, 2),
+            "p99_ms": round(percentile(lat, 99) * 1000, 2),
+            "max_ms": round(lat[-1] * 1000, 2) if lat else 0.0,
+        }
+
+
+async def timed(phase: Phase, request, rows: int = 0):
+    start = time.perf_counter()
+    response = await request
+    phase.latencies.append(time.perf_counter() - start)
+    if response.status_code >= 400:
+        phase.errors += 1
+    else:
+        phase.rows += rows
+    return response
+
+
+async def run_concurrently(phase: Phase, calls: List, concurrency: int):
+    """Await zero-argument coroutine factories with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(call):
+        async with semaphore:
+            return await call()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(call) for call in calls))
+    phase.elapsed += time.perf_counter() - start
+    return results
+
+
+def synthetic_invoices(count: int, rng: random.Random) -> Iterator[Dict]:
+    start = date(2024, 1, 1)
+    for i in range(count):
+        yield {
+            "Invoice_Number": f"BENCH{i:07d}",
+            "Date": (start + timedelta(days=rng.randrange(365))).isoformat(),
+            "Airline": rng.choice(AIRLINES),
+            "Amount": round(rng.uniform(1000, 50000), 2),
+            "GSTIN": None,
+            "Name": f"Passenger {i}",
+        }
+
+
+def batches(items: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch: List[Dict] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def peak_rss_mb() -> Dict:
+    # ru_maxrss is KiB on Linux and bytes on macOS; children covers the CPU worker pool once reaped
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args) -> Dict:
+    # The app reads its configuration at import time
+    import httpx
+    import config
+    from app import app
+
+    rng = random.Random(args.seed)
+    phases: Dict[str, Phase] = {}
+
+    def phase(name: str) -> Phase:
+        return phases.setdefault(name, Phase(name))
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+            p = phase("seed")
+            start = time.perf_counter()
+            for batch in batches(synthetic_invoices(args.scale, rng), args.batch_size):
+                await timed(p, client.post("/invoices/seed", json=batch), len(batch))
+            p.elapsed += time.perf_counter() - start
+
+            p = phase("passengers_bulk")
+            fresh = [f"FRESH{i:06d}" for i in range(args.sample)]
+            people = itertools.chain(
+                ({"name": f"Passenger {i}", "pnr": f"BENCH{i:07d}"} for i in range(args.scale)),
+                ({"name": f"Fresh {pnr}", "pnr": pnr} for pnr in fresh),
+            )
+            start = time.perf_counter()
+            for batch in batches(people, args.batch_size):
+                await timed(p, client.post("/passengers/bulk", json=batch), len(batch))
+            p.elapsed += time.perf_counter() - start
+
+            p = phase("download")
+            await run_concurrently(p, [lambda pnr=pnr: timed(p, client.post(f"/download/{pnr}"), 1) for pnr in fresh], args.concurrency)
+            p = phase("parse")
+            await run_concurrently(p, [lambda pnr=pnr: timed(p, client.post(f"/parse/{pnr}"), 1) for pnr in fresh], args.concurrency)
+
+            p = phase("invoices_page")
+            cursor = None
+            start = time.perf_counter()
+            for _ in range(args.pages):
+                params = {"limit": args.page_size}
+                if cursor:
+                    params["cursor"] = cursor
+                response = await timed(p, client.get("/invoices", params=params))
+                p.rows += len(response.json())
+                cursor = response.headers.get("X-Next-Cursor")
+                if not cursor:
+                    break
+            p.elapsed += time.perf_counter() - start
+            p = phase("invoices_page_filtered")
+            await run_concurrently(p, [
+                lambda airline=airline: timed(p, client.get("/invoices", params={"airline": airline, "limit": args.page_size}))
+                for airline in AIRLINES * args.repeat
+            ], args.concurrency)
+
+            p = phase("summary")
+            await run_concurrently(p, [lambda: timed(p, client.get("/summary"))] * args.repeat, args.concurrency)
+
+            p = phase("high_value")
+            await run_concurrently(p, [
+                lambda: timed(p, client.get("/invoices/high-value", params={"amount": args.high_value_amount}))
+            ] * args.repeat, args.concurrency)
+
+    return {
+        "meta": {
+            "scale": args.scale,
+            "sample": args.sample,
+            "batch_size": args.batch_size,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "cpu_workers": config.CPU_WORKERS,
+            "mock_download_delay_ms": config.MOCK_DOWNLOAD_DELAY_MS,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "phases": {name: p.report() for name, p in phases.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scale", type=int, default=10_000, help="seeded passengers/invoices (1k-1M)")
+    ap.add_argument("--sample", type=int, default=50, help="unseeded PNRs to download and parse")
+    ap.add_argument("--batch-size", type=int, default=1000, help="rows per seed/bulk request")
+    ap.add_argument("--concurrency", type=int, default=8, help="in-flight requests for per-PNR and read phases")
+    ap.add_argument("--pages", type=int, default=50, help="/invoices pages to walk")
+    ap.add_argument("--page-size", type=int, default=100)
+    ap.add_argument("--repeat", type=int, default=20, help="requests per read endpoint")
+    ap.add_argument("--high-value-amount", type=float, default=49_500, help="threshold (~1%% of synthetic invoices)")
+    ap.add_argument("--seed", type=int, default=42, help="random seed for synthetic data")
+    ap.add_argument("--workdir", help="scratch directory for the database and PDFs (default: a temp dir)")
+    ap.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    ap.add_argument("--output", default="load_test.json", help="JSON report path")
+    args = ap.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="invoice-load-")
+    os.makedirs(os.path.join(workdir, "invoices"), exist_ok=True)
+    # Never touch the development database or invoices directory
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'load_test.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ["INVOICES_DIR"] = os.path.join(workdir, "invoices")
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"{'phase':24} {'reqs':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'rows/s':>10}")
+    for name, r in report["phases"].items():
+        print(f"{name:24} {r['requests']:>6} {r['errors']:>4} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} "
+              f"{r['requests_per_s'] or '-':>9} {r['rows_per_s'] or '-':>10}")
+    rss = report["peak_rss_mb"]
+    print(f"peak RSS: {rss['self']} MB (workers {rss['children']} MB)  ->  {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""EXPLAIN QUERY PLAN regression check for the API's hot queries.
+
+Takes each hot lookup from the query builders app.py and the services run, including
+the first page of every listing filter, runs EXPLAIN QUERY PLAN against a fresh SQLite
+schema (create_all + migrations) and exits non-zero if any of them scans a whole table,
+directly or by walking one of its indexes end to end, unless the query allows it.
+Walking a partial index only visits the rows it covers and is not counted.
+
+Run from backend/:  python -m benchmarks.query_plans
+"""
+import re
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import create_engine, select
+
+from db import migrations
+from db.models import Invoice, Passenger
+from services import bulk, pipeline, search, storage, summary, task_queue
+
+import app
+
+# SQLite reports reading a whole table as "SCAN <table>", optionally "USING [COVERING]
+# INDEX <index>" when it walks an index instead; an FTS5 table answering a MATCH shows as
+# "SCAN <table> VIRTUAL TABLE INDEX <n>:M..."
+_SCAN = re.compile(r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?")
+_FTS_MATCH = re.compile(r"^SCAN \w+ VIRTUAL TABLE INDEX \d+:M")
+
+PAGE = app.DEFAULT_PAGE_SIZE
+FROM, TO = date(2024, 1, 1), date(2024, 3, 31)
+
+# Listing filters of /invoices (also /invoices/stream, exports and archives) and
+# /passengers: (name, filter arguments, tables allowed to be scanned)
+INVOICE_FILTERS = [
+    ("airline", {"airline": "IndiGo"}, ()),
+    ("airline and date range", {"airline": "IndiGo", "date_from": FROM, "date_to": TO}, ()),
+    ("date range", {"date_from": FROM, "date_to": TO}, ()),
+    # SQLite assumes an open-ended range matches a quarter of the table, so it walks
+    # the table in id order and stops after a page rather than sort the range
+    ("date from", {"date_from": FROM}, ("invoices",)),
+    ("date to", {"date_to": TO}, ("invoices",)),
+    ("flag", {"flag_for_review": True}, ()),
+    ("parse status", {"status": "Error"}, ()),
+    ("review reason", {"review_reason": "missing_gstin"}, ()),
+]
+PASSENGER_FILTERS = [
+    ("download status", {"download_status": "Error"}, ()),
+    ("parse status", {"parse_status": "Error"}, ()),
+    ("created date range", {"date_from": FROM, "date_to": TO}, ()),
+    ("created from", {"date_from": FROM}, ("passengers",)),
+]
+
+
+def hot_queries():
+    """(name, statement, tables allowed to be scanned) for every hot path."""
+    pnrs = ["P1", "P2"]
+    return [
+        ("passenger by pnr", pipeline.passenger_query("P1"), ()),
+        ("invoice by pnr", pipeline.invoice_query("P1"), ()),
+        ("invoices by pnr list", bulk.ids_by_pnr_query(Invoice, pnrs), ()),
+        ("passengers by pnr list", bulk.ids_by_pnr_query(Passenger, pnrs), ()),
+        ("high-value invoices", app.high_value_query(10000), ()),
+        # The unfiltered first page reads the table in id order and stops after a page
+        ("invoices first page", app.keyset_query(select(Invoice), Invoice, None, PAGE), ("invoices",)),
+        ("invoices page after cursor", app.keyset_query(select(Invoice), Invoice, 100, PAGE), ()),
+        *((f"invoices by {name}, first page",
+           app.keyset_query(app.filter_invoices(select(Invoice), **filters), Invoice, None, PAGE), allowed)
+          for name, filters, allowed in INVOICE_FILTERS),
+        *((f"passengers by {name}, first page",
+           app.keyset_query(app.filter_passengers(select(Passenger), **filters), Passenger, None, PAGE), allowed)
+          for name, filters, allowed in PASSENGER_FILTERS),
+        ("invoice search",
+            app.filter_invoices(search.search_query("indigo"), airline="IndiGo").offset(0).limit(PAGE + 1), ()),
+        ("invoice search by recency",
+            search.search_query("indigo", sort="recent").offset(0).limit(PAGE + 1), ()),
+        ("airline summary recompute",
+            summary._aggregate_query().where(Invoice.airline == "IndiGo").group_by(Invoice.airline), ()),
+        ("referenced pdf paths (storage gc)", storage.referenced_query(["/x/ab/cd/1.pdf", "/x/ab/cd/2.pdf"]), ()),
+        ("due queue tasks", task_queue.due_query(datetime(2024, 1, 1), 8), ()),
+        ("active queue tasks by pnr", task_queue.active_query("download", pnrs), ()),
+        # One row per airline; this is the point of the table
+        ("summary listing", summary.listing_query(), ("airline_summary",)),
+    ]
+
+
+def explain(conn, stmt):
+    # Expand IN lists into plain placeholders; bind values don't affect the chosen plan much
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    params = tuple(p.isoformat(" ") if isinstance(p, (date, datetime)) else p for p in params)
+    return [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params)]
+
+
+def partial_indexes(conn) -> set:
+    names = set()
+    for table in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'").scalars():
+        names.update(row[1] for row in conn.exec_driver_sql(f'PRAGMA index_list("{table}")') if row[4])
+    return names
+
+
+def full_scans(plan, allowed, partial) -> list:
+    """Plan steps that read all of a table not in `allowed`."""
+    scans = []
+    for step in plan:
+        m = _SCAN.match(step)
+        if m and not _FTS_MATCH.match(step) and m.group(2) not in partial and m.group(1) not in allowed:
+            scans.append(step)
+    return scans
+
+
+def main() -> int:
+    engine = create_engine("sqlite://")
+    migrations.upgrade(engine)
+    failures = []
+    with engine.connect() as conn:
+        partial = partial_indexes(conn)
+        for name, stmt, allowed in hot_queries():
+            plan = explain(conn, stmt)
+            scans = full_scans(plan, allowed, partial)
+            status = "FAIL" if scans else "ok"
+            print(f"{status:4}  {name}: {' | '.join(plan)}")
+            if scans:
+                failures.append(name)
+    if failures:
+        print(f"\n{len(failures)} hot queries fall back to a table scan: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
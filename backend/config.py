@@ -0,0 +1,116 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _int_env(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _float_env(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Directory holding generated/downloaded invoice PDFs (served under /invoices)
+INVOICES_DIR = os.path.abspath(os.getenv(
+    "INVOICES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "invoices")
+))
+# Mock PDF rendering: "fast" stamps values onto a fixed canvas layout, "platypus"
+# lays out every invoice with reportlab's document engine. The fast layout uses the
+# base Type1 fonts, which have no rupee sign, so platypus stays the default. Renders
+# that queue up behind busy workers go out PDF_RENDER_BATCH_SIZE per worker call.
+PDF_RENDER_MODE = os.getenv("PDF_RENDER_MODE", "platypus")
+PDF_RENDER_BATCH_SIZE = _int_env("PDF_RENDER_BATCH_SIZE", 64)
+# PDF text extraction backend: auto, pymupdf, pypdf or pypdf2 (a named backend that
+# is not installed falls back to pypdf2)
+PDF_TEXT_BACKEND = os.getenv("PDF_TEXT_BACKEND", "auto")
+# Simulated network latency of the mock invoice downloader
+MOCK_DOWNLOAD_DELAY_MS = _int_env("MOCK_DOWNLOAD_DELAY_MS", 200)
+
+# Invoice PDF storage: unreferenced files younger than this are kept by garbage
+# collection (a download may not have committed its pdf_path yet)
+STORAGE_GC_GRACE_SECONDS = _int_env("STORAGE_GC_GRACE_SECONDS", 3600)
+
+# Seeded invoice metadata (seed_metadata table): in-memory LRU size and how long a
+# cached entry may be served before it is re-read (other processes may re-seed it)
+METADATA_CACHE_ENTRIES = _int_env("METADATA_CACHE_ENTRIES", 10_000)
+METADATA_CACHE_TTL_SECONDS = _int_env("METADATA_CACHE_TTL_SECONDS", 60)
+
+# CSV passenger import: rows committed per batch, and how many rejected rows are
+# listed in the import report (all are counted)
+CSV_IMPORT_BATCH_SIZE = _int_env("CSV_IMPORT_BATCH_SIZE", 1000)
+CSV_IMPORT_MAX_REJECTS = _int_env("CSV_IMPORT_MAX_REJECTS", 1000)
+
+# Invoice export: rows fetched from the cursor per chunk (one Parquet row group each)
+EXPORT_BATCH_SIZE = _int_env("EXPORT_BATCH_SIZE", 5000)
+
+# Purges (POST /purge, /reset): invoices deleted per transaction in scoped purges
+PURGE_BATCH_SIZE = _int_env("PURGE_BATCH_SIZE", 1000)
+
+# Review rules (services.rules): the JSON rule list (built-in defaults until one is
+# saved through PUT /rules), and invoices re-scored per transaction by a rescore
+REVIEW_RULES_FILE = os.path.abspath(os.getenv(
+    "REVIEW_RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "review_rules.json")
+))
+RULES_BATCH_SIZE = _int_env("RULES_BATCH_SIZE", 50_000)
+
+# Batch jobs: number of PNRs processed concurrently per job, and the upper bound
+# a client may request through the API
+JOB_CONCURRENCY = _int_env("JOB_CONCURRENCY", 8)
+JOB_MAX_CONCURRENCY = _int_env("JOB_MAX_CONCURRENCY", 64)
+# Finished jobs kept in memory for polling before the oldest are dropped
+JOB_HISTORY_LIMIT = _int_env("JOB_HISTORY_LIMIT", 100)
+
+# Durable download/parse queue (task_queue table): tasks run concurrently per API
+# process (0 leaves them to standalone `python worker.py` processes), failed attempts are retried with exponential
+# backoff and dead-lettered after QUEUE_MAX_ATTEMPTS. A task whose lease expires
+# (e.g. the process died) is picked up again.
+QUEUE_WORKERS = _int_env("QUEUE_WORKERS", 8)
+QUEUE_MAX_ATTEMPTS = _int_env("QUEUE_MAX_ATTEMPTS", 5)
+QUEUE_BACKOFF_BASE_SECONDS = _int_env("QUEUE_BACKOFF_BASE_SECONDS", 2)
+QUEUE_BACKOFF_MAX_SECONDS = _int_env("QUEUE_BACKOFF_MAX_SECONDS", 300)
+QUEUE_LEASE_SECONDS = _int_env("QUEUE_LEASE_SECONDS", 120)
+QUEUE_POLL_INTERVAL_MS = _int_env("QUEUE_POLL_INTERVAL_MS", 1000)
+# Where queue workers (in the API or `python worker.py`) get tasks: "sql", the
+# task_queue table of DATABASE_URL
+QUEUE_BROKER = os.getenv("QUEUE_BROKER", "sql")
+
+# Process pool for CPU-bound PDF rendering and text extraction.
+# 0 runs the work in the event loop's default thread pool instead.
+CPU_WORKERS = _int_env("CPU_WORKERS", os.cpu_count() or 1)
+
+# Dashboard events (GET /events): per-subscriber backlog before it is told to resync,
+# and how often an idle stream sends a keep-alive comment
+EVENTS_QUEUE_SIZE = _int_env("EVENTS_QUEUE_SIZE", 1000)
+EVENTS_HEARTBEAT_SECONDS = _int_env("EVENTS_HEARTBEAT_SECONDS", 15)
+
+# Request profiling: fraction of requests profiled with cProfile (0 disables; can be
+# changed at runtime through /debug/profiler), where .prof dumps go and how many are kept
+PROFILE_SAMPLE_RATE = _float_env("PROFILE_SAMPLE_RATE", 0.0)
+PROFILE_DIR = os.path.abspath(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_KEEP = _int_env("PROFILE_KEEP", 100)
+
+# Parse cache: in-memory LRU budget in bytes in front of the parse_cache table
+PARSE_CACHE_MEMORY_BYTES = _int_env("PARSE_CACHE_MEMORY_BYTES", 32 * 1024 * 1024)
+
+# Database. Any SQLAlchemy URL; the async engine swaps in the matching async driver
+# (sqlite -> aiosqlite, postgresql -> asyncpg) unless ASYNC_DATABASE_URL is set.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./db/database.db")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+DB_POOL_SIZE = _int_env("DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = _int_env("DB_MAX_OVERFLOW", 20)
+DB_POOL_TIMEOUT = _int_env("DB_POOL_TIMEOUT", 30)
+DB_POOL_RECYCLE = _int_env("DB_POOL_RECYCLE", 1800)
+DB_ECHO = os.getenv("DB_ECHO", "").lower() in ("1", "true", "yes")
+# SQLite connection pragmas
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = _int_env("SQLITE_CACHE_SIZE_KB", 64 * 1024)
+SQLITE_BUSY_TIMEOUT_MS = _int_env("SQLITE_BUSY_TIMEOUT_MS", 5000)
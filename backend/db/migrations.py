@@ -0,0 +1,137 @@
+"""Schema creation and versioned migrations for databases created by older releases.
+
+`upgrade` first creates missing tables with `Base.metadata.create_all`, which never
+alters existing ones, so changes to existing tables are applied here, in order, and
+recorded in the schema_migrations table. Every step is idempotent so it is also safe
+on a database that create_all just built with the current schema.
+
+Importing db.models does not touch the database. Run `python -m db.migrations` to
+create or upgrade one; the API and queue workers run it at startup.
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from db.models import Base, Invoice, Passenger
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+def _invoice_indexes(conn: Connection):
+    """Unique PNR plus indexes for amount, (airline, invoice_date) and (flag_for_review, amount)."""
+    # Duplicate PNRs block the unique index; keep the oldest row, which lookups used to return
+    conn.execute(text(
+        "DELETE FROM invoices WHERE id NOT IN (SELECT MIN(id) FROM invoices GROUP BY pnr) AND pnr IS NOT NULL"
+    ))
+    existing = {ix["name"]: ix for ix in inspect(conn).get_indexes("invoices")}
+    pnr_ix = existing.get("ix_invoices_pnr")
+    if pnr_ix is not None and not pnr_ix["unique"]:
+        conn.execute(text("DROP INDEX ix_invoices_pnr"))
+    # Superseded by the (airline, invoice_date) composite index
+    if "ix_invoices_airline" in existing:
+        conn.execute(text("DROP INDEX ix_invoices_airline"))
+    for index in Invoice.__table__.indexes:
+        index.create(conn, checkfirst=True)
+    # Deleted duplicates may have been counted in the airline summary
+    from services import summary
+    session = Session(bind=conn)
+    try:
+        summary.rebuild(session)
+    finally:
+        session.close()
+
+
+def _pdf_path_index(conn: Connection):
+    """Index invoices.pdf_path for storage garbage collection lookups."""
+    for index in Invoice.__table__.indexes:
+        if index.name == "ix_invoices_pdf_path":
+            index.create(conn, checkfirst=True)
+
+
+def _invoice_search_index(conn: Connection):
+    """FTS5 index over invoice identifiers and raw_text, maintained by triggers."""
+    from services import search
+    # The columns indexed at the time; migration 5 re-creates the index with passenger_name
+    search.create_index(conn, ("pnr", "invoice_number", "airline", "gstin", "raw_text"))
+
+
+def _invoice_review_columns(conn: Connection):
+    """invoices.flag_source and review_reasons; existing flags were all set by hand."""
+    columns = {column["name"] for column in inspect(conn).get_columns("invoices")}
+    if "flag_source" not in columns:
+        conn.execute(text("ALTER TABLE invoices ADD COLUMN flag_source VARCHAR"))
+    if "review_reasons" not in columns:
+        conn.execute(text("ALTER TABLE invoices ADD COLUMN review_reasons TEXT"))
+    conn.execute(text("UPDATE invoices SET flag_source = 'manual' WHERE flag_for_review AND flag_source IS NULL"))
+
+
+def _invoice_passenger_name(conn: Connection):
+    """invoices.passenger_name, backfilled from seeded metadata or the passenger, and indexed for search."""
+    columns = {column["name"] for column in inspect(conn).get_columns("invoices")}
+    if "passenger_name" not in columns:
+        conn.execute(text("ALTER TABLE invoices ADD COLUMN passenger_name VARCHAR"))
+    from services import search
+    # Re-created below; dropping first keeps the backfill from going through the update trigger
+    search.drop_index(conn)
+    conn.execute(text(
+        "UPDATE invoices SET passenger_name = COALESCE("
+        "(SELECT name FROM seed_metadata WHERE seed_metadata.pnr = invoices.pnr AND name IS NOT NULL AND name != ''), "
+        "(SELECT name FROM passengers WHERE passengers.pnr = invoices.pnr)) "
+        "WHERE passenger_name IS NULL"
+    ))
+    search.create_index(conn)
+
+
+def _listing_filter_indexes(conn: Connection):
+    """Indexes for the listing filters: passenger statuses and created_at, invoice date and review reasons."""
+    names = {"ix_passengers_download_status", "ix_passengers_parse_status", "ix_passengers_created_at",
+             "ix_invoices_invoice_date", "ix_invoices_review_reasons"}
+    for index in (*Passenger.__table__.indexes, *Invoice.__table__.indexes):
+        if index.name in names:
+            index.create(conn, checkfirst=True)
+
+
+# (version, description, step) in order; never renumber or edit an applied step
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "unique invoice PNR and hot-path indexes", _invoice_indexes),
+    (2, "invoice pdf_path index", _pdf_path_index),
+    (3, "invoice full-text search index", _invoice_search_index),
+    (4, "invoice review flag source and reasons", _invoice_review_columns),
+    (5, "searchable invoice passenger name", _invoice_passenger_name),
+    (6, "listing filter indexes", _listing_filter_indexes),
+]
+
+
+def upgrade(engine: Engine) -> List[int]:
+    """Create missing tables, then apply pending migrations in order, each in its own transaction.
+
+    Returns the versions applied.
+    """
+    applied: List[int] = []
+    Base.metadata.create_all(engine)
+    _meta.create_all(engine)
+    with engine.connect() as conn:
+        done = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    for version, _, step in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.utcnow()))
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    from db.models import engine
+
+    versions = upgrade(engine)
+    print(f"Applied migrations: {versions}" if versions else "Database is up to date")
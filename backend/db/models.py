@@ -1,51 +1,189 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text
+from sqlalchemy import create_engine, event, Index, Column, Integer, String, Float, DateTime, Boolean, Text, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
 import os
 
+import config
+
 # Create database directory if it doesn't exist
 os.makedirs(os.path.dirname(__file__), exist_ok=True)
 
 # Database setup
-SQLALCHEMY_DATABASE_URL = "sqlite:///./db/database.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+def _async_url(url: str):
+    u = make_url(url)
+    return u.set(drivername=_ASYNC_DRIVERS.get(u.drivername, u.drivername))
+
+def _engine_kwargs(url, is_async: bool = False) -> dict:
+    url = make_url(url)
+    kwargs = {"echo": config.DB_ECHO, "pool_pre_ping": True}
+    if url.get_backend_name() == "sqlite":
+        kwargs["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # In-memory databases use a single static connection
+            return kwargs
+        if is_async:
+            # aiosqlite defaults to NullPool, which reopens (and re-applies pragmas) per checkout
+            kwargs["poolclass"] = AsyncAdaptedQueuePool
+    kwargs.update(
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+    )
+    return kwargs
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed during writes; NORMAL sync is durable across app crashes in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+ASYNC_DATABASE_URL = config.ASYNC_DATABASE_URL or _async_url(SQLALCHEMY_DATABASE_URL)
+
+# Async engine for request handlers; sync engine for CLI tools and code run through run_sync
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_kwargs(SQLALCHEMY_DATABASE_URL))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_kwargs(ASYNC_DATABASE_URL, is_async=True))
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+if async_engine.dialect.name == "sqlite":
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: attributes stay loaded after commit, since lazy loads are not allowed in async code
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 class Passenger(Base):
     __tablename__ = "passengers"
+    __table_args__ = (
+        # Listings filtered by status, in id order; the parse status one also serves the
+        # invoice listing's status filter
+        Index("ix_passengers_download_status", "download_status", "id"),
+        Index("ix_passengers_parse_status", "parse_status", "id"),
+        # Listings filtered by creation date range
+        Index("ix_passengers_created_at", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     pnr = Column(String, unique=True, index=True)
-    download_status = Column(String, default="Pending")  # Pending, Success, Not Found, Error
-    parse_status = Column(String, default="Pending")     # Pending, Success, Error
+    download_status = Column(String, default="Pending")  # Pending, Queued, Retrying, Success, Not Found, Error
+    parse_status = Column(String, default="Pending")     # Pending, Queued, Retrying, Success, Error
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Invoice(Base):
     __tablename__ = "invoices"
+    __table_args__ = (
+        # Airline listings/date-range filters and per-airline summary recomputes
+        Index("ix_invoices_airline_date", "airline", "invoice_date"),
+        # Review queues: flagged invoices ordered/filtered by amount
+        Index("ix_invoices_flag_amount", "flag_for_review", "amount"),
+        # Storage garbage collection: is a stored PDF still referenced
+        Index("ix_invoices_pdf_path", "pdf_path"),
+        # Invoice date range filters without an airline
+        Index("ix_invoices_invoice_date", "invoice_date"),
+        # Review reason filters: reasons are a delimited list, so the filter walks the
+        # invoices that matched any rule, in id order
+        Index("ix_invoices_review_reasons", "id", sqlite_where=text("review_reasons IS NOT NULL"),
+              postgresql_where=text("review_reasons IS NOT NULL")),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    pnr = Column(String, index=True)
+    pnr = Column(String, unique=True, index=True)
     invoice_number = Column(String, index=True)
     invoice_date = Column(DateTime)
-    airline = Column(String, index=True)
-    amount = Column(Float)
+    airline = Column(String)
+    amount = Column(Float, index=True)
     gstin = Column(String, nullable=True)
+    passenger_name = Column(String, nullable=True)  # seeded name, else the passenger's; searchable
     pdf_path = Column(String)
     flag_for_review = Column(Boolean, default=False)
+    flag_source = Column(String, nullable=True)      # manual, rules; None when not flagged
+    review_reasons = Column(Text, nullable=True)     # comma-separated names of the review rules matched
     raw_text = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+class AirlineSummary(Base):
+    """Per-airline aggregate over invoices that have both an airline and an amount.
+
+    Maintained incrementally by services.summary whenever invoices change.
+    """
+    __tablename__ = "airline_summary"
+    
+    airline = Column(String, primary_key=True)
+    total_amount = Column(Float, default=0.0)
+    invoice_count = Column(Integer, default=0)
+    min_amount = Column(Float, nullable=True)
+    max_amount = Column(Float, nullable=True)
+    flagged_count = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SeedMetadata(Base):
+    """Seeded invoice fields, exactly as provided, used when generating mock PDFs."""
+    __tablename__ = "seed_metadata"
+    
+    pnr = Column(String, primary_key=True)
+    invoice_number = Column(String, nullable=True)
+    date = Column(String, nullable=True)
+    airline = Column(String, nullable=True)
+    amount = Column(Float, nullable=True)
+    gstin = Column(String, nullable=True)
+    name = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class QueueTask(Base):
+    """A download or parse task in the durable work queue (see services.task_queue)."""
+    __tablename__ = "task_queue"
+    __table_args__ = (
+        # Claiming due tasks
+        Index("ix_task_queue_state_available", "state", "available_at"),
+        # De-duplicating enqueues per PNR
+        Index("ix_task_queue_pnr_kind", "pnr", "kind"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)            # download, parse
+    pnr = Column(String, nullable=False)
+    state = Column(String, default="Queued")         # Queued, Running, Succeeded, Dead
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    next_kind = Column(String, nullable=True)        # task enqueued for the PNR once this one succeeds
+    available_at = Column(DateTime, default=datetime.utcnow)
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ParseCacheEntry(Base):
+    __tablename__ = "parse_cache"
+    
+    # sha256 of the PDF bytes; extracted text only depends on the content
+    content_hash = Column(String, primary_key=True)
+    raw_text = Column(Text, nullable=True)
+    # Parsed fields (JSON) and the extraction rules version that produced them
+    rules_version = Column(Integer, index=True)
+    data = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close() 
\ No newline at end of file
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db 
\ No newline at end of file
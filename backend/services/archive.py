@@ -0,0 +1,93 @@
+"""ZIP archives of invoice PDFs, built while they are streamed to the client.
+
+zipfile writes to an unseekable sink using data descriptors, so each member is
+compressed into a small buffer that is handed out as soon as the member is complete:
+memory stays bounded by one PDF and nothing is staged on disk. PNRs whose PDF is
+missing are listed in a missing.txt member at the end.
+"""
+import asyncio
+import shutil
+import zipfile
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Select
+
+import config
+from db.models import AsyncSessionLocal, Invoice
+from services.bulk import chunked
+
+MISSING_MEMBER = "missing.txt"
+
+
+class _Sink:
+    """Unseekable write-only file whose written bytes are taken out between members."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _add_file(archive: zipfile.ZipFile, name: str, path: str) -> Optional[str]:
+    """Copy one PDF into the archive; returns the reason it was skipped, if any."""
+    try:
+        src = open(path, "rb")
+    except OSError as e:
+        return e.strerror or type(e).__name__
+    with src, archive.open(name, "w") as dst:
+        shutil.copyfileobj(src, dst, 64 * 1024)
+    return None
+
+
+async def _invoice_rows(query: Select, pnrs: Optional[List[str]], batch_size: int) -> AsyncIterator[Sequence]:
+    query = query.with_only_columns(Invoice.pnr, Invoice.pdf_path).order_by(Invoice.id)
+    async with AsyncSessionLocal() as session:
+        if pnrs is None:
+            result = await session.stream(query.execution_options(yield_per=batch_size))
+            async for rows in result.partitions():
+                yield rows
+        else:
+            for chunk in chunked(pnrs):
+                yield (await session.execute(query.where(Invoice.pnr.in_(chunk)))).all()
+
+
+async def zip_invoices(query: Select, pnrs: Optional[List[str]] = None,
+                       batch_size: int = config.EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Stream a ZIP of the PDFs of `query`'s invoices (a filtered select() of Invoice), one `<pnr>.pdf` each.
+
+    With `pnrs` only those PNRs are included, and any without an invoice are reported.
+    """
+    if pnrs is not None:
+        pnrs = list(dict.fromkeys(pnrs))
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+    missing: List[Tuple[str, str]] = []
+    seen = set()
+    async for rows in _invoice_rows(query, pnrs, batch_size):
+        for pnr, pdf_path in rows:
+            if pnrs is not None:
+                seen.add(pnr)
+            if not pdf_path:
+                missing.append((pnr, "no PDF downloaded"))
+                continue
+            # File reads and compression run off the event loop
+            reason = await asyncio.to_thread(_add_file, archive, f"{pnr}.pdf", pdf_path)
+            if reason:
+                missing.append((pnr, reason))
+            yield sink.take()
+    if pnrs is not None:
+        missing.extend((pnr, "no invoice") for pnr in pnrs if pnr not in seen)
+    if missing:
+        archive.writestr(MISSING_MEMBER, "".join(f"{pnr}\t{reason}\n" for pnr, reason in missing))
+    archive.close()
+    yield sink.take()
@@ -0,0 +1,85 @@
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+from sqlalchemy import Row, insert, select, update
+from sqlalchemy.orm import Session
+
+from db.models import Invoice, Passenger
+from services import summary
+
+# Keeps IN lists and multi-row statements well under SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+INVOICE_FIELDS = ("invoice_number", "invoice_date", "airline", "amount", "gstin", "passenger_name")
+
+
+def chunked(items: Sequence, size: int = CHUNK_SIZE) -> Iterator[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ids_by_pnr_query(model, pnrs: Sequence[str]):
+    return select(model.id, model.pnr).where(model.pnr.in_(pnrs)).order_by(model.id)
+
+
+def existing_ids_by_pnr(db: Session, model, pnrs: Iterable[str]) -> Dict[str, int]:
+    """Map PNR -> primary key for rows that already exist, using chunked IN queries."""
+    found: Dict[str, int] = {}
+    for chunk in chunked(list(pnrs)):
+        for row_id, pnr in db.execute(ids_by_pnr_query(model, chunk)):
+            # Keep the oldest row when a PNR is duplicated, like .first() did
+            found.setdefault(pnr, row_id)
+    return found
+
+
+def existing_invoices_by_pnr(db: Session, pnrs: Iterable[str]) -> Dict[str, Row]:
+    """Map PNR -> (id, airline, amount, flag_for_review) of stored invoices, using chunked IN queries."""
+    found: Dict[str, Row] = {}
+    columns = (Invoice.id, Invoice.pnr, Invoice.airline, Invoice.amount, Invoice.flag_for_review)
+    for chunk in chunked(list(pnrs)):
+        for row in db.execute(select(*columns).where(Invoice.pnr.in_(chunk)).order_by(Invoice.id)):
+            found.setdefault(row.pnr, row)
+    return found
+
+
+def upsert_invoices(db: Session, rows: Dict[str, Dict]) -> int:
+    """Insert or update invoices keyed by PNR in one transaction (the caller commits).
+
+    `rows` maps PNR -> the fields to set; fields absent from a row are left untouched
+    on existing invoices. The airline summary is updated in the same transaction.
+    """
+    existing = existing_invoices_by_pnr(db, rows)
+    inserts: List[Dict] = []
+    updates: List[Dict] = []
+    changes = []
+    for pnr, fields in rows.items():
+        current = existing.get(pnr)
+        if current is not None:
+            if fields:
+                updates.append({"id": current.id, **fields})
+                changes.append((
+                    summary.contribution(current.airline, current.amount, current.flag_for_review),
+                    summary.contribution(fields.get("airline", current.airline), fields.get("amount", current.amount), current.flag_for_review),
+                ))
+        else:
+            inserts.append({"pnr": pnr, **{f: fields.get(f) for f in INVOICE_FIELDS}})
+            changes.append((None, summary.contribution(fields.get("airline"), fields.get("amount"), False)))
+    for chunk in chunked(inserts):
+        db.execute(insert(Invoice), list(chunk))
+    for chunk in chunked(updates):
+        # ORM bulk UPDATE by primary key, grouped into executemany batches per key set
+        db.execute(update(Invoice), list(chunk))
+    summary.apply_changes(db, changes)
+    return len(rows)
+
+
+def insert_new_passengers(db: Session, rows: Dict[str, str]) -> List[Row]:
+    """Insert passengers whose PNR is not stored yet; `rows` maps PNR -> name. Returns the new rows."""
+    existing = existing_ids_by_pnr(db, Passenger, rows)
+    new_rows = [{"pnr": pnr, "name": name} for pnr, name in rows.items() if pnr not in existing]
+    table = Passenger.__table__
+    # Core insert: ORM RETURNING would build an identity-mapped object per row
+    stmt = insert(table).returning(table.c.id, table.c.name, table.c.pnr, table.c.download_status, table.c.parse_status)
+    created: List[Row] = []
+    for chunk in chunked(new_rows):
+        created.extend(db.execute(stmt, list(chunk)).all())
+    return created
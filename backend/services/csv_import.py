@@ -0,0 +1,247 @@
+"""Streaming passenger import from CSV uploads such as data.csv.
+
+The upload is read in fixed-size chunks and split into records as it arrives, so only
+one batch of rows is held in memory regardless of file size. Each batch is inserted
+and committed on its own; blank rows are skipped and malformed rows are reported one
+physical line at a time, so a stray quote cannot swallow the rest of the file.
+"""
+import codecs
+import csv
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+from services import events
+from services.bulk import insert_new_passengers
+
+READ_CHUNK_SIZE = 1 << 20
+# Bounds on a record whose quoted field spans lines; past them its first line is rejected
+MAX_RECORD_LINES = 100
+MAX_RECORD_CHARS = 64 * 1024
+
+# Accepted header names (lower-cased) for each column
+HEADER_ALIASES = {
+    "pnr": ("ticket number", "ticket", "pnr"),
+    "first_name": ("first name", "firstname"),
+    "last_name": ("last name", "lastname", "surname"),
+    "name": ("name", "passenger name"),
+}
+
+
+class CsvImportError(ValueError):
+    """The upload cannot be imported at all (e.g. no usable header)."""
+
+
+class ImportReport:
+    def __init__(self, max_rejects: int):
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.blank = 0
+        self.rejected = 0
+        self.batches = 0
+        self.max_rejects = max_rejects
+        self.rejects: List[Dict] = []
+
+    def reject(self, line: int, reason: str, raw: str):
+        self.rejected += 1
+        # Only the first rejects are kept so the report stays small for huge files
+        if len(self.rejects) < self.max_rejects:
+            self.rejects.append({"line": line, "reason": reason, "row": raw[:200]})
+
+    def to_dict(self) -> Dict:
+        return {
+            "message": f"Imported {self.imported} new passengers from {self.rows} rows",
+            "rows": self.rows,
+            "imported": self.imported,
+            "duplicates": self.duplicates,
+            "blank": self.blank,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "rejects": self.rejects,
+            "rejects_truncated": self.rejected > len(self.rejects),
+        }
+
+
+def _in_quotes(line: str, in_quotes: bool) -> bool:
+    """Whether a quoted field is still open after `line`, given whether one was open before it.
+
+    Only a quote at the start of a field opens one, as in the csv module; a stray quote
+    inside an unquoted field is literal text.
+    """
+    if not in_quotes and '"' not in line:
+        return False
+    field_start = not in_quotes
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if in_quotes:
+            if c == '"':
+                if line[i + 1:i + 2] == '"':
+                    i += 2
+                    continue
+                in_quotes = False
+        elif c == '"' and field_start:
+            in_quotes = True
+        field_start = c == "," and not in_quotes
+        i += 1
+    return in_quotes
+
+
+async def _iter_lines(upload: UploadFile, chunk_size: int) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    while True:
+        chunk = await upload.read(chunk_size)
+        lines = (pending + decoder.decode(chunk, final=not chunk)).split("\n")
+        # Keep a trailing partial line for the next chunk; at EOF it is the last line
+        pending = lines.pop() if chunk else ""
+        if lines == [""]:
+            lines = []
+        for line in lines:
+            yield line
+        if not chunk:
+            break
+
+
+async def iter_records(upload: UploadFile, chunk_size: int = READ_CHUNK_SIZE
+                       ) -> AsyncIterator[Tuple[int, str, Optional[List[str]], Optional[str]]]:
+    """Yield (first line number, record text, fields, error) per CSV record, reading the upload in chunks.
+
+    A quoted field may contain newlines, so physical lines are joined until the quoted
+    field closes, up to MAX_RECORD_LINES lines or MAX_RECORD_CHARS characters. A record
+    that overflows or fails to parse is rejected as its first physical line alone
+    (fields None, error set) and reading resumes at the next line.
+    """
+    lines = _iter_lines(upload, chunk_size)
+    replay: deque = deque()  # (line number, line) read past a rejected line
+    record: List[Tuple[int, str]] = []
+    size = 0
+    in_quotes = False
+    line_no = 0
+    eof = False
+    while True:
+        line = None
+        if replay:
+            number, line = replay.popleft()
+        elif not eof:
+            line = await anext(lines, None)
+            eof = line is None
+            if line is not None:
+                line_no += 1
+                number = line_no
+        if line is not None:
+            record.append((number, line))
+            size += len(line)
+            in_quotes = _in_quotes(line, in_quotes)
+            if in_quotes and len(record) < MAX_RECORD_LINES and size < MAX_RECORD_CHARS:
+                continue
+        elif not record:
+            break
+        error = "unterminated quoted field" if in_quotes else None
+        raw = "\n".join(text for _, text in record).rstrip("\r")
+        fields = None
+        if error is None:
+            try:
+                fields = next(csv.reader([raw]), [])
+            except csv.Error as e:
+                error = f"unparseable row: {e}"
+        if error is not None and len(record) > 1:
+            replay.extendleft(reversed(record[1:]))
+            raw = record[0][1].rstrip("\r")
+        yield record[0][0], raw, fields, error
+        record = []
+        size = 0
+        in_quotes = False
+
+
+def _columns(header: List[str]) -> Dict[str, int]:
+    names = [h.strip().lower() for h in header]
+    columns = {}
+    for key, aliases in HEADER_ALIASES.items():
+        for alias in aliases:
+            if alias in names:
+                columns[key] = names.index(alias)
+                break
+    if "pnr" not in columns or not ("name" in columns or "first_name" in columns):
+        raise CsvImportError(
+            "CSV header must have a ticket number/PNR column and a name or first/last name columns"
+        )
+    return columns
+
+
+def _passenger(fields: List[str], columns: Dict[str, int]) -> Tuple[str, str]:
+    """(pnr, name) for a data row; raises ValueError with the reject reason."""
+    def field(key: str) -> str:
+        index = columns.get(key)
+        return fields[index].strip() if index is not None and index < len(fields) else ""
+
+    if len(fields) <= columns["pnr"]:
+        raise ValueError(f"expected at least {columns['pnr'] + 1} columns, got {len(fields)}")
+    pnr = field("pnr")
+    if "name" in columns:
+        name = field("name")
+    else:
+        name = " ".join(part for part in (field("first_name"), field("last_name")) if part)
+    if not pnr:
+        raise ValueError("missing ticket number")
+    if any(c.isspace() for c in pnr):
+        raise ValueError("ticket number contains whitespace")
+    if not name:
+        raise ValueError("missing passenger name")
+    return pnr, name
+
+
+async def import_passengers(db: AsyncSession, upload: UploadFile,
+                            batch_size: int = config.CSV_IMPORT_BATCH_SIZE) -> ImportReport:
+    """Create passengers from a CSV upload, committing every `batch_size` accepted rows."""
+    report = ImportReport(config.CSV_IMPORT_MAX_REJECTS)
+    columns: Optional[Dict[str, int]] = None
+    batch: Dict[str, str] = {}
+    duplicates_in_batch = 0
+
+    async def flush():
+        nonlocal batch, duplicates_in_batch
+        if batch:
+            created = await db.run_sync(insert_new_passengers, batch)
+            if created:
+                events.emit(db, "passengers_created", {"count": len(created)})
+            await db.commit()
+            report.imported += len(created)
+            report.duplicates += duplicates_in_batch + len(batch) - len(created)
+            report.batches += 1
+        batch = {}
+        duplicates_in_batch = 0
+
+    async for line_no, raw, fields, error in iter_records(upload):
+        if error is None and not raw.replace(",", "").strip():
+            if columns is not None:
+                report.blank += 1
+            continue
+        if error is not None:
+            report.rows += 1
+            report.reject(line_no, error, raw)
+            continue
+        if columns is None:
+            columns = _columns(fields)
+            continue
+        report.rows += 1
+        try:
+            pnr, name = _passenger(fields, columns)
+        except ValueError as e:
+            report.reject(line_no, str(e), raw)
+            continue
+        # First occurrence of a ticket number wins, as in /passengers/bulk
+        if pnr in batch:
+            duplicates_in_batch += 1
+            continue
+        batch[pnr] = name
+        if len(batch) >= batch_size:
+            await flush()
+    if columns is None:
+        raise CsvImportError("CSV file is empty")
+    await flush()
+    return report
@@ -1,30 +1,32 @@
+import asyncio
 import os
 import random
 import time
 from datetime import datetime
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-import aiofiles
+from typing import Dict, List, Optional, Set, Tuple
+
+import config
+from services.executor import run_cpu
+from services.metadata_store import MetadataStore, metadata_store
+from services import metrics, storage
 
 class InvoiceDownloader:
-    def __init__(self):
+    def __init__(self, metadata: Optional[MetadataStore] = None):
         # Save PDFs under project-level invoices directory
-        self.invoices_dir = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "invoices"))
+        self.invoices_dir = config.INVOICES_DIR
         os.makedirs(self.invoices_dir, exist_ok=True)
         
         # Mock airline data for simulation
         self.airlines = ["Air India", "IndiGo", "SpiceJet", "Vistara", "AirAsia", "Thai Airways"]
         self.airline_codes = {"Air India": "AI", "IndiGo": "6E", "SpiceJet": "SG", "Vistara": "UK", "AirAsia": "I5", "Thai Airways": "TG"}
-        # metadata_store: optional map pnr -> dict with fields
-        self.metadata_store = {}
+        # Seeded fields per PNR, shared by all API processes through the database
+        self.metadata = metadata or metadata_store
+        self.renderer = RenderBatcher(self.invoices_dir)
         
     async def download_invoice(self, pnr: str, passenger_name: str):
         """Generate a mock PDF using seeded metadata when available."""
         try:
-            await asyncio.sleep(0.2)
+            await asyncio.sleep(config.MOCK_DOWNLOAD_DELAY_MS / 1000)
             pdf_path = await self._generate_mock_pdf(pnr, passenger_name)
             return {"status": "Success", "message": f"Invoice downloaded successfully for PNR: {pnr}", "pdf_path": pdf_path}
         except Exception as e:
@@ -32,7 +34,15 @@ class InvoiceDownloader:
     
     async def _generate_mock_pdf(self, pnr: str, passenger_name: str):
         """Generate a mock PDF invoice"""
-        meta = self.metadata_store.get(pnr, {})
+        with metrics.stage("downloader", "metadata"):
+            meta = await self.metadata.get(pnr) or {}
+        fields = self._invoice_fields(pnr, passenger_name, meta)
+        # Rendering and hashing are CPU-bound, so they run in the process pool
+        with metrics.stage("downloader", "render"):
+            return await self.renderer.render(fields)
+
+    def _invoice_fields(self, pnr: str, passenger_name: str, meta: Dict) -> Dict:
+        """The values printed on the invoice, seeded where available."""
         airline = meta.get('Airline') or random.choice(self.airlines)
         airline_code = self.airline_codes.get(airline, 'TG')
         invoice_number = meta.get('Invoice Number') or f"INV-{airline_code}-{random.randint(10000, 99999)}"
@@ -41,35 +51,45 @@ class InvoiceDownloader:
         invoice_date = meta.get('Date') or datetime.now().strftime('%Y-%m-%d')
         passenger_display = meta.get('Name') or passenger_name
         
-        # Create PDF filename
-        filename = f"invoice_{pnr}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        pdf_path = os.path.join(self.invoices_dir, filename)
-        
-        # Generate PDF content
-        doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Title
-        title = Paragraph(f"INVOICE - {airline}", styles['Title'])
-        story.append(title)
-        story.append(Paragraph("<br/>", styles['Normal']))
-        
-        # Invoice details
-        data = [
-            ['Invoice Number:', invoice_number],
-            ['Date:', invoice_date],
-            ['Passenger Name:', passenger_display],
-            ['PNR:', pnr],
-            ['Airline:', airline],
-            ['Amount:', f"₹{float(amount):,.2f}"],
-        ]
-        
-        if gstin:
-            data.append(['GSTIN:', gstin])
-        
-        table = Table(data, colWidths=[140, 320])
-        table.setStyle(TableStyle([
+        return {
+            "invoice_number": invoice_number,
+            "invoice_date": invoice_date,
+            "passenger_name": passenger_display,
+            "pnr": pnr,
+            "airline": airline,
+            "amount": amount,
+            "gstin": gstin,
+        }
+
+
+def _invoice_rows(fields: dict) -> List[List[str]]:
+    rows = [
+        ['Invoice Number:', fields['invoice_number']],
+        ['Date:', fields['invoice_date']],
+        ['Passenger Name:', fields['passenger_name']],
+        ['PNR:', fields['pnr']],
+        ['Airline:', fields['airline']],
+        ['Amount:', f"₹{float(fields['amount']):,.2f}"],
+    ]
+    if fields.get('gstin'):
+        rows.append(['GSTIN:', fields['gstin']])
+    return rows
+
+
+# reportlab is imported on first render: it is a sizeable share of API startup and
+# only the worker processes render
+_platypus = None
+
+
+def _platypus_parts():
+    """(stylesheet, table style) for render_invoice_pdf, built once per process."""
+    global _platypus
+    if _platypus is None:
+        from reportlab.lib import colors
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import TableStyle
+
+        table_style = TableStyle([
             ('BACKGROUND', (0, 0), (0, -1), colors.grey),
             ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
@@ -78,12 +98,255 @@ class InvoiceDownloader:
             ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
             ('BACKGROUND', (1, 0), (1, -1), colors.beige),
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        story.append(table)
-        doc.build(story)
-        
-        return pdf_path
+        ])
+        _platypus = (getSampleStyleSheet(), table_style)
+    return _platypus
+
+
+def render_invoice_pdf(pdf_path: str, fields: dict):
+    """Render an invoice PDF to pdf_path with platypus. Module-level so it can run in a worker process."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Table
+
+    styles, table_style = _platypus_parts()
+    # invariant=1 drops the creation time and random document ID, so identical invoices
+    # render to identical bytes and are deduplicated by content-addressed storage
+    doc = SimpleDocTemplate(pdf_path, pagesize=letter, invariant=1)
+    story = []
+    
+    # Title
+    title = Paragraph(f"INVOICE - {fields['airline']}", styles['Title'])
+    story.append(title)
+    story.append(Paragraph("<br/>", styles['Normal']))
+    
+    # Invoice details
+    table = Table(_invoice_rows(fields), colWidths=[140, 320])
+    table.setStyle(table_style)
+    
+    story.append(table)
+    doc.build(story)
+
+
+class _InvoiceTemplate:
+    """Pre-built single-page invoice PDF that only needs the per-invoice values stamped in.
+
+    The layout matches render_invoice_pdf: a centred 18pt title, then a two-column table
+    of 27pt rows (12pt bold text, 6pt left and 12pt bottom padding) with a grey label
+    column and a beige value column. Every object except the page content stream is
+    fixed, and the drawing operators for the backgrounds, grid and labels are built once
+    per row count, so rendering is string formatting plus one file write.
+    """
+
+    PAGE_WIDTH, PAGE_HEIGHT = 612.0, 792.0  # reportlab.lib.pagesizes.letter
+    TOP = PAGE_HEIGHT - 72 - 6  # top margin + frame padding
+    TITLE_BASELINE = TOP - 18
+    COL_WIDTHS = (140, 320)
+    TABLE_X = (PAGE_WIDTH - sum(COL_WIDTHS)) / 2
+    TABLE_TOP = TOP - 22 - 6 - 12  # title leading + spaceAfter + blank line
+    ROW_HEIGHT = 27
+    TEXT_INSET_X = 6
+    TEXT_INSET_Y = 12 + 3  # bottom padding + descent
+    FONT = 'Helvetica-Bold'
+
+    def __init__(self):
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+
+        self._string_width = stringWidth
+        self.value_x = self.TABLE_X + self.COL_WIDTHS[0]
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents 5 0 R"
+            b" /Resources << /Font << /F1 4 0 R >> /ProcSet [/PDF /Text] >> >>" % (self.PAGE_WIDTH, self.PAGE_HEIGHT),
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % self.FONT.encode(),
+        ]
+        # The content stream is object 5 and comes last, so every other offset is fixed
+        head = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.offsets = []
+        for number, body in enumerate(objects, start=1):
+            self.offsets.append(len(head))
+            head += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        self.head = bytes(head)
+        self._static: Dict[Tuple[str, ...], Tuple[bytes, List[bytes]]] = {}
+
+    @staticmethod
+    def _pdf_string(value: str) -> bytes:
+        # WinAnsi covers the invoice text; anything else (e.g. the rupee sign) becomes '?'
+        raw = value.encode('cp1252', errors='replace')
+        return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+    def _static_ops(self, labels: Tuple[str, ...]) -> Tuple[bytes, List[bytes]]:
+        """Backgrounds and grid, plus per row the operators that draw its label and
+        position the value, for a table with these row labels."""
+        ops = self._static.get(labels)
+        if ops is not None:
+            return ops
+        rows = len(labels)
+        bottom = self.TABLE_TOP - self.ROW_HEIGHT * rows
+        height = self.ROW_HEIGHT * rows
+        right = self.value_x + self.COL_WIDTHS[1]
+        lines = [
+            "0.501961 g %.2f %.2f %d %d re f" % (self.TABLE_X, bottom, self.COL_WIDTHS[0], height),
+            "0.960784 0.960784 0.862745 rg %.2f %.2f %d %d re f" % (self.value_x, bottom, self.COL_WIDTHS[1], height),
+            "0 G 1 w",
+        ]
+        for i in range(rows + 1):
+            y = self.TABLE_TOP - self.ROW_HEIGHT * i
+            lines.append("%.2f %.2f m %.2f %.2f l S" % (self.TABLE_X, y, right, y))
+        for x in (self.TABLE_X, self.value_x, right):
+            lines.append("%.2f %.2f m %.2f %.2f l S" % (x, bottom, x, self.TABLE_TOP))
+        graphics = ("\n".join(lines) + "\n").encode('latin-1')
+        # Cells are written row by row so text extraction sees each label before its value
+        row_ops = []
+        for i, label in enumerate(labels):
+            y = self.TABLE_TOP - self.ROW_HEIGHT * (i + 1) + self.TEXT_INSET_Y
+            row_ops.append(
+                b"0.960784 0.960784 0.960784 rg 1 0 0 1 %.2f %.2f Tm %s Tj\n0 g 1 0 0 1 %.2f %.2f Tm "
+                % (self.TABLE_X + self.TEXT_INSET_X, y, self._pdf_string(label), self.value_x + self.TEXT_INSET_X, y)
+            )
+        ops = (graphics, row_ops)
+        self._static[labels] = ops
+        return ops
+
+    def render(self, fields: dict) -> bytes:
+        rows = _invoice_rows(fields)
+        graphics, row_ops = self._static_ops(tuple(label for label, _ in rows))
+        title = f"INVOICE - {fields['airline']}"
+        title_x = (self.PAGE_WIDTH - self._string_width(title, self.FONT, 18)) / 2
+        content = bytearray(graphics)
+        content += b"BT /F1 18 Tf 0 g 1 0 0 1 %.2f %.2f Tm %s Tj\n/F1 12 Tf\n" % (
+            title_x, self.TITLE_BASELINE, self._pdf_string(title))
+        for ops, (_, value) in zip(row_ops, rows):
+            content += ops + self._pdf_string(str(value)) + b" Tj\n"
+        content += b"ET"
+        out = bytearray(self.head)
+        offsets = self.offsets + [len(out)]
+        out += b"5 0 obj\n<< /Length %d >>\nstream\n%s\nendstream\nendobj\n" % (len(content), content)
+        xref = len(out)
+        out += b"xref\n0 6\n0000000000 65535 f \n"
+        out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        out += b"trailer\n<< /Size 6 /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % xref
+        return bytes(out)
+
+
+_template: Optional[_InvoiceTemplate] = None
+
+
+def render_invoice_pdf_fast(pdf_path: str, fields: dict):
+    """Stamp the invoice values into the pre-built template; many times faster than platypus."""
+    global _template
+    if _template is None:
+        _template = _InvoiceTemplate()
+    with open(pdf_path, 'wb') as f:
+        f.write(_template.render(fields))
+
+
+RENDERERS = {
+    "fast": render_invoice_pdf_fast,
+    "platypus": render_invoice_pdf,
+}
+
+
+def render_invoice_batch(jobs: List[Tuple[str, dict]], mode: str = "fast") -> int:
+    """Render many (pdf_path, fields) invoices in one worker call. Returns the number rendered."""
+    render = RENDERERS[mode]
+    for pdf_path, fields in jobs:
+        render(pdf_path, fields)
+    return len(jobs)
 
-# Import asyncio for async operations
-import asyncio 
\ No newline at end of file
+
+def render_invoice_stored(root: str, fields: dict, mode: str = "fast") -> str:
+    """Render an invoice into content-addressed storage under root and return its path."""
+    path = storage.tmp_path(root)
+    try:
+        RENDERERS[mode](path, fields)
+        return storage.store_file(root, path)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+
+def store_invoice_batch(root: str, jobs: List[dict], mode: str = "fast") -> List[str]:
+    """Render many invoices into storage in one worker call; returns their paths in order."""
+    return [render_invoice_stored(root, fields, mode) for fields in jobs]
+
+
+class RenderBatcher:
+    """Coalesces concurrent invoice renders into store_invoice_batch calls.
+
+    At most `max_inflight` worker calls run at once (one per CPU worker). A render
+    requested while a slot is free goes out on its own; renders requested while every
+    slot is busy, as in batch jobs and queue workers, wait and leave together, up to
+    `batch_size` per call, so process pool round trips are shared. If a batch fails,
+    its invoices are rendered one by one so only the bad ones fail.
+    """
+
+    def __init__(self, root: str, batch_size: int = config.PDF_RENDER_BATCH_SIZE,
+                 max_inflight: int = max(config.CPU_WORKERS, 1), mode: Optional[str] = None):
+        self.root = root
+        self.batch_size = max(batch_size, 1)
+        self.max_inflight = max_inflight
+        self.mode = mode or config.PDF_RENDER_MODE
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._inflight = 0
+        # The event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def render(self, fields: dict) -> str:
+        """Render one invoice into storage and return its path."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((fields, future))
+        self._dispatch()
+        return await future
+
+    def _dispatch(self):
+        while self._pending and self._inflight < self.max_inflight:
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            # Requests whose caller gave up are dropped
+            batch = [(fields, future) for fields, future in batch if not future.done()]
+            if batch:
+                self._inflight += 1
+                task = asyncio.ensure_future(self._run(batch))
+                self._tasks.add(task)
+                task.add_done_callback(lambda task, batch=batch: self._finished(task, batch))
+
+    def _finished(self, task: asyncio.Task, batch: List[Tuple[dict, asyncio.Future]]):
+        # Runs even when the task was cancelled before it started
+        self._tasks.discard(task)
+        self._inflight -= 1
+        for _, future in batch:
+            future.cancel()
+        self._dispatch()
+
+    async def close(self):
+        """Cancel queued and running renders; their callers get CancelledError."""
+        for _, future in self._pending:
+            future.cancel()
+        self._pending = []
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, batch: List[Tuple[dict, asyncio.Future]]):
+        try:
+            paths = await run_cpu(store_invoice_batch, self.root, [fields for fields, _ in batch], self.mode)
+            results = list(zip(batch, paths))
+        except Exception as e:
+            if len(batch) == 1:
+                results = [(batch[0], e)]
+            else:
+                results = []
+                for item in batch:
+                    try:
+                        results.append((item, await run_cpu(render_invoice_stored, self.root, item[0], self.mode)))
+                    except Exception as single:
+                        results.append((item, single))
+        for (_, future), result in results:
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
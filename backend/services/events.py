@@ -0,0 +1,123 @@
+"""In-process broadcaster pushing status deltas to dashboards over server-sent events.
+
+Writers record events on their session with `emit`; they are published only once the
+session commits, so dashboards never see a change that was rolled back. Every
+subscriber has a bounded queue: publishing never waits, and a subscriber that falls
+`max_queue` events behind has its backlog dropped and receives a single "resync"
+event instead, telling it to refetch. Events reach subscribers of this process only.
+
+Event types:
+  passengers          {"pnrs": [...], "download_status"?, "parse_status"?}
+  passengers_created  {"count": n}            new rows after the client's last id
+  invoice             an InvoiceResponse for a created or changed invoice
+  summary             {"airlines": [...]}     airline summary rows changed
+  resync              {"lists": [...]}        refetch these lists
+"""
+import asyncio
+import json
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import config
+
+ALL_LISTS = ["passengers", "invoices", "summary"]
+_PENDING = "pending_events"
+
+
+class Subscription:
+    def __init__(self, max_queue: int):
+        self._events: deque = deque()
+        self._max_queue = max_queue
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def _deliver(self, message: Dict):
+        if len(self._events) >= self._max_queue:
+            # Too far behind: a full refetch is cheaper than replaying the backlog
+            self.dropped += len(self._events)
+            self._events.clear()
+            message = {"type": "resync", "data": {"lists": ALL_LISTS}}
+        self._events.append(message)
+        self._ready.set()
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """The next event, or None if `timeout` seconds pass without one."""
+        if not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._events.popleft()
+
+
+class Broadcaster:
+    def __init__(self, max_queue: int = config.EVENTS_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(self.max_queue)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def publish(self, messages: List[Dict]):
+        if not self._subscribers or not messages:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._fan_out(messages)
+        elif self._loop is not None and not self._loop.is_closed():
+            # Committed from a worker thread
+            self._loop.call_soon_threadsafe(self._fan_out, messages)
+
+    def _fan_out(self, messages: List[Dict]):
+        for subscription in list(self._subscribers):
+            for message in messages:
+                subscription._deliver(message)
+
+
+broadcaster = Broadcaster()
+
+
+def emit(db, type: str, data: Dict):
+    """Queue an event on a Session or AsyncSession; it is published when the session commits."""
+    if broadcaster.subscribers:
+        db.info.setdefault(_PENDING, []).append({"type": type, "data": data})
+
+
+def emit_statuses(db, pnrs: List[str], **statuses: str):
+    """A passengers event for PNRs whose download_status/parse_status changed."""
+    if pnrs:
+        emit(db, "passengers", {"pnrs": list(pnrs), **statuses})
+
+
+def format_sse(message: Dict) -> str:
+    return f"event: {message['type']}\ndata: {json.dumps(message['data'], default=str)}\n\n"
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session):
+    pending = session.info.pop(_PENDING, None)
+    if pending:
+        broadcaster.publish(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session):
+    session.info.pop(_PENDING, None)
@@ -0,0 +1,36 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Optional
+
+import config
+
+_executor: Optional[Executor] = None
+
+
+def get_executor() -> Optional[Executor]:
+    """Return the shared process pool, creating it on first use.
+
+    Returns None when CPU_WORKERS is 0, in which case work runs on the loop's
+    default thread pool.
+    """
+    global _executor
+    if _executor is None and config.CPU_WORKERS > 0:
+        _executor = ProcessPoolExecutor(max_workers=config.CPU_WORKERS)
+    return _executor
+
+
+async def run_cpu(fn: Callable, *args, **kwargs):
+    """Run a CPU-bound callable off the event loop and await its result.
+
+    `fn` and its arguments must be picklable (module-level functions and plain data).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), partial(fn, *args, **kwargs))
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,151 @@
+"""Bulk invoice export as CSV or Parquet, streamed straight from a database cursor.
+
+Only the exported columns are selected (raw_text on request) and rows are fetched
+`batch_size` at a time, so memory stays bounded by one chunk whatever the row count.
+Parquet needs the optional pyarrow package; each chunk becomes one row group.
+"""
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterator, List, Sequence
+
+from sqlalchemy import Select
+
+import config
+from db.models import AsyncSessionLocal, Invoice
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+COLUMNS = [
+    Invoice.id, Invoice.pnr, Invoice.invoice_number, Invoice.invoice_date, Invoice.airline,
+    Invoice.amount, Invoice.gstin, Invoice.flag_for_review, Invoice.flag_source, Invoice.review_reasons,
+    Invoice.pdf_path, Invoice.created_at, Invoice.updated_at,
+]
+
+
+class ExportError(ValueError):
+    """The requested export cannot be produced (unknown format, missing dependency)."""
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def columns(include_raw_text: bool = False) -> List:
+    return COLUMNS + [Invoice.raw_text] if include_raw_text else list(COLUMNS)
+
+
+def check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown export format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    if fmt == "parquet" and not parquet_available():
+        raise ExportError("Parquet export needs the optional pyarrow package (pip install pyarrow)")
+
+
+async def _chunks(query: Select, batch_size: int) -> AsyncIterator[Sequence]:
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            yield rows
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def csv_chunks(query: Select, names: List[str], batch_size: int = config.EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    yield buffer.getvalue().encode()
+    async for rows in _chunks(query, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(v) for v in row] for row in rows)
+        yield buffer.getvalue().encode()
+
+
+class _Drain:
+    """Write-only file for ParquetWriter whose bytes are taken out after every row group.
+
+    The writer records absolute offsets in the footer, so tell() keeps counting
+    what has been handed out rather than what is still buffered.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _parquet_schema(pa, include_raw_text: bool):
+    fields = [
+        ("id", pa.int64()), ("pnr", pa.string()), ("invoice_number", pa.string()),
+        ("invoice_date", pa.timestamp("us")), ("airline", pa.string()), ("amount", pa.float64()),
+        ("gstin", pa.string()), ("flag_for_review", pa.bool_()), ("flag_source", pa.string()),
+        ("review_reasons", pa.string()), ("pdf_path", pa.string()),
+        ("created_at", pa.timestamp("us")), ("updated_at", pa.timestamp("us")),
+    ]
+    if include_raw_text:
+        fields.append(("raw_text", pa.string()))
+    return pa.schema(fields)
+
+
+async def parquet_chunks(query: Select, include_raw_text: bool = False,
+                         batch_size: int = config.EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(pa, include_raw_text)
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        async for rows in _chunks(query, batch_size):
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def export_invoices(query: Select, fmt: str, include_raw_text: bool = False,
+                    batch_size: int = config.EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Byte chunks of the export of `query`'s invoices (a select() of Invoice with filters applied)."""
+    check_format(fmt)
+    selected = columns(include_raw_text)
+    query = query.with_only_columns(*selected).order_by(Invoice.id)
+    if fmt == "parquet":
+        return parquet_chunks(query, include_raw_text, batch_size)
+    return csv_chunks(query, [c.key for c in selected], batch_size)
@@ -0,0 +1,103 @@
+import asyncio
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import config
+
+
+class BatchJob:
+    """Progress and per-PNR results of one batch download/parse job."""
+
+    def __init__(self, pnrs: List[str], concurrency: int):
+        self.id = uuid.uuid4().hex
+        self.pnrs = pnrs
+        self.concurrency = concurrency
+        self.status = "Queued"  # Queued, Running, Completed
+        self.completed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.results: Dict[str, Dict] = {}
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+
+    def to_dict(self, include_results: bool = True) -> Dict:
+        out = {
+            "job_id": self.id,
+            "status": self.status,
+            "total": len(self.pnrs),
+            "completed": self.completed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "concurrency": self.concurrency,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if include_results:
+            out["results"] = self.results
+        return out
+
+
+class JobManager:
+    """Runs batch jobs in the background on the event loop with bounded concurrency.
+
+    `worker` is an async callable taking a PNR and returning a result dict with a
+    "status" key; anything other than "Success" counts as a failure.
+    """
+
+    def __init__(self, history_limit: int = config.JOB_HISTORY_LIMIT):
+        self.jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+        self.history_limit = history_limit
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def submit(self, pnrs: List[str], worker: Callable[[str], Awaitable[Dict]], concurrency: Optional[int] = None) -> BatchJob:
+        width = concurrency or config.JOB_CONCURRENCY
+        width = max(1, min(width, config.JOB_MAX_CONCURRENCY))
+        # Preserve order but process each PNR only once
+        job = BatchJob(list(dict.fromkeys(pnrs)), width)
+        self.jobs[job.id] = job
+        self._prune()
+        self._tasks[job.id] = asyncio.create_task(self._run(job, worker))
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        return self.jobs.get(job_id)
+
+    async def _run(self, job: BatchJob, worker: Callable[[str], Awaitable[Dict]]):
+        job.status = "Running"
+        queue: asyncio.Queue = asyncio.Queue()
+        for pnr in job.pnrs:
+            queue.put_nowait(pnr)
+
+        async def consume():
+            while True:
+                try:
+                    pnr = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    result = await worker(pnr)
+                except Exception as e:
+                    result = {"status": "Error", "message": str(e)}
+                job.results[pnr] = result
+                job.completed += 1
+                if result.get("status") == "Success":
+                    job.succeeded += 1
+                else:
+                    job.failed += 1
+
+        try:
+            await asyncio.gather(*(consume() for _ in range(min(job.concurrency, len(job.pnrs)) or 1)))
+        finally:
+            job.status = "Completed"
+            job.finished_at = datetime.utcnow()
+            self._tasks.pop(job.id, None)
+
+    def _prune(self):
+        # Drop the oldest finished jobs once the history limit is exceeded
+        while len(self.jobs) > self.history_limit:
+            oldest_id = next((jid for jid, j in self.jobs.items() if j.status == "Completed"), None)
+            if oldest_id is None:
+                break
+            del self.jobs[oldest_id]
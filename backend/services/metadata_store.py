@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+import config
+from db.models import AsyncSessionLocal, SeedMetadata
+from services.bulk import chunked
+
+# Seed item keys as used by the PDF generator -> SeedMetadata columns
+FIELD_COLUMNS = {
+    "Invoice Number": "invoice_number",
+    "Date": "date",
+    "Airline": "airline",
+    "Amount": "amount",
+    "GSTIN": "gstin",
+    "Name": "name",
+}
+
+
+def _to_metadata(row: SeedMetadata) -> Dict:
+    return {key: getattr(row, column) for key, column in FIELD_COLUMNS.items()}
+
+
+class MetadataStore:
+    """Seeded invoice metadata used by the mock downloader, keyed by PNR.
+
+    Stored in the seed_metadata table so every API process sees the same data and it
+    survives restarts; a bounded in-memory LRU sits in front. Entries are cached for at
+    most `ttl` seconds, which bounds how long a process can serve metadata that another
+    process has since re-seeded. Misses are not cached.
+    """
+
+    def __init__(self, max_entries: int = config.METADATA_CACHE_ENTRIES,
+                 ttl: float = config.METADATA_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, pnr: str) -> Optional[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(pnr)
+            if cached is not None and cached[0] > now:
+                self._entries.move_to_end(pnr)
+                return cached[1]
+        async with AsyncSessionLocal() as db:
+            row = await db.get(SeedMetadata, pnr)
+            if row is None:
+                return None
+            meta = _to_metadata(row)
+        self._remember(pnr, meta, now)
+        return meta
+
+    async def get_many(self, pnrs: List[str]) -> Dict[str, Dict]:
+        """Metadata for each seeded PNR in `pnrs`, loading cache misses with chunked IN queries."""
+        now = time.monotonic()
+        found: Dict[str, Dict] = {}
+        with self._lock:
+            for pnr in pnrs:
+                cached = self._entries.get(pnr)
+                if cached is not None and cached[0] > now:
+                    found[pnr] = cached[1]
+        missing = [pnr for pnr in dict.fromkeys(pnrs) if pnr not in found]
+        async with AsyncSessionLocal() as db:
+            for chunk in chunked(missing):
+                for row in await db.scalars(select(SeedMetadata).where(SeedMetadata.pnr.in_(chunk))):
+                    found[row.pnr] = _to_metadata(row)
+                    self._remember(row.pnr, found[row.pnr], now)
+        return found
+
+    def put_many(self, db: Session, items: Dict[str, Dict]):
+        """Replace the metadata of each PNR in `items` (seed item keys).
+
+        The caller commits and then calls `forget` so this process stops serving old copies.
+        """
+        existing = set()
+        for chunk in chunked(list(items)):
+            existing.update(db.execute(select(SeedMetadata.pnr).where(SeedMetadata.pnr.in_(chunk))).scalars())
+        now = datetime.utcnow()
+        inserts, updates = [], []
+        for pnr, meta in items.items():
+            values = {column: meta.get(key) for key, column in FIELD_COLUMNS.items()}
+            values["updated_at"] = now
+            (updates if pnr in existing else inserts).append({"pnr": pnr, **values})
+        for chunk in chunked(inserts):
+            db.execute(insert(SeedMetadata), list(chunk))
+        for chunk in chunked(updates):
+            db.execute(update(SeedMetadata), list(chunk))
+
+    def forget(self, pnrs: Iterable[str]):
+        with self._lock:
+            for pnr in pnrs:
+                self._entries.pop(pnr, None)
+
+    def clear(self, db: Session):
+        db.execute(delete(SeedMetadata))
+        self.clear_memory()
+
+    def clear_memory(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, pnr: str, meta: Dict, now: float):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[pnr] = (now + self.ttl, meta)
+            self._entries.move_to_end(pnr)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+metadata_store = MetadataStore()
@@ -0,0 +1,271 @@
+"""In-process metrics in the Prometheus text format, plus an opt-in request profiler.
+
+Instruments are plain counters and fixed-bucket histograms guarded by a lock, so
+recording costs a few microseconds and can stay on in production. Each process
+keeps its own values; PDF rendering and extraction are timed around the
+process-pool call in the API process. Database queries are counted through an
+engine event into a per-request ContextVar.
+"""
+import abc
+import asyncio
+import bisect
+import contextvars
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+import config
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abc.abstractmethod
+    def _samples(self) -> Iterator[str]:
+        """Sample lines in the exposition format."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def replace(self, values: Dict[Tuple, float]):
+        """Swap in a complete set of series, dropping label sets that no longer exist."""
+        with self._lock:
+            self._values = dict(values)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def _samples(self):
+        with self._lock:
+            snapshot = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+REGISTRY: List[_Metric] = []
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, including streamed bodies", ("method", "route"))
+REQUESTS = Counter("http_requests_total", "Requests served", ("method", "route", "status"))
+IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being served")
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "Database queries issued while serving a request", ("method", "route"), COUNT_BUCKETS)
+DB_QUERIES = Counter("db_queries_total", "Database queries issued, including background work")
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds", "Time spent in an inner stage of downloading or parsing", ("component", "stage"))
+QUEUE_TASKS = Gauge("task_queue_tasks", "Durable queue tasks by kind and state", ("kind", "state"))
+JOBS_ACTIVE = Gauge("batch_jobs_active", "Batch jobs queued or running")
+JOB_PNRS_PENDING = Gauge("batch_job_pnrs_pending", "PNRs not yet processed by active batch jobs")
+EVENT_SUBSCRIBERS = Gauge("event_subscribers", "Open /events streams")
+PARSE_CACHE = Gauge("parse_cache_lookups", "Parse cache lookups since start", ("result",))
+
+_query_count: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("query_count", default=None)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def stage(component: str, name: str):
+    """Time the enclosed block (which may await) into stage_duration_seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, component, name)
+
+
+def _count_query(*_):
+    DB_QUERIES.inc()
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def instrument_engine(engine):
+    """Count every statement executed through `engine` (pass async engines' sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _count_query)
+
+
+class Profiler:
+    """Profiles a random sample of requests with cProfile and dumps one .prof file per request.
+
+    cProfile follows the event loop thread, so a dump also contains whatever other
+    requests ran while it was recording; only one request is profiled at a time.
+    """
+
+    def __init__(self, sample_rate: float = config.PROFILE_SAMPLE_RATE, directory: str = config.PROFILE_DIR,
+                 keep: int = config.PROFILE_KEEP):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.dumps: deque = deque(maxlen=keep)
+        self._active = False
+
+    def should_profile(self) -> bool:
+        return self.sample_rate > 0 and not self._active and random.random() < self.sample_rate
+
+    def start(self) -> cProfile.Profile:
+        self._active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    async def finish(self, profile: cProfile.Profile, method: str, route: str, seconds: float):
+        profile.disable()
+        self._active = False
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{slug}-{seconds * 1000:.0f}ms-{os.getpid()}.prof"
+        path = os.path.join(self.directory, name)
+        await asyncio.to_thread(self._dump, profile, path)
+
+    def _dump(self, profile: cProfile.Profile, path: str):
+        os.makedirs(self.directory, exist_ok=True)
+        profile.dump_stats(path)
+        if len(self.dumps) == self.dumps.maxlen:
+            try:
+                os.remove(self.dumps[0])
+            except OSError:
+                pass
+        self.dumps.append(path)
+
+    def status(self) -> Dict:
+        return {"sample_rate": self.sample_rate, "directory": self.directory, "recent": list(self.dumps)}
+
+
+profiler = Profiler()
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "other")
+    # Mounted apps (the /invoices static files) have no route object; keep the label set bounded
+    root = scope.get("root_path", "")
+    return f"{root}/{{path}}" if root else "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and DB query count per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        queries = [0]
+        token = _query_count.set(queries)
+        profile = profiler.start() if profiler.should_profile() else None
+        IN_PROGRESS.inc(amount=1)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_PROGRESS.inc(amount=-1)
+            _query_count.reset(token)
+            method, route = scope["method"], _route_label(scope)
+            REQUEST_SECONDS.observe(elapsed, method, route)
+            REQUEST_QUERIES.observe(queries[0], method, route)
+            REQUESTS.inc(method, route, str(status))
+            if profile is not None:
+                await profiler.finish(profile, method, route, elapsed)
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+import config
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from db.models import AsyncSessionLocal, ParseCacheEntry, async_engine
+from services.extraction import RULES_VERSION
+
+# Rough per-entry bookkeeping cost added to the text/JSON length when sizing the LRU
+_ENTRY_OVERHEAD = 256
+
+# INSERT constructs with ON CONFLICT support, by dialect
+_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def hash_file(pdf_path: str, chunk_size: int = 1 << 16) -> str:
+    """sha256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _dump_data(data: Dict) -> str:
+    return json.dumps({
+        k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in data.items()
+    })
+
+
+def _load_data(raw: str) -> Dict:
+    data = json.loads(raw)
+    if data.get("invoice_date"):
+        data["invoice_date"] = datetime.fromisoformat(data["invoice_date"])
+    return data
+
+
+class CachedParse:
+    """Cached extraction for one PDF content hash.
+
+    `data` is None when the stored fields were produced by a different rules version;
+    the raw text is still valid and can be re-parsed without touching the PDF.
+    """
+
+    __slots__ = ("raw_text", "rules_version", "data", "size")
+
+    def __init__(self, raw_text: Optional[str], rules_version: Optional[int], data: Optional[Dict]):
+        self.raw_text = raw_text
+        self.rules_version = rules_version
+        self.data = data if rules_version == RULES_VERSION else None
+        self.size = len(raw_text or "") + (len(_dump_data(data)) if data else 0) + _ENTRY_OVERHEAD
+
+
+class ParseCache:
+    """Two-tier parse result cache keyed by the sha256 of the PDF bytes.
+
+    An in-memory LRU bounded by total entry size sits in front of the parse_cache table.
+    """
+
+    def __init__(self, max_bytes: int = config.PARSE_CACHE_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedParse]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, content_hash: str) -> Optional[CachedParse]:
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            if entry is not None:
+                self._entries.move_to_end(content_hash)
+        if entry is None:
+            entry = await self._load(content_hash)
+            if entry is not None:
+                self._remember(content_hash, entry)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def put(self, content_hash: str, raw_text: str, data: Dict):
+        entry = CachedParse(raw_text, RULES_VERSION, data)
+        self._remember(content_hash, entry)
+        stmt = _INSERTS[async_engine.dialect.name](ParseCacheEntry).values(
+            content_hash=content_hash, raw_text=raw_text, rules_version=RULES_VERSION, data=_dump_data(data),
+        )
+        # One atomic statement, so concurrent parses of the same content cannot collide;
+        # a row already parsed under the current rules is left as is, an older one is replaced
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ParseCacheEntry.content_hash],
+            set_={"raw_text": stmt.excluded.raw_text, "rules_version": stmt.excluded.rules_version,
+                  "data": stmt.excluded.data, "updated_at": stmt.excluded.updated_at},
+            where=ParseCacheEntry.rules_version.is_distinct_from(RULES_VERSION),
+        )
+        async with AsyncSessionLocal() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+    async def invalidate(self, rules_version: Optional[int] = None) -> int:
+        """Drop parsed fields produced by `rules_version` (default: every version but the current).
+
+        Extracted text is kept, so affected invoices are re-parsed without re-reading the PDF.
+        """
+        stmt = update(ParseCacheEntry).where(ParseCacheEntry.data.isnot(None))
+        if rules_version is None:
+            stmt = stmt.where(ParseCacheEntry.rules_version != RULES_VERSION)
+        else:
+            stmt = stmt.where(ParseCacheEntry.rules_version == rules_version)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(stmt.values(data=None, rules_version=None))
+            await db.commit()
+            count = result.rowcount
+        # Memory entries only ever hold fields for the current version
+        if rules_version is not None:
+            with self._lock:
+                for entry in self._entries.values():
+                    if entry.rules_version == rules_version:
+                        entry.data = None
+                        entry.rules_version = None
+        return count
+
+    def clear_memory(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._bytes,
+                "memory_max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rules_version": RULES_VERSION,
+            }
+
+    async def _load(self, content_hash: str) -> Optional[CachedParse]:
+        async with AsyncSessionLocal() as db:
+            row = await db.get(ParseCacheEntry, content_hash)
+            if row is None:
+                return None
+            data = _load_data(row.data) if row.data else None
+            return CachedParse(row.raw_text, row.rules_version, data)
+
+    def _remember(self, content_hash: str, entry: CachedParse):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(content_hash, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[content_hash] = entry
+            self._bytes += entry.size
+            # Evict least recently used entries until under the byte budget
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+
+parse_cache = ParseCache()
@@ -0,0 +1,163 @@
+"""Download and parse steps for one PNR, shared by the API, batch jobs and queue workers.
+
+The API and standalone workers (worker.py) both import this module, so a worker gets
+the same steps and queue handlers without loading the web app.
+"""
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Invoice, Passenger
+from services import events, rules, serializers, summary, task_queue
+from services.downloader import InvoiceDownloader
+from services.parser import InvoiceParser
+
+downloader = InvoiceDownloader()
+parser = InvoiceParser()
+
+
+class PipelineError(Exception):
+    """A step cannot run for the PNR; `status_code` is the HTTP status the API answers with."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def emit_invoice(db: AsyncSession, invoice: Invoice):
+    # Events only reach subscribers in this process, so workers never build the payload
+    if events.broadcaster.subscribers:
+        events.emit(db, "invoice", serializers.invoice_payload(invoice))
+
+
+async def review_invoice(db: AsyncSession, invoice: Invoice):
+    """Apply the review rules to a changed invoice (and invoices related to it) and reload its flag"""
+    await db.flush()
+    await db.run_sync(rules.evaluate_ids, [invoice.id])
+    await db.refresh(invoice, ["flag_for_review", "flag_source", "review_reasons", "updated_at"])
+
+
+def passenger_query(pnr: str) -> Select:
+    return select(Passenger).where(Passenger.pnr == pnr).limit(1)
+
+
+def invoice_query(pnr: str) -> Select:
+    return select(Invoice).where(Invoice.pnr == pnr).limit(1)
+
+
+async def _passenger(db: AsyncSession, pnr: str) -> Passenger:
+    passenger = await db.scalar(passenger_query(pnr))
+    if not passenger:
+        raise PipelineError(f"Passenger with PNR {pnr} not found", 404)
+    return passenger
+
+
+async def run_download(pnr: str, db: AsyncSession) -> dict:
+    """Download the invoice for a PNR and record the result; `pdf_path` is the stored file"""
+    passenger = await _passenger(db, pnr)
+
+    # Update status to pending
+    passenger.download_status = "Pending"
+    events.emit_statuses(db, [pnr], download_status="Pending")
+    await db.commit()
+
+    result = await downloader.download_invoice(pnr, passenger.name)
+
+    passenger.download_status = result["status"]
+    events.emit_statuses(db, [pnr], download_status=result["status"])
+    await db.commit()
+
+    # If download successful, create or update the invoice record
+    pdf_path = None
+    if result["status"] == "Success" and result["pdf_path"]:
+        pdf_path = result["pdf_path"]
+        invoice = await db.scalar(invoice_query(pnr))
+        if not invoice:
+            invoice = Invoice(pnr=pnr, passenger_name=passenger.name, pdf_path=pdf_path)
+            db.add(invoice)
+            await db.flush()
+        else:
+            # Point the existing invoice at the latest generated PDF
+            invoice.pdf_path = pdf_path
+            if not invoice.passenger_name:
+                invoice.passenger_name = passenger.name
+        emit_invoice(db, invoice)
+        await db.commit()
+
+    return {
+        "pnr": pnr,
+        "status": result["status"],
+        "message": result["message"],
+        "pdf_path": pdf_path,
+    }
+
+
+async def run_parse(pnr: str, db: AsyncSession) -> dict:
+    """Parse the downloaded invoice for a PNR and store the fields"""
+    passenger = await _passenger(db, pnr)
+    if passenger.download_status != "Success":
+        raise PipelineError("Invoice must be downloaded successfully before parsing")
+    invoice = await db.scalar(invoice_query(pnr))
+    if not invoice or not invoice.pdf_path:
+        raise PipelineError(f"Invoice PDF not found for PNR {pnr}", 404)
+
+    # If DB already has seeded metadata (airline/amount/invoice_number/date), prefer it
+    if invoice.invoice_number or invoice.airline or invoice.amount or invoice.invoice_date:
+        passenger.parse_status = "Success"
+        events.emit_statuses(db, [pnr], parse_status="Success")
+        await db.commit()
+        return {"pnr": pnr, "status": "Success", "message": "Used seeded invoice metadata", "data": {
+            "invoice_number": invoice.invoice_number,
+            "invoice_date": invoice.invoice_date,
+            "airline": invoice.airline,
+            "amount": invoice.amount,
+            "gstin": invoice.gstin,
+        }}
+
+    # Otherwise parse the PDF
+    passenger.parse_status = "Pending"
+    events.emit_statuses(db, [pnr], parse_status="Pending")
+    await db.commit()
+    result = await parser.parse_invoice(pnr, invoice.pdf_path)
+    passenger.parse_status = result["status"]
+    events.emit_statuses(db, [pnr], parse_status=result["status"])
+    await db.commit()
+    if result["status"] == "Success" and result["data"]:
+        data = result["data"]
+        before = summary.invoice_contribution(invoice)
+        invoice.invoice_number = data["invoice_number"]
+        invoice.invoice_date = data["invoice_date"]
+        invoice.airline = data["airline"]
+        invoice.amount = data["amount"]
+        invoice.gstin = data["gstin"]
+        invoice.raw_text = result["raw_text"]
+        await db.run_sync(summary.apply_changes, [(before, summary.invoice_contribution(invoice))])
+        await review_invoice(db, invoice)
+        emit_invoice(db, invoice)
+        await db.commit()
+    return {"pnr": pnr, "status": result["status"], "message": result["message"], "data": result["data"]}
+
+
+async def download_task(pnr: str, db: AsyncSession):
+    """Queue handler: a failed download is retried with backoff"""
+    try:
+        result = await run_download(pnr, db)
+    except PipelineError as e:
+        raise task_queue.TaskError(str(e), retryable=False)
+    if result["status"] == "Not Found":
+        raise task_queue.TaskError(result["message"], retryable=False, status="Not Found")
+    if result["status"] != "Success":
+        raise task_queue.TaskError(result["message"])
+
+
+async def parse_task(pnr: str, db: AsyncSession):
+    """Queue handler: a failed parse is retried with backoff"""
+    try:
+        result = await run_parse(pnr, db)
+    except PipelineError as e:
+        raise task_queue.TaskError(str(e), retryable=False)
+    if result["status"] != "Success":
+        raise task_queue.TaskError(result["message"])
+
+
+# Handlers for task_queue.TaskWorker, in the API and in standalone workers
+queue_handlers = {"download": download_task, "parse": parse_task}
@@ -0,0 +1,241 @@
+"""Background purges of invoices, passengers and their PDFs, with progress.
+
+A purge is scoped by airline, invoice date range and/or a PNR list, or covers
+everything. Scoped purges walk the matching invoices in chunks; each chunk deletes the
+invoices and, for their PNRs, the passengers, queue tasks and seeded metadata in one
+short transaction, then removes the chunk's PDFs that no remaining invoice shares.
+Purging everything empties the tables in a single transaction (SQLite truncates a
+table deleted without a WHERE clause) and then walks the PDF store. Files written
+after the purge started are kept: they belong to downloads that ran concurrently.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+import config
+from db.models import Invoice, Passenger, QueueTask, SeedMetadata, SessionLocal
+from services import events, search, storage, summary
+from services.bulk import chunked
+from services.metadata_store import MetadataStore
+
+
+class PurgeError(ValueError):
+    pass
+
+
+class PurgeScope:
+    """What to purge: `everything`, or the invoices matching every given filter.
+
+    Listed PNRs that have no invoice are purged too unless an airline or date filter is given.
+    """
+
+    def __init__(self, everything: bool = False, airline: Optional[str] = None, date_from: Optional[date] = None,
+                 date_to: Optional[date] = None, pnrs: Optional[List[str]] = None):
+        if not everything and not (airline or date_from or date_to or pnrs):
+            raise PurgeError("Give an airline, date range or PNR list, or purge everything")
+        self.everything = everything
+        self.airline = airline
+        self.date_from = date_from
+        self.date_to = date_to
+        self.pnrs = list(dict.fromkeys(pnrs)) if pnrs else None
+
+    @property
+    def filtered(self) -> bool:
+        return bool(self.airline or self.date_from or self.date_to)
+
+    def invoice_query(self):
+        """Matching invoices (ignoring the PNR list); date_to is inclusive."""
+        query = select(Invoice.id, Invoice.pnr, Invoice.airline, Invoice.amount, Invoice.flag_for_review,
+                       Invoice.pdf_path)
+        if self.airline:
+            query = query.where(Invoice.airline == self.airline)
+        if self.date_from:
+            query = query.where(Invoice.invoice_date >= datetime.combine(self.date_from, datetime.min.time()))
+        if self.date_to:
+            query = query.where(
+                Invoice.invoice_date < datetime.combine(self.date_to + timedelta(days=1), datetime.min.time()))
+        return query
+
+    def to_dict(self) -> Dict:
+        if self.everything:
+            return {"everything": True}
+        return {
+            "airline": self.airline,
+            "date_from": self.date_from.isoformat() if self.date_from else None,
+            "date_to": self.date_to.isoformat() if self.date_to else None,
+            "pnrs": len(self.pnrs) if self.pnrs is not None else None,
+        }
+
+
+class PurgeJob:
+    def __init__(self, scope: PurgeScope):
+        self.id = uuid.uuid4().hex
+        self.scope = scope
+        self.status = "Queued"  # Queued, Running, Completed, Failed
+        self.phase: Optional[str] = None  # rows, files
+        self.invoices = 0
+        self.passengers = 0
+        self.files = 0
+        self.bytes_freed = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        # Set once the database rows are gone; files may still be being removed
+        self.rows_purged = asyncio.Event()
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "scope": self.scope.to_dict(),
+            "status": self.status,
+            "phase": self.phase,
+            "invoices_deleted": self.invoices,
+            "passengers_deleted": self.passengers,
+            "files_deleted": self.files,
+            "bytes_freed": self.bytes_freed,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class PurgeManager:
+    """Runs purges in the background, one at a time, keeping recent jobs for polling."""
+
+    def __init__(self, metadata: MetadataStore, root: str = config.INVOICES_DIR,
+                 batch_size: int = config.PURGE_BATCH_SIZE, history_limit: int = config.JOB_HISTORY_LIMIT):
+        self.metadata = metadata
+        self.root = root
+        self.batch_size = batch_size
+        self.history_limit = history_limit
+        self.jobs: "OrderedDict[str, PurgeJob]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._lock = asyncio.Lock()
+
+    def submit(self, scope: PurgeScope) -> PurgeJob:
+        job = PurgeJob(scope)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.history_limit:
+            oldest_id = next((jid for jid, j in self.jobs.items() if j.finished_at), None)
+            if oldest_id is None:
+                break
+            del self.jobs[oldest_id]
+        self._tasks[job.id] = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[PurgeJob]:
+        return self.jobs.get(job_id)
+
+    async def _run(self, job: PurgeJob):
+        try:
+            # Concurrent purges would only contend for the database write lock
+            async with self._lock:
+                job.status = "Running"
+                started = time.time()
+                job.phase = "rows"
+                if job.scope.everything:
+                    await asyncio.to_thread(self._purge_all_rows, job)
+                    events.broadcaster.publish([{"type": "resync", "data": {"lists": events.ALL_LISTS}}])
+                    job.rows_purged.set()
+                    job.phase = "files"
+                    await asyncio.to_thread(self._purge_all_files, job, started)
+                else:
+                    # Each chunk's files are removed right after its rows are committed
+                    await asyncio.to_thread(self._purge_scoped, job, started)
+                    events.broadcaster.publish([{"type": "resync", "data": {"lists": events.ALL_LISTS}}])
+                    job.rows_purged.set()
+                job.status = "Completed"
+        except Exception as e:
+            job.status = "Failed"
+            job.error = str(e)
+        finally:
+            job.phase = None
+            job.rows_purged.set()
+            job.finished_at = datetime.utcnow()
+            self._tasks.pop(job.id, None)
+
+    def _purge_all_rows(self, job: PurgeJob):
+        with SessionLocal() as db:
+            job.invoices = db.scalar(select(func.count()).select_from(Invoice))
+            job.passengers = db.scalar(select(func.count()).select_from(Passenger))
+            db.execute(delete(QueueTask))
+            db.execute(delete(Passenger))
+            search.clear_invoices(db)
+            summary.clear(db)
+            self.metadata.clear(db)
+            db.commit()
+
+    def _purge_all_files(self, job: PurgeJob, started: float):
+        for directory, dirs, files in os.walk(self.root, topdown=False):
+            for name in files:
+                path = os.path.join(directory, name)
+                job.bytes_freed += self._remove(path, started, job)
+            if directory != self.root:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+
+    def _purge_scoped(self, job: PurgeJob, started: float):
+        scope = job.scope
+        with SessionLocal() as db:
+            if scope.pnrs is None:
+                last_id = 0
+                while True:
+                    rows = db.execute(
+                        scope.invoice_query().where(Invoice.id > last_id).order_by(Invoice.id).limit(self.batch_size)
+                    ).all()
+                    if not rows:
+                        break
+                    last_id = rows[-1].id
+                    self._purge_chunk(db, job, rows, [row.pnr for row in rows], started)
+            else:
+                for pnrs in chunked(scope.pnrs, self.batch_size):
+                    rows = db.execute(scope.invoice_query().where(Invoice.pnr.in_(pnrs))).all()
+                    targets = pnrs if not scope.filtered else [row.pnr for row in rows]
+                    self._purge_chunk(db, job, rows, targets, started)
+
+    def _purge_chunk(self, db: Session, job: PurgeJob, rows: Sequence, pnrs: Sequence[str], started: float):
+        ids = [row.id for row in rows]
+        pnrs = [pnr for pnr in pnrs if pnr]
+        for chunk in chunked(ids):
+            db.execute(delete(Invoice).where(Invoice.id.in_(chunk)))
+        passengers = 0
+        for chunk in chunked(pnrs):
+            passengers += db.execute(delete(Passenger).where(Passenger.pnr.in_(chunk))).rowcount
+            db.execute(delete(QueueTask).where(QueueTask.pnr.in_(chunk)))
+            db.execute(delete(SeedMetadata).where(SeedMetadata.pnr.in_(chunk)))
+        summary.apply_changes(db, [
+            (summary.contribution(row.airline, row.amount, row.flag_for_review), None) for row in rows
+        ])
+        db.commit()
+        self.metadata.forget(pnrs)
+        job.invoices += len(ids)
+        job.passengers += passengers
+        # Content-addressed files may be shared with invoices outside the scope
+        paths = list({row.pdf_path for row in rows if row.pdf_path})
+        referenced = storage.referenced(db, paths)
+        db.commit()
+        for path in paths:
+            if path not in referenced:
+                job.bytes_freed += self._remove(path, started, job)
+
+    @staticmethod
+    def _remove(path: str, started: float, job: PurgeJob) -> int:
+        """Delete a file unless it was written after the purge started; returns the bytes freed."""
+        try:
+            st = os.stat(path)
+            if st.st_mtime > started:
+                return 0
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        job.files += 1
+        return st.st_size
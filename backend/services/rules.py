@@ -0,0 +1,447 @@
+"""Declarative review rules, evaluated set-based over invoices to maintain flag_for_review.
+
+Rules are a JSON list of specs such as {"rule": "amount_threshold", "default": 100000,
+"airlines": {"IndiGo": 50000}}, read from REVIEW_RULES_FILE (the built-in DEFAULT_RULES
+when it does not exist). Each rule is a SQL condition on invoices; evaluating a batch
+of invoices clears their review_reasons, runs one UPDATE per rule appending the rule's
+name to the invoices it matches, then one UPDATE setting flag_for_review wherever it
+disagrees with the reasons. The GSTIN check character has no portable SQL form, so
+that rule checks the batch's GSTINs in Python instead. Invoices flagged or unflagged
+by hand (flag_source "manual") keep their flag, but their reasons are still recorded.
+
+Invoices are scored after they are parsed or seeded; invoices with no fields yet are
+never flagged. A rescore walks every invoice in id ranges of RULES_BATCH_SIZE, one
+transaction each. Scoped evaluation also re-scores invoices related by a rule (those
+sharing an invoice number), but a change that ends a relation elsewhere, such as a
+purge, is only picked up by the next rescore.
+
+Run from backend/:  python -m services.rules rescore
+"""
+import abc
+import asyncio
+import json
+import os
+import re
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import DateTime, and_, case, func, literal, or_, select, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql.functions import FunctionElement
+
+import config
+from db.models import Invoice, SessionLocal
+from services import events, summary
+from services.bulk import chunked
+
+MANUAL = "manual"
+RULES = "rules"
+SEPARATOR = ","
+
+# Only rules that single out unusual invoices. missing_gstin and date_outlier are opt-in
+# through REVIEW_RULES_FILE: mock-rendered invoices carry no GSTIN and seeded invoices
+# have historic dates, so either would flag nearly every invoice.
+DEFAULT_RULES: List[Dict] = [
+    {"rule": "amount_threshold", "default": 100000, "airlines": {}},
+    {"rule": "gstin_checksum"},
+    {"rule": "duplicate_invoice_number"},
+]
+
+_GSTIN_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_GSTIN = re.compile(r"[0-9]{2}[0-9A-Z]{13}")
+_NAME = re.compile(r"[a-z0-9_]+")
+
+
+class RuleError(ValueError):
+    pass
+
+
+def gstin_valid(gstin: Optional[str]) -> bool:
+    """Whether a GSTIN is well formed and its last character is the mod-36 check character."""
+    if not gstin:
+        return False
+    gstin = gstin.strip().upper()
+    if not _GSTIN.fullmatch(gstin):
+        return False
+    total = 0
+    for i, char in enumerate(gstin[:14]):
+        product = _GSTIN_CHARS.index(char) * (2 if i % 2 else 1)
+        total += product // 36 + product % 36
+    return gstin[14] == _GSTIN_CHARS[(36 - total % 36) % 36]
+
+
+class days_after(FunctionElement):
+    """`value` plus `days` (negative: minus) days, in the database's own date arithmetic."""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(days_after)
+def _days_after(element, compiler, **kw):
+    value, days = element.clauses
+    return f"({compiler.process(value, **kw)} + CAST({compiler.process(days, **kw)} AS INTEGER) * INTERVAL '1 day')"
+
+
+@compiles(days_after, "sqlite")
+def _days_after_sqlite(element, compiler, **kw):
+    # Stored datetimes are ISO strings, which datetime() shifts and which compare in order
+    value, days = element.clauses
+    return f"datetime({compiler.process(value, **kw)}, {compiler.process(days, **kw)} || ' days')"
+
+
+class Rule(abc.ABC):
+    """One review rule; `name` is the reason recorded on the invoices it matches."""
+    kind = ""
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name or self.kind
+        if not _NAME.fullmatch(self.name):
+            raise RuleError(f"Rule name {self.name!r} must be lowercase letters, digits and underscores")
+
+    @abc.abstractmethod
+    def condition(self):
+        """SQL condition on Invoice matching the invoices to flag."""
+
+    def matches(self, db: Session, scope) -> Iterator:
+        """Conditions selecting the invoices in `scope` to flag; by default just `condition`."""
+        yield self.condition()
+
+    def related(self, db: Session, ids: Sequence[int]) -> Set[int]:
+        """Other invoices whose result may change when the invoices `ids` change."""
+        return set()
+
+    def params(self) -> Dict:
+        return {}
+
+    def to_dict(self) -> Dict:
+        spec = {"rule": self.kind, **self.params()}
+        if self.name != self.kind:
+            spec["name"] = self.name
+        return spec
+
+
+def _number(value, what: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise RuleError(f"{what} must be a non-negative number")
+    return value
+
+
+class AmountThreshold(Rule):
+    """Amount at or above the airline's threshold, or `default` for other airlines (None: not flagged)."""
+    kind = "amount_threshold"
+
+    def __init__(self, default: Optional[float] = None, airlines: Optional[Dict[str, float]] = None, name=None):
+        super().__init__(name)
+        self.default = None if default is None else _number(default, "default")
+        if not isinstance(airlines or {}, dict):
+            raise RuleError("airlines must map airline names to thresholds")
+        self.airlines = {airline: _number(v, f"Threshold for {airline}") for airline, v in (airlines or {}).items()}
+        if self.default is None and not self.airlines:
+            raise RuleError("amount_threshold needs a default or per-airline thresholds")
+
+    def condition(self):
+        if self.airlines:
+            threshold = case(*((Invoice.airline == a, v) for a, v in self.airlines.items()), else_=self.default)
+        else:
+            threshold = literal(self.default)
+        return Invoice.amount >= threshold
+
+    def params(self) -> Dict:
+        return {"default": self.default, "airlines": dict(self.airlines)}
+
+
+class MissingGstin(Rule):
+    kind = "missing_gstin"
+
+    def condition(self):
+        return or_(Invoice.gstin.is_(None), func.trim(Invoice.gstin) == "")
+
+
+class GstinChecksum(Rule):
+    """A GSTIN is present but malformed or fails its check character."""
+    kind = "gstin_checksum"
+
+    def condition(self):
+        # Candidates only; `matches` checks their GSTINs
+        return func.trim(Invoice.gstin) != ""
+
+    def matches(self, db: Session, scope) -> Iterator:
+        rows = db.execute(select(Invoice.id, Invoice.gstin).where(scope, _scored(), self.condition()))
+        invalid = [row.id for row in rows if not gstin_valid(row.gstin)]
+        for chunk in chunked(invalid):
+            yield Invoice.id.in_(chunk)
+
+
+class DuplicateInvoiceNumber(Rule):
+    """Another invoice has the same invoice number."""
+    kind = "duplicate_invoice_number"
+
+    def condition(self):
+        other = aliased(Invoice)
+        return select(other.id).where(
+            other.invoice_number == Invoice.invoice_number, other.id != Invoice.id
+        ).exists()
+
+    def related(self, db: Session, ids: Sequence[int]) -> Set[int]:
+        numbers = select(Invoice.invoice_number).where(Invoice.id.in_(ids), Invoice.invoice_number.isnot(None))
+        return set(db.scalars(select(Invoice.id).where(Invoice.invoice_number.in_(numbers))))
+
+
+class DateOutlier(Rule):
+    """Invoice date more than `max_age_days` before, or `max_future_days` after, the invoice was recorded."""
+    kind = "date_outlier"
+
+    def __init__(self, max_age_days: int = 400, max_future_days: int = 1, name=None):
+        super().__init__(name)
+        self.max_age_days = int(_number(max_age_days, "max_age_days"))
+        self.max_future_days = int(_number(max_future_days, "max_future_days"))
+
+    def condition(self):
+        return or_(
+            Invoice.invoice_date < days_after(Invoice.created_at, literal(-self.max_age_days)),
+            Invoice.invoice_date > days_after(Invoice.created_at, literal(self.max_future_days)),
+        )
+
+    def params(self) -> Dict:
+        return {"max_age_days": self.max_age_days, "max_future_days": self.max_future_days}
+
+
+RULE_TYPES = {cls.kind: cls for cls in (AmountThreshold, MissingGstin, GstinChecksum, DuplicateInvoiceNumber, DateOutlier)}
+
+
+def parse_rules(specs: List[Dict]) -> List[Rule]:
+    """Rules from their JSON specs; raises RuleError for an invalid spec."""
+    if not isinstance(specs, list):
+        raise RuleError("Rules must be a list of rule specs")
+    rules: List[Rule] = []
+    for spec in specs:
+        if not isinstance(spec, dict) or spec.get("rule") not in RULE_TYPES:
+            raise RuleError(f"Unknown rule in {spec!r}; expected one of {', '.join(RULE_TYPES)}")
+        params = {k: v for k, v in spec.items() if k != "rule"}
+        try:
+            rules.append(RULE_TYPES[spec["rule"]](**params))
+        except TypeError as e:
+            raise RuleError(f"Invalid parameters for {spec['rule']}: {e}")
+    names = [rule.name for rule in rules]
+    if len(set(names)) != len(names):
+        raise RuleError("Rule names must be unique; set a distinct name for repeated rules")
+    return rules
+
+
+_loaded: Dict[str, Tuple[Optional[float], List[Rule]]] = {}
+
+
+def active_rules(path: str = config.REVIEW_RULES_FILE) -> List[Rule]:
+    """The rules in `path`, re-read when the file changes, or DEFAULT_RULES if there is none."""
+    try:
+        mtime: Optional[float] = os.stat(path).st_mtime
+    except FileNotFoundError:
+        mtime = None
+    cached = _loaded.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    if mtime is None:
+        rules = parse_rules(DEFAULT_RULES)
+    else:
+        with open(path, encoding="utf-8") as f:
+            rules = parse_rules(json.load(f))
+    _loaded[path] = (mtime, rules)
+    return rules
+
+
+def save_rules(specs: List[Dict], path: str = config.REVIEW_RULES_FILE) -> List[Rule]:
+    """Validate and store a new rule list; invoices keep their flags until rescored."""
+    rules = parse_rules(specs)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump([rule.to_dict() for rule in rules], f, indent=2)
+    os.replace(tmp, path)
+    _loaded.pop(path, None)
+    return rules
+
+
+def reasons(value: Optional[str]) -> List[str]:
+    return value.split(SEPARATOR) if value else []
+
+
+def _scored():
+    # Same test run_parse uses for an invoice that has seeded or parsed fields
+    return or_(Invoice.invoice_number.isnot(None), Invoice.airline.isnot(None),
+               Invoice.amount.isnot(None), Invoice.invoice_date.isnot(None))
+
+
+def evaluate(db: Session, scope, rules: Optional[List[Rule]] = None) -> Tuple[int, int]:
+    """Re-score the invoices matching the `scope` condition; the caller commits.
+
+    Returns (flagged, unflagged): how many invoices' flags the rules changed.
+    """
+    rules = active_rules() if rules is None else rules
+    # Reason bookkeeping leaves updated_at alone; only a flag change counts as an update
+    db.execute(
+        update(Invoice).where(scope, Invoice.review_reasons.isnot(None))
+        .values(review_reasons=None, updated_at=Invoice.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    for rule in rules:
+        for condition in rule.matches(db, scope):
+            db.execute(
+                update(Invoice).where(scope, _scored(), condition)
+                .values(
+                    review_reasons=case(
+                        (Invoice.review_reasons.is_(None), rule.name),
+                        else_=Invoice.review_reasons + SEPARATOR + rule.name,
+                    ),
+                    updated_at=Invoice.updated_at,
+                )
+                .execution_options(synchronize_session=False)
+            )
+    matched = Invoice.review_reasons.isnot(None)
+    pending = and_(
+        scope,
+        or_(Invoice.flag_source.is_(None), Invoice.flag_source != MANUAL),
+        func.coalesce(Invoice.flag_for_review, False) != matched,
+    )
+    flips = db.execute(select(Invoice.airline, Invoice.amount, Invoice.flag_for_review).where(pending)).all()
+    if not flips:
+        return 0, 0
+    db.execute(
+        update(Invoice).where(pending)
+        .values(flag_for_review=matched, flag_source=case((matched, RULES), else_=None))
+        .execution_options(synchronize_session=False)
+    )
+    summary.apply_changes(db, [
+        (summary.contribution(row.airline, row.amount, row.flag_for_review),
+         summary.contribution(row.airline, row.amount, not row.flag_for_review))
+        for row in flips
+    ])
+    unflagged = sum(1 for row in flips if row.flag_for_review)
+    return len(flips) - unflagged, unflagged
+
+
+def evaluate_ids(db: Session, ids: Sequence[int]) -> Tuple[int, int]:
+    """Re-score the given invoices and those related to them by a rule; the caller commits."""
+    rules = active_rules()
+    targets = set(ids)
+    for chunk in chunked(list(targets)):
+        for rule in rules:
+            targets |= rule.related(db, chunk)
+    flagged = unflagged = 0
+    for chunk in chunked(sorted(targets)):
+        f, u = evaluate(db, Invoice.id.in_(chunk), rules)
+        flagged += f
+        unflagged += u
+    return flagged, unflagged
+
+
+def evaluate_pnrs(db: Session, pnrs: Sequence[str]) -> Tuple[int, int]:
+    ids: List[int] = []
+    for chunk in chunked(list(pnrs)):
+        ids.extend(db.scalars(select(Invoice.id).where(Invoice.pnr.in_(chunk))))
+    return evaluate_ids(db, ids)
+
+
+class RescoreJob:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "Queued"  # Queued, Running, Completed, Failed
+        self.rules = [rule.to_dict() for rule in active_rules()]
+        self.total = 0
+        self.scanned = 0
+        self.flagged = 0
+        self.unflagged = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "rules": self.rules,
+            "total": self.total,
+            "scanned": self.scanned,
+            "flagged": self.flagged,
+            "unflagged": self.unflagged,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+def rescore(db: Session, job: Optional[RescoreJob] = None, batch_size: int = config.RULES_BATCH_SIZE) -> RescoreJob:
+    """Re-score every invoice, committing each id range as it is done."""
+    job = job or RescoreJob()
+    rules = active_rules()
+    low, high, job.total = db.execute(select(func.min(Invoice.id), func.max(Invoice.id), func.count(Invoice.id))).one()
+    db.commit()
+    if low is None:
+        return job
+    for start in range(low, high + 1, batch_size):
+        scope = and_(Invoice.id >= start, Invoice.id < start + batch_size)
+        flagged, unflagged = evaluate(db, scope, rules)
+        db.commit()
+        job.scanned = min(job.total, job.scanned + db.scalar(select(func.count(Invoice.id)).where(scope)))
+        job.flagged += flagged
+        job.unflagged += unflagged
+    return job
+
+
+class Rescorer:
+    """Runs full rescores in the background, one at a time, keeping recent jobs for polling."""
+
+    def __init__(self, batch_size: int = config.RULES_BATCH_SIZE, history_limit: int = config.JOB_HISTORY_LIMIT):
+        self.batch_size = batch_size
+        self.history_limit = history_limit
+        self.jobs: "OrderedDict[str, RescoreJob]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._lock = asyncio.Lock()
+
+    def submit(self) -> RescoreJob:
+        job = RescoreJob()
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.history_limit:
+            oldest_id = next((jid for jid, j in self.jobs.items() if j.finished_at), None)
+            if oldest_id is None:
+                break
+            del self.jobs[oldest_id]
+        self._tasks[job.id] = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[RescoreJob]:
+        return self.jobs.get(job_id)
+
+    async def _run(self, job: RescoreJob):
+        try:
+            async with self._lock:
+                job.status = "Running"
+                await asyncio.to_thread(self._rescore, job)
+                if job.flagged or job.unflagged:
+                    events.broadcaster.publish([{"type": "resync", "data": {"lists": ["invoices"]}}])
+                job.status = "Completed"
+        except Exception as e:
+            job.status = "Failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            self._tasks.pop(job.id, None)
+
+    def _rescore(self, job: RescoreJob):
+        with SessionLocal() as db:
+            rescore(db, job, self.batch_size)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if sys.argv[1:] != ["rescore"]:
+        raise SystemExit("usage: python -m services.rules rescore")
+    started = time.perf_counter()
+    with SessionLocal() as session:
+        result = rescore(session)
+    print(f"Rescored {result.scanned} invoices in {time.perf_counter() - started:.1f}s: "
+          f"{result.flagged} flagged, {result.unflagged} unflagged")
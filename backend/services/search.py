@@ -0,0 +1,191 @@
+"""Full-text search over invoices with an SQLite FTS5 index.
+
+invoices_fts is an external-content FTS5 table over the invoice's PNR, invoice number,
+airline, GSTIN, passenger name and extracted raw_text; it stores only the index and
+reads column values from invoices. Triggers (last recreated by migration 5) keep it in
+step with every insert, delete and update of an indexed column, whichever code path
+makes it. Other databases have no index and search is unavailable.
+
+Queries are plain words, not FTS5 syntax: every word must match, as a prefix of a token
+("27ABC" finds GSTIN 27ABCDE1234F1Z5), and words with punctuation such as INV-AI-123
+match as a phrase. Results are ranked with bm25, identifier columns weighted above the
+free text; ranking reads every match, so `sort="recent"` is much cheaper for terms
+that occur in a large share of invoices.
+
+Run from backend/:  python -m services.search rebuild | optimize
+"""
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, column, delete, func, literal_column, select, table, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from db.models import Invoice
+from services import extraction
+
+FTS_TABLE = "invoices_fts"
+COLUMNS = ("pnr", "invoice_number", "airline", "gstin", "passenger_name", "raw_text")
+# bm25 weight per column, in COLUMNS order
+WEIGHTS = (10.0, 10.0, 2.0, 10.0, 5.0, 1.0)
+SORTS = ("rank", "recent")
+
+_TOKEN = re.compile(r"\w+")
+_fts = table(FTS_TABLE, column("rowid"))
+_fts_ref = literal_column(FTS_TABLE)
+
+TRIGGERS = (f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au")
+
+
+def _delete_trigger(columns: Sequence[str]) -> str:
+    old = ", ".join(f"old.{c}" for c in columns)
+    delete = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(columns)}) VALUES ('delete', old.id, {old});"
+    return f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON invoices BEGIN {delete} END"
+
+
+def schema(columns: Sequence[str] = COLUMNS) -> List[str]:
+    """Statements creating the index over `columns` and the triggers maintaining it."""
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    insert = f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(columns)}) VALUES (new.id, {new});"
+    delete = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(columns)}) VALUES ('delete', old.id, {old});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({', '.join(columns)}, "
+        f"content='invoices', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON invoices BEGIN {insert} END",
+        _delete_trigger(columns),
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {', '.join(columns)} ON invoices "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+class SearchError(ValueError):
+    pass
+
+
+def supported(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def create_index(conn: Connection, columns: Sequence[str] = COLUMNS):
+    """Create the index and its triggers, and index the invoices already stored."""
+    if not supported(conn):
+        return
+    for statement in schema(columns):
+        conn.execute(text(statement))
+    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def drop_index(conn: Connection):
+    """Drop the index and its triggers, e.g. before recreating them over other columns."""
+    if not supported(conn):
+        return
+    for trigger in TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def _query_tokens(q: str) -> List[List[str]]:
+    return [tokens for tokens in (_TOKEN.findall(word) for word in q.split()) if tokens]
+
+
+def match_expression(q: str) -> str:
+    """An FTS5 MATCH expression requiring every word of `q` as a prefix or prefix phrase."""
+    terms = ['"' + " ".join(tokens) + '"*' for tokens in _query_tokens(q)]
+    if not terms:
+        raise SearchError("Search query has no searchable words")
+    return " ".join(terms)
+
+
+def snippet(text: Optional[str], q: str, context: int = 60) -> Optional[str]:
+    """A window of `text` around the first match of `q`'s words, with matches in [brackets].
+
+    Built in Python from the loaded row: FTS5's snippet() re-reads the doclist of every
+    prefix term per row, which costs more than the search itself for short prefixes.
+    """
+    if not text:
+        return None
+    # One alternative per query word: its tokens as a phrase, the last one a prefix
+    phrases = sorted((r"\W+".join(map(re.escape, tokens)) for tokens in _query_tokens(q)), key=len, reverse=True)
+    if not phrases:
+        return None
+    pattern = re.compile(r"\b(?:" + "|".join(phrases) + r")\w*", re.IGNORECASE)
+    text = extraction.normalize_text(text)
+    first = pattern.search(text)
+    if first is None:
+        return None
+    start = max(0, first.start() - context)
+    end = min(len(text), first.end() + context)
+    # Widen to whole words
+    start = text.rfind(" ", 0, start) + 1 if start else 0
+    space = text.find(" ", end)
+    end = len(text) if space < 0 else space
+    window = pattern.sub(lambda m: f"[{m.group(0)}]", text[start:end])
+    return ("…" if start else "") + window + ("…" if end < len(text) else "")
+
+
+def search_query(q: str, sort: str = "rank") -> Select:
+    """select(Invoice.id, score) of invoices matching `q`, in `sort` order; filter and page it, then `load_hits`.
+
+    Only ids and scores are sorted; invoice rows and snippets are loaded for the page alone.
+    """
+    if sort not in SORTS:
+        raise SearchError(f"Unknown sort {sort!r}; use one of {', '.join(SORTS)}")
+    score = func.bm25(_fts_ref, *WEIGHTS).label("score")
+    query = (
+        select(Invoice.id, score)
+        .join(_fts, _fts.c.rowid == Invoice.id)
+        .where(_fts_ref.op("MATCH")(match_expression(q)))
+    )
+    if sort == "rank":
+        # bm25 is lower for better matches
+        return query.order_by(score, _fts.c.rowid.desc())
+    # FTS5 walks its doclists in rowid order, so this needs no sort
+    return query.order_by(_fts.c.rowid.desc())
+
+
+def load_hits(db: Session, q: str, page: Sequence) -> List[Tuple[Invoice, float, Optional[str]]]:
+    """(invoice, score, raw_text snippet) for each (id, score) row of a `search_query` page, in order."""
+    ids = [row.id for row in page]
+    if not ids:
+        return []
+    invoices = {inv.id: inv for inv in db.scalars(select(Invoice).where(Invoice.id.in_(ids)))}
+    return [(invoices[row.id], row.score, snippet(invoices[row.id].raw_text, q)) for row in page if row.id in invoices]
+
+
+def clear_invoices(db: Session):
+    """Delete every invoice and empty the index; the caller commits.
+
+    Deleting through the per-row trigger re-tokenizes each invoice's text, so the delete
+    trigger is dropped for the duration of this transaction and the index emptied at once.
+    """
+    if not supported(db.get_bind()):
+        db.execute(delete(Invoice))
+        return
+    db.execute(text(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad"))
+    db.execute(delete(Invoice))
+    db.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')"))
+    db.execute(text(_delete_trigger(COLUMNS)))
+
+
+def rebuild(db: Session):
+    """Re-index every invoice from the invoices table, e.g. if it was damaged or its tokenizer changed."""
+    db.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def optimize(db: Session):
+    """Merge the index's b-trees into one; worth running after large imports."""
+    db.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+
+
+if __name__ == "__main__":
+    import sys
+    from db.models import SessionLocal
+
+    commands = {"rebuild": rebuild, "optimize": optimize}
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        raise SystemExit("usage: python -m services.search rebuild | optimize")
+    with SessionLocal() as session:
+        commands[sys.argv[1]](session)
+        session.commit()
+    print(f"{sys.argv[1]}: done")
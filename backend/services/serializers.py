@@ -0,0 +1,57 @@
+"""API representations of stored rows, shared by the API and the pipeline's dashboard events."""
+import os
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+import config
+from db.models import Invoice
+from services import rules, storage
+
+
+class InvoiceResponse(BaseModel):
+    id: int
+    pnr: str
+    invoice_number: Optional[str]
+    invoice_date: Optional[str]
+    airline: Optional[str]
+    amount: Optional[float]
+    gstin: Optional[str]
+    passenger_name: Optional[str] = None
+    pdf_path: Optional[str]
+    flag_for_review: bool
+    flag_source: Optional[str] = None
+    review_reasons: List[str] = []
+    created_at: str
+
+
+def to_pdf_url_path(pdf_fs_path: Optional[str]) -> Optional[str]:
+    """URL path of a stored PDF under the /invoices static mount"""
+    if not pdf_fs_path:
+        return None
+    # Sharded files keep their ab/cd/ subdirectories in the URL
+    relative = storage.relative_path(config.INVOICES_DIR, pdf_fs_path) or os.path.basename(pdf_fs_path)
+    return f"/invoices/{relative}"
+
+
+def to_invoice_response(inv: Invoice) -> InvoiceResponse:
+    return InvoiceResponse(
+        id=inv.id,
+        pnr=inv.pnr,
+        invoice_number=inv.invoice_number,
+        invoice_date=inv.invoice_date.isoformat() if inv.invoice_date else None,
+        airline=inv.airline,
+        amount=inv.amount,
+        gstin=inv.gstin,
+        passenger_name=inv.passenger_name,
+        pdf_path=to_pdf_url_path(inv.pdf_path),
+        flag_for_review=inv.flag_for_review,
+        flag_source=inv.flag_source,
+        review_reasons=rules.reasons(inv.review_reasons),
+        created_at=inv.created_at.isoformat()
+    )
+
+
+def invoice_payload(inv: Invoice) -> dict:
+    """Payload of dashboard "invoice" events: the same fields as the API responses"""
+    return to_invoice_response(inv).model_dump(mode="json")
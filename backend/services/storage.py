@@ -0,0 +1,217 @@
+"""Content-addressed, sharded storage for invoice PDFs.
+
+Each PDF is stored once under the sha256 of its bytes, at <root>/ab/cd/<digest>.pdf,
+so no directory grows beyond a few entries per 65536 files and re-rendering identical
+content reuses the existing file. Renders are written under <root>/tmp and renamed
+into place, which is atomic. Files that no Invoice.pdf_path references any more are
+removed by `collect_garbage` once they are older than a grace period.
+
+Run from backend/:  python -m services.storage gc | migrate-flat
+"""
+import os
+import shutil
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+import config
+from db.models import Invoice, SessionLocal
+from services.bulk import chunked
+from services.parse_cache import hash_file
+
+TMP_DIR = "tmp"
+SUFFIX = ".pdf"
+
+
+def shard_path(root: str, digest: str) -> str:
+    return os.path.join(root, digest[:2], digest[2:4], digest + SUFFIX)
+
+
+def tmp_path(root: str) -> str:
+    """A fresh path to render into before `store_file` moves it into place."""
+    directory = os.path.join(root, TMP_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, uuid.uuid4().hex + SUFFIX)
+
+
+def store_file(root: str, path: str) -> str:
+    """Move the file at `path` to its content address and return that path.
+
+    If identical content is already stored the new copy is dropped; the existing
+    file's mtime is refreshed so garbage collection treats it as recently written.
+    """
+    target = shard_path(root, hash_file(path))
+    if os.path.exists(target):
+        os.remove(path)
+        os.utime(target)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    return target
+
+
+def relative_path(root: str, path: str) -> Optional[str]:
+    """`path` relative to `root` with forward slashes, or None if it lies outside root."""
+    rel = os.path.relpath(os.path.abspath(path), root)
+    if rel.startswith(os.pardir):
+        return None
+    return rel.replace(os.sep, "/")
+
+
+def iter_files(root: str, after: Optional[str] = None) -> Iterator[str]:
+    """Relative paths of stored files in lexicographic order, starting after `after`.
+
+    Only the directories on or after the cursor are listed, so resuming a listing
+    deep into a large store costs a few small directory reads.
+    """
+    def walk(rel: str) -> Iterator[str]:
+        try:
+            with os.scandir(os.path.join(root, rel) if rel else root) as it:
+                # Sorting directories as "name/" keeps the order identical to full-path order
+                entries = sorted(((e.name + "/" if e.is_dir(follow_symlinks=False) else e.name), e) for e in it)
+        except FileNotFoundError:
+            return
+        for key, entry in entries:
+            name = f"{rel}/{entry.name}" if rel else entry.name
+            if key.endswith("/"):
+                if name == TMP_DIR or (after and name + "/" < after[:len(name) + 1]):
+                    continue
+                yield from walk(name)
+            elif not after or name > after:
+                yield name
+
+    return walk("")
+
+
+def clear(root: str):
+    """Delete everything stored under root."""
+    with os.scandir(root) as it:
+        entries = list(it)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def referenced_query(paths: List[str]):
+    return select(Invoice.pdf_path).where(Invoice.pdf_path.in_(paths))
+
+
+def referenced(db: Session, paths: List[str]) -> set:
+    """The subset of `paths` that some invoice's pdf_path still points at."""
+    found = set()
+    for chunk in chunked(paths):
+        found.update(db.execute(referenced_query(chunk)).scalars())
+    return found
+
+
+def collect_garbage(root: str = config.INVOICES_DIR,
+                    grace_seconds: int = config.STORAGE_GC_GRACE_SECONDS) -> Dict[str, int]:
+    """Remove stored files that no invoice references, one directory at a time.
+
+    Files modified within `grace_seconds` are kept: they may belong to a download that
+    has not committed its pdf_path yet, or have just been reused by `store_file`.
+    """
+    cutoff = time.time() - grace_seconds
+    stats = {"scanned": 0, "referenced": 0, "removed": 0, "bytes_freed": 0, "recent": 0}
+    with SessionLocal() as db:
+        for directory, dirs, files in os.walk(root):
+            dirs.sort()
+            candidates = []
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                stats["scanned"] += 1
+                if st.st_mtime > cutoff:
+                    stats["recent"] += 1
+                else:
+                    candidates.append((path, st.st_size))
+            if os.path.relpath(directory, root) == TMP_DIR:
+                # Leftovers of renders that never completed
+                in_use = set()
+            else:
+                in_use = referenced(db, [path for path, _ in candidates])
+            for path, size in candidates:
+                if path in in_use:
+                    stats["referenced"] += 1
+                    continue
+                try:
+                    # Re-check: a concurrent download may have reused the file since the scan
+                    if os.stat(path).st_mtime > cutoff:
+                        stats["recent"] += 1
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                stats["removed"] += 1
+                stats["bytes_freed"] += size
+            if directory != root and not dirs and not os.listdir(directory):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+    return stats
+
+
+def migrate_flat(root: str = config.INVOICES_DIR, batch_size: int = 1000) -> Dict[str, int]:
+    """Move PDFs from the old flat layout (<root>/invoice_<pnr>_<time>.pdf) to content addresses.
+
+    Each batch is copied into place and committed before the flat files are removed, so an
+    interrupted run leaves every invoice pointing at an existing file and can be re-run.
+    Unreferenced flat files are left for `collect_garbage`.
+    """
+    stats = {"moved": 0, "missing": 0}
+    with SessionLocal() as db:
+        last_id = 0
+        while True:
+            rows = db.execute(
+                select(Invoice.id, Invoice.pdf_path).where(Invoice.id > last_id).order_by(Invoice.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            updates, moved = [], []
+            for row in rows:
+                if not row.pdf_path or os.path.dirname(os.path.abspath(row.pdf_path)) != root:
+                    continue
+                if not os.path.exists(row.pdf_path):
+                    stats["missing"] += 1
+                    continue
+                target = shard_path(root, hash_file(row.pdf_path))
+                if not os.path.exists(target):
+                    copy = tmp_path(root)
+                    shutil.copyfile(row.pdf_path, copy)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(copy, target)
+                updates.append({"id": row.id, "pdf_path": target})
+                moved.append(row.pdf_path)
+            if updates:
+                db.execute(update(Invoice), updates)
+                db.commit()
+                stats["moved"] += len(updates)
+            for path in moved:
+                os.remove(path)
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Invoice PDF storage maintenance")
+    ap.add_argument("command", choices=["gc", "migrate-flat"])
+    ap.add_argument("--grace-seconds", type=int, default=config.STORAGE_GC_GRACE_SECONDS)
+    args = ap.parse_args()
+    if args.command == "gc":
+        print(collect_garbage(grace_seconds=args.grace_seconds))
+    else:
+        print(migrate_flat())
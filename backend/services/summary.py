@@ -0,0 +1,189 @@
+"""Incremental maintenance of the airline_summary table.
+
+Every code path that changes an invoice's airline, amount or review flag records a
+(before, after) pair of contributions and passes them to apply_changes in the same
+transaction. `python -m services.summary rebuild` recomputes the table from scratch.
+"""
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from db.models import AirlineSummary, Invoice
+from services import events
+
+# (airline, amount, flagged) for an invoice that counts towards the summary, else None
+Contribution = Optional[Tuple[str, float, bool]]
+
+# INSERT constructs with ON CONFLICT support, by dialect
+_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def contribution(airline: Optional[str], amount: Optional[float], flagged: Optional[bool]) -> Contribution:
+    if airline is None or amount is None:
+        return None
+    return (airline, float(amount), bool(flagged))
+
+
+def invoice_contribution(inv: Invoice) -> Contribution:
+    return contribution(inv.airline, inv.amount, inv.flag_for_review)
+
+
+class _Delta:
+    __slots__ = ("count", "total", "flagged", "added_min", "added_max", "removed_min", "removed_max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.flagged = 0
+        self.added_min: Optional[float] = None
+        self.added_max: Optional[float] = None
+        self.removed_min: Optional[float] = None
+        self.removed_max: Optional[float] = None
+
+    def add(self, amount: float, flagged: bool, sign: int):
+        self.count += sign
+        self.total += sign * amount
+        self.flagged += sign * int(flagged)
+        if sign > 0:
+            self.added_min = amount if self.added_min is None else min(self.added_min, amount)
+            self.added_max = amount if self.added_max is None else max(self.added_max, amount)
+        else:
+            self.removed_min = amount if self.removed_min is None else min(self.removed_min, amount)
+            self.removed_max = amount if self.removed_max is None else max(self.removed_max, amount)
+
+
+def apply_changes(db: Session, changes: Iterable[Tuple[Contribution, Contribution]]):
+    """Fold invoice changes into airline_summary; the caller commits.
+
+    Each airline's delta is one INSERT ... ON CONFLICT DO UPDATE adding to the stored
+    counts and totals, so concurrent writers neither lose increments nor race to create
+    the row. Min/max are widened in place; when a removed amount was on the boundary
+    only that airline's min/max is recomputed.
+    """
+    deltas: Dict[str, _Delta] = defaultdict(_Delta)
+    for before, after in changes:
+        if before == after:
+            continue
+        if before is not None and after is not None and before[:2] == after[:2]:
+            # Only the review flag changed: count, total, min and max stay as they are
+            deltas[before[0]].flagged += int(after[2]) - int(before[2])
+            continue
+        if before is not None:
+            deltas[before[0]].add(before[1], before[2], -1)
+        if after is not None:
+            deltas[after[0]].add(after[1], after[2], +1)
+    if not deltas:
+        return
+    events.emit(db, "summary", {"airlines": sorted(deltas)})
+    # Recomputing min/max reads invoices, so pending invoice changes must be visible
+    db.flush()
+    upsert = _INSERTS[db.get_bind().dialect.name]
+    recompute: Set[str] = set()
+    for airline, d in deltas.items():
+        stmt = upsert(AirlineSummary).values(
+            airline=airline,
+            invoice_count=d.count,
+            total_amount=d.total,
+            flagged_count=d.flagged,
+            min_amount=d.added_min,
+            max_amount=d.added_max,
+        )
+        values = {
+            "invoice_count": AirlineSummary.invoice_count + stmt.excluded.invoice_count,
+            "total_amount": AirlineSummary.total_amount + stmt.excluded.total_amount,
+            "flagged_count": AirlineSummary.flagged_count + stmt.excluded.flagged_count,
+            "updated_at": stmt.excluded.updated_at,
+        }
+        if d.added_min is not None:
+            values["min_amount"] = case(
+                (AirlineSummary.min_amount.is_(None), stmt.excluded.min_amount),
+                (AirlineSummary.min_amount > stmt.excluded.min_amount, stmt.excluded.min_amount),
+                else_=AirlineSummary.min_amount,
+            )
+            values["max_amount"] = case(
+                (AirlineSummary.max_amount.is_(None), stmt.excluded.max_amount),
+                (AirlineSummary.max_amount < stmt.excluded.max_amount, stmt.excluded.max_amount),
+                else_=AirlineSummary.max_amount,
+            )
+        stmt = stmt.on_conflict_do_update(index_elements=[AirlineSummary.airline], set_=values)
+        row = db.execute(stmt.returning(
+            AirlineSummary.invoice_count, AirlineSummary.min_amount, AirlineSummary.max_amount,
+        )).one()
+        if row.invoice_count <= 0:
+            # Its last invoice was removed, or the row was missing and the table has drifted
+            recompute.add(airline)
+        elif d.removed_min is not None and (
+                (row.min_amount is not None and d.removed_min <= row.min_amount) or
+                (row.max_amount is not None and d.removed_max >= row.max_amount)):
+            recompute.add(airline)
+    for airline in recompute:
+        rebuild_airline(db, airline)
+
+
+def listing_query():
+    """Airlines with at least one invoice, by name."""
+    return select(AirlineSummary).where(AirlineSummary.invoice_count > 0).order_by(AirlineSummary.airline)
+
+
+def _aggregate_query():
+    return select(
+        Invoice.airline,
+        func.count(Invoice.id),
+        func.sum(Invoice.amount),
+        func.min(Invoice.amount),
+        func.max(Invoice.amount),
+        func.sum(case((Invoice.flag_for_review.is_(True), 1), else_=0)),
+    ).where(Invoice.airline.isnot(None), Invoice.amount.isnot(None))
+
+
+def rebuild_airline(db: Session, airline: str):
+    """Recompute one airline's row from the invoices table."""
+    db.execute(delete(AirlineSummary).where(AirlineSummary.airline == airline))
+    row = db.execute(_aggregate_query().where(Invoice.airline == airline).group_by(Invoice.airline)).first()
+    if row is not None:
+        db.execute(insert(AirlineSummary).values(**_row_values(row)))
+
+
+def rebuild(db: Session) -> int:
+    """Recompute the whole table from the invoices table; the caller commits."""
+    db.execute(delete(AirlineSummary))
+    rows: List[Dict] = [_row_values(row) for row in db.execute(_aggregate_query().group_by(Invoice.airline))]
+    if rows:
+        db.execute(insert(AirlineSummary), rows)
+    events.emit(db, "resync", {"lists": ["summary"]})
+    return len(rows)
+
+
+def clear(db: Session):
+    db.execute(delete(AirlineSummary))
+    events.emit(db, "resync", {"lists": ["summary"]})
+
+
+def _row_values(row) -> Dict:
+    airline, count, total, min_amount, max_amount, flagged = row
+    return {
+        "airline": airline,
+        "invoice_count": count,
+        "total_amount": float(total or 0.0),
+        "min_amount": min_amount,
+        "max_amount": max_amount,
+        "flagged_count": int(flagged or 0),
+    }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        raise SystemExit("usage: python -m services.summary rebuild")
+    from db.models import SessionLocal
+
+    session = SessionLocal()
+    try:
+        count = rebuild(session)
+        session.commit()
+        print(f"Rebuilt airline summary: {count} airlines")
+    finally:
+        session.close()
@@ -0,0 +1,349 @@
+"""Durable download/parse work queue backed by the task_queue table.
+
+Tasks move Queued -> Running -> Succeeded, or back to Queued with an exponential
+backoff after a retryable failure, and to Dead once their attempts are used up or the
+failure is permanent. A Running task holds a lease; if the process dies the lease
+expires and another claim picks the task up again, so nothing is lost on restart.
+The passenger's download_status/parse_status mirrors the state of its latest task.
+
+Workers reach the queue through a Broker. SqlBroker, the only one built in, claims
+straight from the task_queue table, so any process sharing the database can run a
+TaskWorker: the API (QUEUE_WORKERS) or standalone `python worker.py` processes.
+"""
+import abc
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import Row, and_, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import config
+from db.models import AsyncSessionLocal, Passenger, QueueTask
+from services import events
+from services.bulk import chunked, existing_ids_by_pnr
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, DEAD = "Queued", "Running", "Succeeded", "Dead"
+
+# Passenger column that reflects the queue state of each task kind
+STATUS_COLUMNS = {
+    "download": Passenger.download_status,
+    "parse": Passenger.parse_status,
+}
+
+
+class TaskError(Exception):
+    """Raised by a task handler to fail the current attempt.
+
+    Retryable errors are attempted again after a backoff; permanent ones go straight
+    to the dead letters. `status` is the passenger status recorded when the task dies.
+    """
+
+    def __init__(self, message: str, retryable: bool = True, status: str = "Error"):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status = status
+
+
+def backoff(attempts: int) -> float:
+    """Seconds to wait before the next attempt: capped exponential with jitter."""
+    delay = min(config.QUEUE_BACKOFF_MAX_SECONDS, config.QUEUE_BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _set_status(db: Session, kind: str, pnrs: Iterable[str], status: str):
+    column = STATUS_COLUMNS[kind]
+    pnrs = list(pnrs)
+    for chunk in chunked(pnrs):
+        db.execute(update(Passenger).where(Passenger.pnr.in_(chunk)).values({column.key: status}))
+    events.emit_statuses(db, pnrs, **{column.key: status})
+
+
+def active_query(kind: str, pnrs: List[str]):
+    """PNRs among `pnrs` with a `kind` task queued or running."""
+    return select(QueueTask.pnr).where(
+        QueueTask.pnr.in_(pnrs), QueueTask.kind == kind, QueueTask.state.in_((QUEUED, RUNNING)),
+    )
+
+
+def due_query(now: datetime, limit: int):
+    """Ids of the `limit` queued tasks that became due first."""
+    return (
+        select(QueueTask.id)
+        .where(QueueTask.state == QUEUED, QueueTask.available_at <= now)
+        .order_by(QueueTask.available_at, QueueTask.id)
+        .limit(limit)
+    )
+
+
+def enqueue(db: Session, kind: str, pnrs: Iterable[str], then: Optional[str] = None) -> Dict[str, int]:
+    """Queue a `kind` task per known PNR, skipping PNRs that already have one pending (the caller commits).
+
+    `then` is the task kind to queue for a PNR once its task succeeds.
+    """
+    if kind not in STATUS_COLUMNS or (then is not None and then not in STATUS_COLUMNS):
+        raise ValueError(f"Unknown task kind: {kind if kind not in STATUS_COLUMNS else then}")
+    pnrs = list(dict.fromkeys(pnrs))
+    known = existing_ids_by_pnr(db, Passenger, pnrs)
+    active: Set[str] = set()
+    for chunk in chunked([pnr for pnr in pnrs if pnr in known]):
+        active.update(db.execute(active_query(kind, chunk)).scalars())
+    new = [pnr for pnr in pnrs if pnr in known and pnr not in active]
+    now = datetime.utcnow()
+    rows = [
+        {"kind": kind, "pnr": pnr, "state": QUEUED, "attempts": 0, "max_attempts": config.QUEUE_MAX_ATTEMPTS,
+         "next_kind": then, "available_at": now}
+        for pnr in new
+    ]
+    for chunk in chunked(rows):
+        db.execute(insert(QueueTask), list(chunk))
+    _set_status(db, kind, new, QUEUED)
+    return {"queued": len(new), "already_queued": len(active), "unknown": len(pnrs) - len(known)}
+
+
+def claim(db: Session, limit: int, lease_seconds: int = config.QUEUE_LEASE_SECONDS) -> List[Row]:
+    """Lease up to `limit` due tasks to the caller (the caller commits).
+
+    Running tasks whose lease expired are released first: back to Queued, or Dead if
+    that was their last attempt.
+    """
+    now = datetime.utcnow()
+    expired = and_(QueueTask.state == RUNNING, QueueTask.lease_expires_at < now)
+    dead = db.execute(
+        update(QueueTask).where(expired, QueueTask.attempts >= QueueTask.max_attempts)
+        .values(state=DEAD, lease_expires_at=None, last_error="Lease expired")
+        .returning(QueueTask.kind, QueueTask.pnr)
+    ).all()
+    for row in dead:
+        _set_status(db, row.kind, [row.pnr], "Error")
+    db.execute(update(QueueTask).where(expired).values(state=QUEUED, lease_expires_at=None))
+
+    due = due_query(now, limit)
+    # A single UPDATE both selects and leases, so concurrent claimers never share a task
+    return db.execute(
+        update(QueueTask).where(QueueTask.id.in_(due), QueueTask.state == QUEUED)
+        .values(state=RUNNING, attempts=QueueTask.attempts + 1, lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .returning(QueueTask.id, QueueTask.kind, QueueTask.pnr, QueueTask.attempts, QueueTask.max_attempts, QueueTask.next_kind)
+    ).all()
+
+
+def complete(db: Session, task: Row):
+    db.execute(update(QueueTask).where(QueueTask.id == task.id).values(
+        state=SUCCEEDED, lease_expires_at=None, last_error=None,
+    ))
+    if task.next_kind:
+        enqueue(db, task.next_kind, [task.pnr])
+
+
+def fail(db: Session, task: Row, error: TaskError):
+    """Schedule a retry after a backoff, or dead-letter the task."""
+    if error.retryable and task.attempts < task.max_attempts:
+        values = {"state": QUEUED, "available_at": datetime.utcnow() + timedelta(seconds=backoff(task.attempts))}
+        status = "Retrying"
+    else:
+        values = {"state": DEAD}
+        status = error.status
+    db.execute(update(QueueTask).where(QueueTask.id == task.id).values(
+        lease_expires_at=None, last_error=str(error), **values,
+    ))
+    _set_status(db, task.kind, [task.pnr], status)
+
+
+def release(db: Session, task_ids: List[int]):
+    """Return leased tasks to the queue without counting the interrupted attempt."""
+    for chunk in chunked(task_ids):
+        db.execute(update(QueueTask).where(QueueTask.id.in_(chunk), QueueTask.state == RUNNING).values(
+            state=QUEUED, attempts=QueueTask.attempts - 1, lease_expires_at=None,
+        ))
+
+
+def requeue_dead(db: Session, kind: Optional[str] = None) -> int:
+    """Give dead-lettered tasks a fresh set of attempts (the caller commits)."""
+    stmt = select(QueueTask.kind, QueueTask.pnr).where(QueueTask.state == DEAD)
+    if kind:
+        stmt = stmt.where(QueueTask.kind == kind)
+    rows = db.execute(stmt).all()
+    values = {"state": QUEUED, "attempts": 0, "available_at": datetime.utcnow(), "lease_expires_at": None}
+    stmt = update(QueueTask).where(QueueTask.state == DEAD)
+    if kind:
+        stmt = stmt.where(QueueTask.kind == kind)
+    db.execute(stmt.values(**values))
+    for task_kind in {row.kind for row in rows}:
+        _set_status(db, task_kind, [row.pnr for row in rows if row.kind == task_kind], QUEUED)
+    return len(rows)
+
+
+def stats(db: Session) -> Dict[str, Dict[str, int]]:
+    counts: Dict[str, Dict[str, int]] = {}
+    for kind, state, count in db.execute(
+        select(QueueTask.kind, QueueTask.state, func.count()).group_by(QueueTask.kind, QueueTask.state)
+    ):
+        counts.setdefault(kind, {})[state] = count
+    return counts
+
+
+def dead_letters(db: Session, limit: int = 100) -> List[Dict]:
+    rows = db.scalars(
+        select(QueueTask).where(QueueTask.state == DEAD).order_by(QueueTask.updated_at.desc()).limit(limit)
+    )
+    return [
+        {"id": t.id, "kind": t.kind, "pnr": t.pnr, "attempts": t.attempts, "last_error": t.last_error,
+         "updated_at": t.updated_at.isoformat() if t.updated_at else None}
+        for t in rows
+    ]
+
+
+class Broker(abc.ABC):
+    """Hands out leased tasks to a TaskWorker and records their outcome.
+
+    A task is any object with id, kind, pnr, attempts, max_attempts and next_kind.
+    """
+
+    @abc.abstractmethod
+    async def claim(self, limit: int) -> List:
+        """Lease up to `limit` due tasks."""
+
+    @abc.abstractmethod
+    async def complete(self, task):
+        """Record a successful attempt and queue the follow-up task, if any."""
+
+    @abc.abstractmethod
+    async def fail(self, task, error: TaskError):
+        """Record a failed attempt: retry after a backoff, or move it to the dead letters."""
+
+    @abc.abstractmethod
+    async def release(self, task_ids: List[int]):
+        """Hand leased tasks back to the queue without spending an attempt."""
+
+
+class SqlBroker(Broker):
+    """The task_queue table of the application database, one short transaction per call."""
+
+    async def _call(self, fn, *args):
+        async with AsyncSessionLocal() as db:
+            result = await db.run_sync(fn, *args)
+            await db.commit()
+            return result
+
+    async def claim(self, limit: int) -> List[Row]:
+        return await self._call(claim, limit)
+
+    async def complete(self, task: Row):
+        await self._call(complete, task)
+
+    async def fail(self, task: Row, error: TaskError):
+        await self._call(fail, task, error)
+
+    async def release(self, task_ids: List[int]):
+        await self._call(release, task_ids)
+
+
+BROKERS: Dict[str, Callable[[], Broker]] = {"sql": SqlBroker}
+
+
+def make_broker(name: Optional[str] = None) -> Broker:
+    """The broker named `name` (default QUEUE_BROKER)."""
+    name = (name or config.QUEUE_BROKER).lower()
+    if name not in BROKERS:
+        raise ValueError(f"Unknown queue broker: {name}; expected one of {', '.join(BROKERS)}")
+    return BROKERS[name]()
+
+
+Handler = Callable[[str, AsyncSession], Awaitable[None]]
+
+
+class TaskWorker:
+    """Claims due tasks and runs their handlers on the event loop, `concurrency` at a time.
+
+    `handlers` maps a task kind to an async callable taking (pnr, session); it fails the
+    attempt by raising TaskError, and any other exception counts as retryable.
+    """
+
+    def __init__(self, handlers: Dict[str, Handler], concurrency: int = config.QUEUE_WORKERS,
+                 poll_interval: float = config.QUEUE_POLL_INTERVAL_MS / 1000, broker: Optional[Broker] = None):
+        self.handlers = handlers
+        self.broker = broker or make_broker()
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._running: Dict[asyncio.Task, int] = {}
+        self._wakeup = asyncio.Event()
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.concurrency > 0 and self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run())
+
+    def wake(self):
+        """Claim immediately instead of waiting for the next poll (call after enqueueing)."""
+        self._wakeup.set()
+
+    async def stop(self):
+        """Cancel in-flight tasks and hand their leases back to the queue."""
+        if self._loop_task is None:
+            return
+        self._loop_task.cancel()
+        running = dict(self._running)
+        for task in running:
+            task.cancel()
+        await asyncio.gather(self._loop_task, *running, return_exceptions=True)
+        self._loop_task = None
+        if running:
+            await self.broker.release(list(running.values()))
+
+    async def run(self):
+        """Consume tasks until cancelled, then hand back the leases of unfinished ones."""
+        self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+
+    async def _run(self):
+        while True:
+            free = self.concurrency - len(self._running)
+            claimed: List[Row] = []
+            if free > 0:
+                try:
+                    claimed = await self.broker.claim(free)
+                except Exception:
+                    logger.exception("Task queue claim failed")
+            for task in claimed:
+                runner = asyncio.create_task(self._execute(task))
+                self._running[runner] = task.id
+                runner.add_done_callback(self._finished)
+            if claimed and len(claimed) == free:
+                # Saturated; wait for a slot instead of polling
+                await asyncio.wait(list(self._running), return_when=asyncio.FIRST_COMPLETED)
+            elif not claimed:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _finished(self, runner: asyncio.Task):
+        self._running.pop(runner, None)
+        # A freed slot may let more due tasks be claimed
+        self._wakeup.set()
+
+    async def _execute(self, task: Row):
+        async with AsyncSessionLocal() as db:
+            try:
+                handler = self.handlers.get(task.kind)
+                if handler is None:
+                    raise TaskError(f"No handler for task kind {task.kind}", retryable=False)
+                await handler(task.pnr, db)
+                await db.commit()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await db.rollback()
+                error = e if isinstance(e, TaskError) else TaskError(str(e) or type(e).__name__)
+                await self.broker.fail(task, error)
+                return
+        await self.broker.complete(task)
@@ -0,0 +1,57 @@
+"""Standalone queue worker: runs download and parse tasks outside the API process.
+
+Run from backend/:  python worker.py [--concurrency N] [--broker sql]
+
+Workers claim tasks through a task_queue Broker and write results to the same database
+and INVOICES_DIR as the API, so any number can run beside it, on other machines too
+given a shared database server and PDF storage. Set QUEUE_WORKERS=0 on the API to
+leave all queued work to them. Dashboard events only reach subscribers of the process
+that emits them, so dashboards pick up worker progress when they refetch.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+import config
+from db import migrations
+from db.models import async_engine, engine
+from services import executor, pipeline, task_queue
+
+logger = logging.getLogger("worker")
+
+
+async def run(concurrency: int, broker: str):
+    worker = task_queue.TaskWorker(pipeline.queue_handlers, concurrency=concurrency, broker=task_queue.make_broker(broker))
+    runner = asyncio.create_task(worker.run())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        # Unfinished tasks are handed back to the queue on the way out
+        loop.add_signal_handler(sig, runner.cancel)
+    logger.info("Worker consuming the %s broker with %d concurrent tasks", broker, concurrency)
+    try:
+        await runner
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await pipeline.downloader.renderer.close()
+        executor.shutdown()
+        await async_engine.dispose()
+    logger.info("Worker stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=config.QUEUE_WORKERS or 8,
+                        help="tasks run at once (default QUEUE_WORKERS, or 8 when that is 0)")
+    parser.add_argument("--broker", default=config.QUEUE_BROKER, choices=sorted(task_queue.BROKERS))
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    migrations.upgrade(engine)
+    asyncio.run(run(args.concurrency, args.broker))
+
+
+if __name__ == "__main__":
+    main()
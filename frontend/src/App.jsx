@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Plane, RefreshCw, AlertCircle } from 'lucide-react';
-import { passengerAPI, invoiceAPI, summaryAPI } from './services/api';
+import { passengerAPI, invoiceAPI, summaryAPI, nextCursor, subscribeEvents } from './services/api';
 import DataInput from './components/DataInput';
 import PassengerTable from './components/PassengerTable';
 import InvoiceTable from './components/InvoiceTable';
@@ -10,9 +10,21 @@ import InvoiceImporter from './components/InvoiceImporter';
 function App() {
   const [passengers, setPassengers] = useState([]);
   const [invoices, setInvoices] = useState([]);
+  const [passengersCursor, setPassengersCursor] = useState(null);
+  const [invoicesCursor, setInvoicesCursor] = useState(null);
   const [summary, setSummary] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
+  // True while the /events stream is connected; list refetches are then driven by pushed deltas
+  const [live, setLive] = useState(false);
+  const liveRef = useRef(false);
+  const connectedOnce = useRef(false);
+  const passengersRef = useRef({ rows: [], cursor: null });
+  const invoicesRef = useRef({ rows: [], cursor: null });
+  const summaryTimer = useRef(null);
+
+  passengersRef.current = { rows: passengers, cursor: passengersCursor };
+  invoicesRef.current = { rows: invoices, cursor: invoicesCursor };
 
   const fetchData = async () => {
     try {
@@ -20,13 +32,15 @@ function App() {
       setError('');
       
       const [passengersRes, invoicesRes, summaryRes] = await Promise.all([
-        passengerAPI.getAll(),
-        invoiceAPI.getAll(),
+        passengerAPI.getPage(),
+        invoiceAPI.getPage(),
         summaryAPI.getSummary()
       ]);
 
       setPassengers(passengersRes.data);
+      setPassengersCursor(nextCursor(passengersRes));
       setInvoices(invoicesRes.data);
+      setInvoicesCursor(nextCursor(invoicesRes));
       setSummary(summaryRes.data);
     } catch (err) {
       setError('Failed to fetch data. Please check if the backend server is running.');
@@ -36,8 +50,109 @@ function App() {
     }
   };
 
+  const loadMorePassengers = async () => {
+    try {
+      const res = await passengerAPI.getPage({ cursor: passengersCursor });
+      setPassengers((prev) => [...prev, ...res.data]);
+      setPassengersCursor(nextCursor(res));
+    } catch (err) {
+      console.error('Error loading passengers:', err);
+    }
+  };
+
+  const loadMoreInvoices = async () => {
+    try {
+      const res = await invoiceAPI.getPage({ cursor: invoicesCursor });
+      setInvoices((prev) => [...prev, ...res.data]);
+      setInvoicesCursor(nextCursor(res));
+    } catch (err) {
+      console.error('Error loading invoices:', err);
+    }
+  };
+
+  const fetchPassengers = async () => {
+    const res = await passengerAPI.getPage();
+    setPassengers(res.data);
+    setPassengersCursor(nextCursor(res));
+  };
+
+  const fetchInvoices = async () => {
+    const res = await invoiceAPI.getPage();
+    setInvoices(res.data);
+    setInvoicesCursor(nextCursor(res));
+  };
+
+  const fetchSummary = () => {
+    // Coalesce bursts of summary events into one small request
+    clearTimeout(summaryTimer.current);
+    summaryTimer.current = setTimeout(async () => {
+      const res = await summaryAPI.getSummary();
+      setSummary(res.data);
+    }, 300);
+  };
+
+  // Pages are in id order, so rows created after the last loaded one only need fetching
+  // when the whole list is loaded; otherwise "Load more" picks them up
+  const appendNewPassengers = async () => {
+    const { rows, cursor } = passengersRef.current;
+    if (cursor) return;
+    const res = await passengerAPI.getPage(rows.length ? { cursor: rows[rows.length - 1].id } : {});
+    setPassengers((prev) => {
+      const seen = new Set(prev.map((p) => p.id));
+      return [...prev, ...res.data.filter((p) => !seen.has(p.id))];
+    });
+    setPassengersCursor(nextCursor(res));
+  };
+
+  const applyStatuses = ({ pnrs, ...statuses }) => {
+    const changed = new Set(pnrs);
+    setPassengers((prev) => prev.map((p) => (changed.has(p.pnr) ? { ...p, ...statuses } : p)));
+  };
+
+  const applyInvoice = (invoice) => {
+    setInvoices((prev) => {
+      const index = prev.findIndex((inv) => inv.id === invoice.id);
+      if (index >= 0) return prev.map((inv, i) => (i === index ? invoice : inv));
+      return invoicesRef.current.cursor ? prev : [...prev, invoice];
+    });
+  };
+
+  const resync = ({ lists }) => {
+    if (lists.includes('passengers')) fetchPassengers();
+    if (lists.includes('invoices')) fetchInvoices();
+    if (lists.includes('summary')) fetchSummary();
+  };
+
+  // Fallback for actions taken while the event stream is down
+  const refreshIfOffline = () => {
+    if (!liveRef.current) fetchData();
+  };
+
   useEffect(() => {
     fetchData();
+    const close = subscribeEvents({
+      passengers: applyStatuses,
+      passengers_created: appendNewPassengers,
+      invoice: applyInvoice,
+      summary: fetchSummary,
+      resync,
+    }, {
+      onOpen: () => {
+        // Events may have been missed while disconnected
+        if (connectedOnce.current) resync({ lists: ['passengers', 'invoices', 'summary'] });
+        connectedOnce.current = true;
+        liveRef.current = true;
+        setLive(true);
+      },
+      onError: () => {
+        liveRef.current = false;
+        setLive(false);
+      },
+    });
+    return () => {
+      close();
+      clearTimeout(summaryTimer.current);
+    };
   }, []);
 
   if (loading) {
@@ -62,6 +177,10 @@ function App() {
                 <Plane className="w-5 h-5" />
               </div>
               <h1 className="text-xl font-semibold">Airline Invoice Workflow</h1>
+              <span
+                className={`ml-3 inline-block w-2 h-2 rounded-full ${live ? 'bg-green-300' : 'bg-gray-300'}`}
+                title={live ? 'Live updates connected' : 'Live updates disconnected'}
+              />
             </div>
             <button
               onClick={fetchData}
@@ -93,24 +212,24 @@ function App() {
 
         {/* Import Invoice JSON */}
         <div className="mb-8 card card-hover p-6">
-          <InvoiceImporter onUpdate={fetchData} />
+          <InvoiceImporter onUpdate={refreshIfOffline} />
         </div>
 
         {/* Data Input Section */}
         <div className="mb-8 card card-hover p-6">
-          <DataInput onUpdate={fetchData} />
+          <DataInput onUpdate={refreshIfOffline} />
         </div>
 
         {/* Passenger Records Section */}
         <div className="mb-8 card card-hover p-6">
           <h2 className="text-lg font-semibold text-gray-900 mb-4">Passenger Records</h2>
-          <PassengerTable passengers={passengers} onUpdate={fetchData} />
+          <PassengerTable passengers={passengers} onUpdate={refreshIfOffline} onLoadMore={passengersCursor ? loadMorePassengers : null} />
         </div>
 
         {/* Parsed Invoices Section */}
         <div className="mb-8 card card-hover p-6">
           <h2 className="text-lg font-semibold text-gray-900 mb-4">Parsed Invoices</h2>
-          <InvoiceTable invoices={invoices} onUpdate={fetchData} />
+          <InvoiceTable invoices={invoices} onUpdate={refreshIfOffline} onLoadMore={invoicesCursor ? loadMoreInvoices : null} />
         </div>
       </main>
     </div>
@@ -53,6 +53,25 @@ const DataInput = ({ onUpdate }) => {
     }
   };
 
+  const handleCsvUpload = async (e) => {
+    const file = e.target.files?.[0];
+    e.target.value = '';
+    if (!file) return;
+    setIsLoading(true);
+    setError('');
+    setSuccess('');
+    try {
+      const { data } = await passengerAPI.importCsv(file);
+      const skipped = data.rejected ? `, ${data.rejected} rejected (first: line ${data.rejects[0]?.line} - ${data.rejects[0]?.reason})` : '';
+      setSuccess(`${data.message}; ${data.duplicates} duplicates${skipped}`);
+      onUpdate();
+    } catch (err) {
+      setError(err?.response?.data?.detail || err.message || 'Failed to import CSV');
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
   const loadSampleData = () => {
     setJsonData(JSON.stringify(sampleData, null, 2));
     setError('');
@@ -92,6 +111,16 @@ const DataInput = ({ onUpdate }) => {
             Load Sample Data
           </button>
 
+          <label
+            className={`inline-flex items-center px-3 py-2 border border-gray-300 shadow-sm text-sm leading-4 font-medium rounded-md text-gray-700 bg-white ${
+              isLoading ? 'cursor-not-allowed opacity-50' : 'cursor-pointer hover:bg-gray-50'
+            }`}
+          >
+            <Upload className="w-4 h-4 mr-2" />
+            Import CSV
+            <input type="file" accept=".csv,text/csv" className="hidden" onChange={handleCsvUpload} disabled={isLoading} />
+          </label>
+
           <button
             type="submit"
             disabled={isLoading || !jsonData.trim()}
@@ -136,7 +165,8 @@ const DataInput = ({ onUpdate }) => {
 
       <div className="mt-4 p-3 bg-gray-50 border border-gray-200 rounded-md">
         <p className="text-xs text-gray-600">
-          <strong>Format:</strong> Array of objects with "name" and "pnr" fields. Example: <code>{exampleJson}</code>
+          <strong>Format:</strong> Array of objects with "name" and "pnr" fields. Example: <code>{exampleJson}</code>.
+          CSV files need "Ticket Number,First Name,Last Name" columns.
         </p>
       </div>
     </div>
@@ -1,6 +1,6 @@
 import React, { useState } from 'react';
 import { FileJson, Import, CheckCircle2, AlertCircle, Play } from 'lucide-react';
-import { passengerAPI, invoiceAPI } from '../services/api';
+import { passengerAPI, invoiceAPI, jobAPI } from '../services/api';
 
 const InvoiceImporter = ({ onUpdate }) => {
   const [jsonData, setJsonData] = useState('');
@@ -9,6 +9,7 @@ const InvoiceImporter = ({ onUpdate }) => {
   const [success, setSuccess] = useState('');
   const [autoDownload, setAutoDownload] = useState(true);
   const [autoParse, setAutoParse] = useState(true);
+  const [progress, setProgress] = useState(null);
 
   const extractPnrs = (arr) => arr.map((inv) => String(inv['Invoice Number'] ?? inv.invoice_number ?? inv.invoiceNumber ?? inv.number));
 
@@ -57,13 +58,16 @@ const InvoiceImporter = ({ onUpdate }) => {
 
       let processed = 0;
       if (autoDownload) {
-        for (const pnr of pnrs) {
-          try {
-            const d = await invoiceAPI.download(pnr);
-            if (autoParse && d?.data?.status === 'Success') await invoiceAPI.parse(pnr);
-            processed++;
-          } catch (_) {}
+        // Download/parse runs server-side as a batch job; poll until it completes
+        const { data: created } = await jobAPI.createBatch(pnrs, { download: true, parse: autoParse });
+        let job = created;
+        setProgress(job);
+        while (job.status !== 'Completed') {
+          await new Promise((resolve) => setTimeout(resolve, 1000));
+          job = (await jobAPI.get(created.job_id)).data;
+          setProgress(job);
         }
+        processed = job.completed;
       }
 
       setSuccess(`Imported ${createdCount} new passengers. Processed ${processed} PNRs.`);
@@ -73,6 +77,7 @@ const InvoiceImporter = ({ onUpdate }) => {
       setError(err?.message || 'Failed to import invoice data');
     } finally {
       setIsLoading(false);
+      setProgress(null);
     }
   };
 
@@ -133,7 +138,7 @@ const InvoiceImporter = ({ onUpdate }) => {
             {isLoading ? (
               <>
                 <div className="w-4 h-4 mr-2 border-2 border-white border-t-transparent rounded-full animate-spin" />
-                Importing...
+                {progress ? `Processing ${progress.completed}/${progress.total}...` : 'Importing...'}
               </>
             ) : (
               <>
@@ -3,7 +3,7 @@ import StatusBadge from './StatusBadge';
 import { ExternalLink, Flag, CheckCircle } from 'lucide-react';
 import { invoiceAPI } from '../services/api';
 
-const InvoiceTable = ({ invoices, onUpdate }) => {
+const InvoiceTable = ({ invoices, onUpdate, onLoadMore }) => {
   const [loadingStates, setLoadingStates] = useState({});
 
   const handleFlagToggle = async (invoiceId, currentFlag) => {
@@ -132,6 +132,13 @@ const InvoiceTable = ({ invoices, onUpdate }) => {
           ))}
         </tbody>
       </table>
+      {onLoadMore && (
+        <div className="flex justify-center mt-4">
+          <button onClick={onLoadMore} className="btn-secondary">
+            Load more
+          </button>
+        </div>
+      )}
     </div>
   );
 };
@@ -3,7 +3,7 @@ import StatusBadge from './StatusBadge';
 import { Download, FileText, RefreshCw } from 'lucide-react';
 import { passengerAPI, invoiceAPI } from '../services/api';
 
-const PassengerTable = ({ passengers, onUpdate }) => {
+const PassengerTable = ({ passengers, onUpdate, onLoadMore }) => {
   const [loadingStates, setLoadingStates] = useState({});
 
   const handleDownload = async (pnr) => {
@@ -122,6 +122,13 @@ const PassengerTable = ({ passengers, onUpdate }) => {
           ))}
         </tbody>
       </table>
+      {onLoadMore && (
+        <div className="flex justify-center mt-4">
+          <button onClick={onLoadMore} className="btn-secondary">
+            Load more
+          </button>
+        </div>
+      )}
     </div>
   );
 };
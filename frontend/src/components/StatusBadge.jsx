@@ -15,6 +15,18 @@ const StatusBadge = ({ status, className = '' }) => {
           textColor: 'text-yellow-800',
           icon: '⏳'
         };
+      case 'Queued':
+        return {
+          bgColor: 'bg-blue-100',
+          textColor: 'text-blue-800',
+          icon: '📥'
+        };
+      case 'Retrying':
+        return {
+          bgColor: 'bg-orange-100',
+          textColor: 'text-orange-800',
+          icon: '🔁'
+        };
       case 'Error':
         return {
           bgColor: 'bg-red-100',
@@ -10,12 +10,19 @@ const api = axios.create({
 });
 
 export const passengerAPI = {
-  getAll: () => api.get('/passengers'),
+  // Keyset-paginated: pass the X-Next-Cursor header of the previous page as `cursor`
+  getPage: (params = {}) => api.get('/passengers', { params }),
   createBulk: (passengers) => api.post('/passengers/bulk', passengers),
+  // CSV with "Ticket Number,First Name,Last Name" columns, streamed and imported server-side
+  importCsv: (file) => {
+    const form = new FormData();
+    form.append('file', file);
+    return api.post('/passengers/import-csv', form, { headers: { 'Content-Type': 'multipart/form-data' } });
+  },
 };
 
 export const invoiceAPI = {
-  getAll: () => api.get('/invoices'),
+  getPage: (params = {}) => api.get('/invoices', { params }),
   download: (pnr) => api.post(`/download/${pnr}`),
   parse: (pnr) => api.post(`/parse/${pnr}`),
   getHighValue: (amount = 10000) => api.get(`/invoices/high-value?amount=${amount}`),
@@ -33,8 +40,28 @@ export const invoiceAPI = {
   },
 };
 
+export const jobAPI = {
+  createBatch: (pnrs, { download = true, parse = true, concurrency } = {}) =>
+    api.post('/jobs/batch', { pnrs, download, parse, concurrency }),
+  get: (jobId, includeResults = false) => api.get(`/jobs/${jobId}?include_results=${includeResults}`),
+};
+
 export const summaryAPI = {
   getSummary: () => api.get('/summary'),
 };
 
+// Server-sent status deltas; `handlers` maps an event type to a callback taking its data.
+// Returns a function that closes the stream.
+export const subscribeEvents = (handlers, { onOpen, onError } = {}) => {
+  const source = new EventSource(`${API_BASE_URL}/events`);
+  Object.entries(handlers).forEach(([type, handler]) => {
+    source.addEventListener(type, (e) => handler(JSON.parse(e.data)));
+  });
+  if (onOpen) source.onopen = onOpen;
+  if (onError) source.onerror = onError;
+  return () => source.close();
+};
+
+export const nextCursor = (response) => response?.headers?.['x-next-cursor'] ?? null;
+
 export default api; 
\ No newline at end of file